@@ -0,0 +1,3 @@
+"""
+Benchmarks for Distant Skies. Run one with python -m benchmarks.<name> from the project folder.
+"""
@@ -0,0 +1,65 @@
+"""
+File: Distant Skies (combat benchmark)
+Description: Times one round of many simultaneous engagements.
+
+Usage: python -m benchmarks.bench_combat [engagements] [ships per fleet]
+"""
+
+import combat
+import distant_skies as ds
+from ships import ShipList, ShipStore
+import random as rand
+import sys
+import time
+
+
+def build_engagements(count, fleet_size=10):
+    """
+    Makes count engagements of one fleet against another, each fleet of mixed builds.
+    :return: list of lists of Fleet objects
+    """
+
+    store = ShipStore()
+    builds = [ds.fighter, ds.dreadnaught, ds.capital_ship, ds.colony_ship]
+    players = [ds.Player('Attacker'), ds.Player('Defender')]
+    battles = []
+    for number in range(count):
+        fleets = []
+        for player in players:
+            fleet = ds.Fleet(player.name + ' ' + str(number), player, None, ShipList(store=store))
+            for index in range(fleet_size):
+                build = builds[(number + index) % len(builds)]
+                fleet.members.append(ds.Ship(build.name + str(index), build, fleet.name, store=store))
+            fleets.append(fleet)
+        battles.append(fleets)
+    return battles
+
+
+def run(count=10000, fleet_size=10, seed=0):
+    """
+    :return: dict of the time for one round in seconds and the ships it destroyed
+    """
+
+    battles = build_engagements(count, fleet_size)
+    start = time.perf_counter()
+    results = combat.resolve(battles, rand.Random(seed))
+    elapsed = time.perf_counter() - start
+
+    # The same seed must give the same battle
+    again = combat.resolve(build_engagements(count, fleet_size), rand.Random(seed))
+    if [[len(destroyed) for _, destroyed in engagement] for engagement in results] != \
+            [[len(destroyed) for _, destroyed in engagement] for engagement in again]:
+        raise AssertionError('The same seed gave different battles.')
+
+    return {
+        'engagements': count,
+        'ships': count * fleet_size * 2,
+        'round': elapsed,
+        'destroyed': sum(len(destroyed) for engagement in results for _, destroyed in engagement),
+    }
+
+
+if __name__ == '__main__':
+    results = run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000, int(sys.argv[2]) if len(sys.argv) > 2 else 10)
+    print(str(results['engagements']) + ' engagements, ' + str(results['ships']) + ' ships: one round in ' +
+          str(round(results['round'] * 1000, 1)) + ' ms, ' + str(results['destroyed']) + ' ships destroyed')
@@ -0,0 +1,118 @@
+"""
+File: Distant Skies (movement benchmark)
+Description: Times sending every fleet of a large game off at once and then ending turns until they have all landed.
+
+patrol() plays a long game of fleets going back and forth between home and another body, to check that refuelling
+keeps them moving.
+
+Usage: python -m benchmarks.bench_movement [fleets]
+"""
+
+import distant_skies as ds
+from benchmarks.bench_save import build_game
+import movement
+import random as rand
+import sys
+import time
+
+
+def run(fleet_count=100000, seed=0):
+    """
+    :return: dict of timings in seconds
+    """
+
+    game = build_game(fleet_count * 10)
+    rng = rand.Random(seed)
+    bodies = game.system.registry.bodies
+    fleets = [fleet for player in game.players for fleet in player.owned_fleets.values()]
+
+    start = time.perf_counter()
+    left = 0
+    for fleet in fleets:
+        if ds.start_move(game, fleet, rng.choice(bodies)) is None:
+            left += 1
+    depart_time = time.perf_counter() - start
+
+    turn_times = []
+    battles = []
+    while len(game.movement):
+        start = time.perf_counter()
+        battles = ds.end_turn(game)[-1][1]
+        turn_times.append(time.perf_counter() - start)
+
+    # Whoever landed together last fights it out before things go quiet
+    battle_times = []
+    while battles:
+        start = time.perf_counter()
+        battles = ds.end_turn(game)[-1][1]
+        battle_times.append(time.perf_counter() - start)
+
+    # A turn with nothing arriving and nothing to fight is the common case in a long trip
+    start = time.perf_counter()
+    ds.end_turn(game)
+    idle_time = time.perf_counter() - start
+
+    return {
+        'fleets': fleet_count,
+        'departed': left,
+        'depart': depart_time,
+        'turns': len(turn_times),
+        'worst_turn': max(turn_times, default=0),
+        'mean_turn': sum(turn_times) / len(turn_times) if turn_times else 0,
+        'battle_turns': len(battle_times),
+        'battles': sum(battle_times),
+        'idle_turn': idle_time,
+    }
+
+
+def patrol(turns=50, seed=0):
+    """
+    Plays turns turns in which one fleet of each build of every player goes from the body of the player's colony to
+    the fourth nearest body and back, leaving as soon as it lands there and as soon as it is full again at home. Filling
+    up must never take longer than it does from empty.
+    :return: int, number of trips made
+    :raises RuntimeError: if a fleet cannot make its way home, or waits at home too long
+    """
+
+    game = build_game(0, 4, seed)
+    registry = game.system.registry
+    trips = 0
+    waiting = dict()
+    patience = movement.CAPACITY // movement.REFILL_PER_TURN + 1
+    for player in game.players:
+        home = next(iter(player.owned_colonies.values()))
+        for build in ds.builds.values():
+            ds.add_ship(player, build, build.name + ' ' + player.name, home)
+
+    for _ in range(turns):
+        for player in game.players:
+            home = next(iter(player.owned_colonies.values())).body
+            away = registry.system.travel().nearest(home, 4)[-1][1]
+            for fleet in list(player.owned_fleets.values()):
+                if isinstance(fleet.location, ds.Orbit):
+                    continue
+                at_home = movement.body_at(registry, fleet.location) is home
+                if at_home and id(fleet) in player.refuelling:
+                    waiting[fleet.name] = waiting.get(fleet.name, 0) + 1
+                    if waiting[fleet.name] > patience:
+                        raise RuntimeError(fleet.name + ' has not been refuelled by turn ' + str(game.turn) + '.')
+                    continue
+                problem = ds.start_move(game, fleet, away if at_home else home)
+                if problem is not None:
+                    raise RuntimeError('Stranded on turn ' + str(game.turn) + ': ' + problem)
+                trips += 1
+                waiting.pop(fleet.name, None)
+        ds.end_turn(game)
+    return trips
+
+
+if __name__ == '__main__':
+    results = run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
+    print(str(results['departed']) + ' of ' + str(results['fleets']) + ' fleets sent off in ' +
+          str(round(results['depart'], 2)) + ' s')
+    print('landed over ' + str(results['turns']) + ' turns: worst turn ' +
+          str(round(results['worst_turn'] * 1000, 2)) + ' ms, mean ' + str(round(results['mean_turn'] * 1000, 2)) +
+          ' ms')
+    print('battles after landing went on for ' + str(results['battle_turns']) + ' turns (' +
+          str(round(results['battles'], 2)) + ' s), then an idle turn took ' +
+          str(round(results['idle_turn'] * 1000, 4)) + ' ms')
@@ -0,0 +1,122 @@
+"""
+File: Distant Skies (save benchmark)
+Description: Times the binary save format against a plain json dump of the same ships and bodies.
+
+Usage: python -m benchmarks.bench_save [ships]
+"""
+
+import distant_skies as ds
+import generation as gen
+import savefile
+from dataclasses import asdict
+from ships import ShipList, ShipStore
+import io
+import json
+import sys
+import time
+
+
+def build_game(ship_count, player_count=4, seed=0):
+    """
+    Builds a game with one colony per player and ship_count ships spread over fleets of 10.
+    :param ship_count: int, number of ships in the game
+    :param player_count: int, number of players
+    :param seed: seed for the system generator
+    :return: Game object
+    """
+
+    system = gen.generate_systems(1, seed, compact=True).system(0, 'Bench')
+    bodies = [body for planet in system.planets for body in [planet] + planet.moons]
+    builds = [ds.Build('fighter', {'life support': 50}), ds.Build('dreadnaught', {'hyperdrive': 200, 'targeting': 100})]
+    players = [ds.Player('Player ' + str(number)) for number in range(1, player_count + 1)]
+
+    for number, player in enumerate(players):
+        body = bodies[number % len(bodies)]
+        colony = ds.Colony(player, 'colony ' + str(number), body=body)
+        body.colonies.update({colony.name: colony})
+        player.owned_colonies.update({colony.name: colony})
+
+    store = ShipStore()
+    fleet = None
+    for number in range(ship_count):
+        player = players[number % player_count]
+        if number % 10 == 0:
+            fleet = ds.Fleet('fleet ' + str(number), player, bodies[number % len(bodies)], ShipList(store=store))
+            player.owned_fleets.update({fleet.name.lower(): fleet})
+        build = builds[number % len(builds)]
+        fleet.members.append(ds.Ship(build.name + str(number), build, fleet.name, store=store))
+    for player in players:
+        player.reindex()
+
+    return ds.Game(system, players)
+
+
+def naive_dump(game):
+    # asdict() cannot follow Colony.owner back to its Player, so the naive dump only covers bodies without their
+    # colonies, and the ships
+    planets = [{'name': planet.name, 'area': planet.area, 'moons': [[moon.name, moon.area] for moon in planet.moons]}
+               for planet in game.system.planets]
+    ships = [{'name': ship.name, 'build': asdict(ship.build), 'parent_fleet': ship.parent_fleet, 'fuel': ship.fuel,
+              'drive_charge': ship.drive_charge, 'attack': ship.attack}
+             for player in game.players for fleet in player.owned_fleets.values() for ship in fleet.members]
+    return json.dumps({'planets': planets, 'ships': ships})
+
+
+def naive_load(text):
+    data = json.loads(text)
+    store = ShipStore()
+    return [ds.Ship(ship['name'], ds.Build(**ship['build']), ship['parent_fleet'], ship['fuel'],
+                    ship['drive_charge'], ship['attack'], store=store) for ship in data['ships']]
+
+
+def best_of(repeats, function, *args):
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def run(ship_count=100000, repeats=3):
+    """
+    :return: dict of timings in seconds and sizes in bytes
+    """
+
+    game = build_game(ship_count)
+
+    def binary_dump():
+        buffer = io.BytesIO()
+        savefile.dump(game, buffer)
+        return buffer.getvalue()
+
+    save_time, data = best_of(repeats, binary_dump)
+    load_time, loaded = best_of(repeats, lambda: savefile.load(io.BytesIO(data)))
+    json_save_time, text = best_of(repeats, naive_dump, game)
+    json_load_time, _ = best_of(repeats, naive_load, text)
+
+    ships = sum(len(fleet.members) for player in loaded.players for fleet in player.owned_fleets.values())
+    if ships != ship_count:
+        raise AssertionError('Loaded ' + str(ships) + ' ships out of ' + str(ship_count) + '.')
+
+    return {
+        'ships': ship_count,
+        'binary_save': save_time,
+        'binary_load': load_time,
+        'binary_bytes': len(data),
+        'json_save': json_save_time,
+        'json_load': json_load_time,
+        'json_bytes': len(text.encode('utf-8')),
+    }
+
+
+if __name__ == '__main__':
+    results = run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
+    print(str(results['ships']) + ' ships')
+    print('binary: save ' + str(round(results['binary_save'] * 1000, 1)) + ' ms, load ' +
+          str(round(results['binary_load'] * 1000, 1)) + ' ms, ' + str(results['binary_bytes']) + ' bytes')
+    print('json:   save ' + str(round(results['json_save'] * 1000, 1)) + ' ms, load ' +
+          str(round(results['json_load'] * 1000, 1)) + ' ms, ' + str(results['json_bytes']) + ' bytes')
@@ -0,0 +1,122 @@
+"""
+File: Distant Skies (ship memory benchmark)
+Description: Measures memory per ship in the ship store against one dataclass object per ship.
+
+Usage: python -m benchmarks.bench_ships [ships]
+"""
+
+import distant_skies as ds
+from ships import ShipList, ShipStore
+from dataclasses import dataclass, field
+import gc
+import sys
+import time
+import tracemalloc
+
+
+@dataclass(frozen=False)
+class DataclassShip:
+    """
+    A ship the way it was stored before the ship store: one object with a __dict__ per ship.
+    """
+    name: str
+    build: "ds.Build"
+    parent_fleet: str
+    fuel: float = 100
+    drive_charge: float = 100
+    attack: float = 100
+
+
+def fill(ship_count, fleet_size, make_fleet, make_ship):
+    """
+    Makes ship_count ships in fleets of fleet_size, with the fuel, drive charge and attack of ships part way through a
+    game.
+    :return: list of fleet member lists
+    """
+
+    builds = [ds.fighter, ds.dreadnaught, ds.capital_ship, ds.colony_ship]
+    fleets = []
+    members = None
+    fleet_name = ''
+    for number in range(ship_count):
+        if number % fleet_size == 0:
+            fleet_name = 'fleet ' + str(number)
+            members = make_fleet()
+            fleets.append(members)
+        build = builds[number % len(builds)]
+        members.append(make_ship(build.name + str(number), build, fleet_name, number % 97 + .5, number % 89 + .25,
+                                 number % 83 + .75))
+    return fleets
+
+
+def measure(ship_count, fleet_size, make_fleet, make_ship, total_fuel):
+    """
+    :return: (bytes per ship, seconds to build, seconds to total every ship's fuel)
+    """
+
+    gc.collect()
+    start = time.perf_counter()
+    fill(ship_count, fleet_size, make_fleet, make_ship)
+    build_time = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    fleets = fill(ship_count, fleet_size, make_fleet, make_ship)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    total_fuel(fleets)
+    scan_time = time.perf_counter() - start
+    del fleets
+    gc.collect()
+    return used / ship_count, build_time, scan_time
+
+
+def run(ship_count=1000000, fleet_size=10):
+    """
+    :return: dict of bytes per ship and timings in seconds
+    """
+
+    old = measure(ship_count, fleet_size, list, DataclassShip,
+                  lambda fleets: sum(ship.fuel for members in fleets for ship in members))
+    stores = []
+
+    def make_fleet():
+        if len(stores[-1]) >= ship_count:
+            stores.append(ShipStore())
+        return ShipList(store=stores[-1])
+
+    def make_ship(*columns):
+        return ds.Ship(*columns, store=stores[-1])
+
+    # Each fill gets a store of its own, so the timed fill does not count in the measured one
+    stores.append(ShipStore())
+    new = measure(ship_count, fleet_size, make_fleet, make_ship,
+                  lambda fleets: sum(sum(members.column('fuel')) for members in fleets))
+    return {
+        'ships': ship_count,
+        'fleet_size': fleet_size,
+        'dataclass_bytes': old[0],
+        'dataclass_build': old[1],
+        'dataclass_scan': old[2],
+        'store_bytes': new[0],
+        'store_build': new[1],
+        'store_scan': new[2],
+    }
+
+
+def report(results):
+    print(str(results['ships']) + ' ships in fleets of ' + str(results['fleet_size']))
+    print('dataclass:  ' + str(round(results['dataclass_bytes'], 1)) + ' bytes per ship, built in ' +
+          str(round(results['dataclass_build'], 2)) + ' s, fuel scanned in ' +
+          str(round(results['dataclass_scan'], 2)) + ' s')
+    print('ship store: ' + str(round(results['store_bytes'], 1)) + ' bytes per ship, built in ' +
+          str(round(results['store_build'], 2)) + ' s, fuel scanned in ' +
+          str(round(results['store_scan'], 2)) + ' s')
+    print(str(round(results['dataclass_bytes'] / results['store_bytes'], 1)) + 'x less memory per ship')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    report(run(count, 10))
+    report(run(count, 1000))
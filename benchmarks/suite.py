@@ -0,0 +1,399 @@
+"""
+File: Distant Skies (benchmark suite)
+Description: Times every workload at a range of sizes, writes the timings as JSON and checks them against a baseline.
+
+The workloads cover system generation (generate_system() with its prompts answered, and generate_systems()), body
+lookup through celestial_dict() and the registry, random_name() over name libraries of different sizes,
+establish_colony() and purchase_ship() through whole scripted games, save and load, ending turns, long games of
+fleet patrols, taking back commands through snapshots, and fog of war checks. Every prompt is answered by a stub (see
+stub()), nothing is printed and nothing is saved, so the suite never waits on stdin.
+
+Each timing is the best of REPEATS runs, in seconds, filed under the workload's name and sizes, such as
+"save[players=4,ships=100000]". With a baseline (a results file from an earlier run, usually saved with
+--save-baseline on the same machine), any timing more than threshold slower than the baseline fails the run. The
+largest sizes (a million ships, a million-name library, thousands of planets) only run with --full.
+
+Usage: python -m benchmarks.suite [--full] [--only text] [--output path] [--baseline path] [--save-baseline]
+[--threshold fraction]
+"""
+
+from benchmarks.bench_movement import patrol
+from benchmarks.bench_save import build_game
+import distant_skies as ds
+import economy
+import generation as gen
+from helpers import INSTANT, NullSink, PolicyInput, renderer, set_input, set_output
+import names
+import savefile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random as rand
+import sys
+import tempfile
+import time
+
+
+REPEATS = 3
+THRESHOLD = .25
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+@dataclass(frozen=False)
+class Workload:
+    """
+    function takes the keyword arguments of one entry of sizes (or full_sizes, which only run with --full) and
+    returns the seconds one run took.
+    """
+    name: str
+    function: "function"
+    sizes: list
+    full_sizes: list = field(default_factory=list)
+
+
+def stub(*answers):
+    """
+    :param answers: (text, answer) pairs. A prompt gets the answer of the first pair whose text is in it: a str, or a
+    function that returns a str (or None to stop the game).
+    :return: function that answers prompts, for PolicyInput or distant_skies.run_headless()
+    """
+
+    def policy(prompt):
+        for text, answer in answers:
+            if text in prompt:
+                return answer() if callable(answer) else answer
+        raise LookupError('Nothing stubbed for the prompt ' + repr(prompt))
+
+    return policy
+
+
+@contextmanager
+def stubbed(policy):
+    """
+    Answers prompts with policy and throws output away for as long as the block runs.
+    """
+
+    previous_input = set_input(PolicyInput(policy))
+    previous_output = renderer.mode, renderer.sink
+    previous_directory = gen.SAVE_DIRECTORY
+    set_output(INSTANT, NullSink())
+    gen.SAVE_DIRECTORY = None
+    try:
+        yield
+    finally:
+        set_input(previous_input)
+        renderer.mode, renderer.sink = previous_output
+        gen.SAVE_DIRECTORY = previous_directory
+        gen.forget_names()
+
+
+def timed(function, *args):
+    """
+    :return: float, seconds function(*args) took
+    """
+
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def built_system(planets, moons=2):
+    """
+    The answers generate_system() needs for a system of one F star, planets planets of area 10 and moons moons of area
+    5 around each.
+    :return: list of (text, answer) pairs for stub()
+    """
+
+    return [('random system', 'no'), ('maximum size', 'no'), ('Number of stars', '1'), ('Star temperature', '4'),
+            # generate_system() makes one planet fewer than it is asked for
+            ('Number of planets', str(planets + 1)), ('Planet area', '10'), ('How many moons', str(moons)),
+            ('Moon area', '5')]
+
+
+def bench_generate_system(planets):
+    with stubbed(stub(*built_system(planets))):
+        return timed(gen.generate_system)
+
+
+def bench_generate_systems(count, max_size):
+    return timed(gen.generate_systems, count, 0, max_size, True)
+
+
+def bench_lookup(planets, rounds=10):
+    with stubbed(stub(*built_system(planets))):
+        system = gen.generate_system()
+    system.registry.rename_system('Bench')
+    wanted = [body.name.lower() for body in system.registry.bodies]
+    typed = [name.upper() for name in wanted]
+
+    def look_up():
+        for _ in range(rounds):
+            bodies = gen.celestial_dict(system)
+            for name in wanted:
+                bodies[name]
+            for name in typed:
+                system.registry.resolve(name)
+
+    return timed(look_up)
+
+
+def bench_random_name(library_size, draws):
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'names.txt')
+    with open(path, 'w') as library:
+        library.write('\n'.join('name ' + str(number) for number in range(library_size)) + '\n')
+    system = ds.System(frozenset(), [], 'Bench')
+    previous_directory = gen.SAVE_DIRECTORY
+    gen.SAVE_DIRECTORY = None
+    try:
+        # The sampler and used-name registry random_name() would otherwise make for the colony name library
+        gen._name_samplers[system.name] = names.library(path).sampler(rand.Random(0))
+        gen.used_names(system)
+        return timed(lambda: [gen.random_name(system) for _ in range(draws)])
+    finally:
+        gen.SAVE_DIRECTORY = previous_directory
+        gen.forget_names()
+        names._libraries.pop(path, None)
+
+
+def new_game(planets, first_colonies):
+    """
+    :param first_colonies: list of the two players' first colony bodies
+    :return: list of (text, answer) pairs for a new two-player game in a built system named Bench, where every colony
+    gets the next custom name in home1, home2, ...
+    """
+
+    colony_names = ('home' + str(number) for number in range(1, 1 << 30))
+    first = iter(first_colonies)
+    return [('[new] | [continue]', 'new'), ('Number of players', '2'), ('computer players', '0'), ('have names', 'no'),
+            ('What name will you give', 'bench'), ('rename this system', 'no'),
+            ('place their first colony', lambda: next(first)), ('custom name?', 'yes'),
+            ('Custom name', lambda: next(colony_names))] + built_system(planets)
+
+
+def bench_establish_colony(colonies):
+    # Every planet has room for 10 colonies and each of its two moons for 5
+    planets = math.ceil((colonies + 2) / 20)
+    slots = ['bench ' + str(planet) + moon for planet in range(1, planets + 1) for moon in ('', 'a', 'b')
+             for _ in range(10 if moon == '' else 5)]
+    targets = iter(slots[2:colonies + 2])
+    left = [colonies]
+
+    def command():
+        left[0] -= 1
+        return 'establish' if left[0] >= 0 else None
+
+    policy = stub(*new_game(planets, slots[:2]), ('It is currently', command), ('Target body', lambda: next(targets)))
+    return timed(ds.run_headless, policy, 0)
+
+
+def bench_purchase_ship(ships):
+    left = [ships]
+
+    def command():
+        left[0] -= 1
+        return 'purchase' if left[0] >= 0 else None
+
+    policy = stub(*new_game(1, ['bench 1', 'bench 1']), ('It is currently', command),
+                  ('Please choose a model', 'fighter'), ('Where will you construct', 'home1'),
+                  ('name your ship', 'no'), ('Merge', 'no'))
+    previous_resources = economy.STARTING_RESOURCES
+    economy.STARTING_RESOURCES = ships * economy.cost(ds.fighter)
+    try:
+        return timed(ds.run_headless, policy, 0)
+    finally:
+        economy.STARTING_RESOURCES = previous_resources
+
+
+def bench_save(ships, players):
+    game = build_game(ships, players)
+    return timed(savefile.dump, game, io.BytesIO())
+
+
+def bench_load(ships, players):
+    buffer = io.BytesIO()
+    savefile.dump(build_game(ships, players), buffer)
+    return timed(lambda: savefile.load(io.BytesIO(buffer.getvalue())))
+
+
+def bench_end_turn(ships, players, turns=5):
+    game = build_game(ships, players)
+    return timed(lambda: [ds.end_turn(game) for _ in range(turns)])
+
+
+def bench_snapshot(colonies, rounds):
+    """
+    Times rounds of taking a snapshot, founding a colony and ordering a ship, and going back to the snapshot, in a game
+    where one player has colonies colonies.
+    """
+
+    game = build_game(10000, 4)
+    bodies = game.system.registry.bodies
+    player = game.players[0]
+    for number in range(colonies):
+        ds.found_colony(player, bodies[number % len(bodies)], 'bench ' + str(number))
+    build_site = player.owned_colonies['bench 0']
+    player.resources = rounds * economy.cost(ds.fighter)
+    history = game.history
+
+    def take_back():
+        for _ in range(rounds):
+            history.snapshot()
+            ds.found_colony(player, bodies[0], 'undone')
+            ds.order_ship(game, player, ds.fighter, 'undone', build_site)
+            history.restore()
+
+    return timed(take_back)
+
+
+def bench_patrol(turns):
+    """
+    Times patrol() (see bench_movement.py), which also fails the run if a fleet runs out of fuel for good.
+    """
+
+    return timed(lambda: patrol(turns))
+
+
+def bench_visibility(players, queries):
+    """
+    Times queries fog of war checks in a game of players players, as view colonies and view ships make them: whether
+    one player sees a body, and which bodies they see that the next player is at.
+    """
+
+    game = build_game(10000, players)
+    bodies = game.system.registry.bodies
+    sights = [player.sight for player in game.players]
+
+    def look():
+        for number in range(queries):
+            sight = sights[number % players]
+            if bodies[number % len(bodies)] in sight:
+                list(sight.each(sight.shared(sights[(number + 1) % players])))
+
+    return timed(look)
+
+
+WORKLOADS = [
+    Workload('generate_system', bench_generate_system, [{'planets': 10}, {'planets': 99}, {'planets': 500}],
+             [{'planets': 5000}]),
+    Workload('generate_systems', bench_generate_systems, [{'count': 1000, 'max_size': 10},
+                                                          {'count': 1000, 'max_size': 99}],
+             [{'count': 100000, 'max_size': 99}]),
+    Workload('celestial_dict', bench_lookup, [{'planets': 10}, {'planets': 99}, {'planets': 500}],
+             [{'planets': 5000}]),
+    Workload('random_name', bench_random_name, [{'library_size': 1000, 'draws': 1000},
+                                                {'library_size': 100000, 'draws': 10000}],
+             [{'library_size': 1000000, 'draws': 100000}]),
+    Workload('establish_colony', bench_establish_colony, [{'colonies': 100}, {'colonies': 1000}],
+             [{'colonies': 10000}]),
+    Workload('purchase_ship', bench_purchase_ship, [{'ships': 100}, {'ships': 1000}], [{'ships': 10000}]),
+    Workload('save', bench_save, [{'ships': 10000, 'players': 4}, {'ships': 100000, 'players': 1000}],
+             [{'ships': 1000000, 'players': 4}, {'ships': 1000000, 'players': 100000}]),
+    Workload('load', bench_load, [{'ships': 10000, 'players': 4}, {'ships': 100000, 'players': 1000}],
+             [{'ships': 1000000, 'players': 4}, {'ships': 1000000, 'players': 100000}]),
+    Workload('end_turn', bench_end_turn, [{'ships': 10000, 'players': 4}, {'ships': 100000, 'players': 1000}],
+             [{'ships': 1000000, 'players': 4}]),
+    Workload('snapshot', bench_snapshot, [{'colonies': 10000, 'rounds': 1000}],
+             [{'colonies': 1000000, 'rounds': 1000}]),
+    Workload('patrol', bench_patrol, [{'turns': 50}], [{'turns': 500}]),
+    Workload('visibility', bench_visibility, [{'players': 2, 'queries': 10000}, {'players': 8, 'queries': 10000}],
+             [{'players': 8, 'queries': 1000000}]),
+]
+
+
+def key(name, sizes):
+    return name + '[' + ','.join(size + '=' + str(sizes[size]) for size in sorted(sizes)) + ']'
+
+
+def run(full=False, only=None, repeats=REPEATS, report=None):
+    """
+    :param full: bool, if True, also run the largest sizes
+    :param only: str, only run workloads whose names contain it, or None for all of them
+    :param repeats: int, runs of each size to take the best of
+    :param report: function called with the key and seconds of each timing as it is made, or None
+    :return: dict of seconds by key
+    """
+
+    timings = dict()
+    for workload in WORKLOADS:
+        if only is not None and only not in workload.name:
+            continue
+        for sizes in workload.sizes + (workload.full_sizes if full else []):
+            best = min(workload.function(**sizes) for _ in range(repeats))
+            timings[key(workload.name, sizes)] = best
+            if report is not None:
+                report(key(workload.name, sizes), best)
+    return timings
+
+
+def compare(timings, baseline, threshold=THRESHOLD):
+    """
+    :param timings: dict of seconds by key
+    :param baseline: dict of seconds by key
+    :param threshold: float, how much slower than the baseline a timing may be, as a fraction of it
+    :return: list of (key, baseline seconds, seconds) of every timing that is too slow, worst first
+    """
+
+    slower = [(name, baseline[name], seconds) for name, seconds in timings.items()
+              if baseline.get(name) and seconds > baseline[name] * (1 + threshold)]
+    return sorted(slower, key=lambda timing: timing[2] / timing[1], reverse=True)
+
+
+def main(arguments=None):
+    """
+    :return: int, the exit status: 1 if anything was slower than the baseline allows, otherwise 0
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite',
+                                     description='Times every workload and checks the timings against a baseline.')
+    parser.add_argument('--full', action='store_true', help='also run the largest sizes')
+    parser.add_argument('--only', help='only run workloads whose names contain this')
+    parser.add_argument('--repeats', type=int, default=REPEATS, help='runs of each size to take the best of')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the results')
+    parser.add_argument('--baseline', default=BASELINE, help='results to compare against, if the file exists')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline as well')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='fraction slower than the baseline that fails the run')
+    options = parser.parse_args(arguments)
+
+    def report(name, seconds):
+        print(name.ljust(60) + str(round(seconds * 1000, 2)).rjust(12) + ' ms')
+        sys.stdout.flush()
+
+    timings = run(options.full, options.only, options.repeats, report)
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'full': options.full,
+        'timings': timings,
+    }
+    with open(options.output, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+    if options.save_baseline:
+        with open(options.baseline, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        return 0
+
+    try:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['timings']
+    except FileNotFoundError:
+        print('No baseline at ' + options.baseline + ' to compare against.')
+        return 0
+    slower = compare(timings, baseline, options.threshold)
+    for name, before, after in slower:
+        print('SLOWER: ' + name + ' took ' + str(round(after * 1000, 2)) + ' ms against ' +
+              str(round(before * 1000, 2)) + ' ms (' + str(round(100 * (after / before - 1))) + '% slower)')
+    if slower:
+        return 1
+    print('Nothing is more than ' + str(round(options.threshold * 100)) + '% slower than the baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
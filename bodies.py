@@ -0,0 +1,154 @@
+"""
+File: Distant Skies (bodies)
+Description: Name and ID lookup for the planets and moons of a system.
+"""
+
+from bisect import bisect_left, insort
+import difflib
+
+
+def normalize(name):
+    """
+    :param name: str, a body name as typed or stored
+    :return: str, the name in lower case with runs of whitespace collapsed
+    """
+
+    return ' '.join(name.lower().split())
+
+
+class BodyRegistry:
+    """
+    Every planet and moon of one System, by normalized name and by ID. IDs are positions in the list of bodies: the
+    planets in order, then every moon in planet order, the same order the save file uses. Renames must go through
+    rename() or rename_system() so the name index never goes stale. version goes up every time the bodies are re-read,
+    so anything worked out from them (such as System.travel()) can tell when it is out of date.
+    """
+
+    def __init__(self, system):
+        self.system = system
+        self.bodies = []
+        self.names = dict()
+        self._ids = dict()
+        self._parents = []
+        self._sorted = []
+        self.version = 0
+        self.rebuild()
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def __iter__(self):
+        return iter(self.bodies)
+
+    def __contains__(self, name):
+        return normalize(name) in self.names
+
+    def __getitem__(self, name):
+        return self.names[normalize(name)]
+
+    def rebuild(self):
+        """
+        Re-reads the bodies from the system. Only needed when planets or moons are added or removed.
+        """
+
+        self.bodies = list(self.system.planets) + [moon for planet in self.system.planets for moon in planet.moons]
+        self.names.clear()
+        for body in self.bodies:
+            self.names[normalize(body.name)] = body
+        self._ids = {id(body): index for index, body in enumerate(self.bodies)}
+        self._parents = [None] * len(self.system.planets) + [planet for planet in self.system.planets
+                                                             for _ in planet.moons]
+        self._sorted = sorted(self.names)
+        self.version += 1
+
+    def get(self, name, default=None):
+        return self.names.get(normalize(name), default)
+
+    def body(self, body_id):
+        """
+        :param body_id: int
+        :return: the Planet or Moon object with that ID
+        """
+
+        return self.bodies[body_id]
+
+    def id_of(self, body):
+        """
+        :param body: Planet or Moon object of this system
+        :return: int, the body's ID
+        """
+
+        return self._ids[id(body)]
+
+    def parent_of(self, body):
+        """
+        :param body: Planet or Moon object of this system
+        :return: the Planet a moon orbits, or None for a planet
+        """
+
+        return self._parents[self._ids[id(body)]]
+
+    def starting_with(self, prefix):
+        """
+        :param prefix: str
+        :return: list of bodies whose normalized names start with prefix, in name order
+        """
+
+        prefix = normalize(prefix)
+        found = []
+        index = bisect_left(self._sorted, prefix)
+        while index < len(self._sorted) and self._sorted[index].startswith(prefix):
+            found.append(self.names[self._sorted[index]])
+            index += 1
+        return found
+
+    def close_to(self, name, count=3):
+        """
+        :param name: str, a possibly misspelled body name
+        :param count: int, most suggestions to return
+        :return: list of bodies with names similar to name, closest first
+        """
+
+        return [self.names[match] for match in difflib.get_close_matches(normalize(name), self._sorted, count)]
+
+    def resolve(self, name):
+        """
+        Finds the body a player most likely meant: an exact name, or else the only name that starts with what they
+        typed.
+        :param name: str
+        :return: Planet or Moon object, or None if the name matches nothing or is ambiguous
+        """
+
+        body = self.names.get(normalize(name))
+        if body is not None:
+            return body
+        found = self.starting_with(name)
+        if len(found) == 1:
+            return found[0]
+        return None
+
+    def rename(self, body, new_name):
+        """
+        :param body: Planet or Moon object of this system
+        :param new_name: str
+        """
+
+        old_key = normalize(body.name)
+        if self.names.get(old_key) is body:
+            del self.names[old_key]
+            del self._sorted[bisect_left(self._sorted, old_key)]
+        body.name = new_name
+        new_key = normalize(new_name)
+        if new_key not in self.names:
+            insort(self._sorted, new_key)
+        self.names[new_key] = body
+
+    def rename_system(self, new_name):
+        """
+        Renames the system and gives every body the new system name in front of its designation (like "1" or "1a").
+        :param new_name: str
+        """
+
+        self.system.name = new_name
+        for body in self.bodies:
+            self.rename(body, new_name + ' ' + body.name.split()[-1])
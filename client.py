@@ -0,0 +1,69 @@
+"""
+File: Distant Skies (client)
+Description: Plays a game hosted by server.py from the console.
+
+Everything the server sends is printed as soon as it arrives, so news from the other players shows up while you are
+typing. Lines typed at the console (or piped in, one answer per line, to script a game) are sent to the server as they
+come. The client quits when the server closes the connection, or once its input runs out and the server has had
+LINGER seconds to answer the last of it.
+
+Usage: python client.py [port] [host]
+"""
+
+import asyncio
+import sys
+from server import DEFAULT_HOST, DEFAULT_PORT
+
+
+LINGER = 1
+
+
+async def show(reader):
+    """
+    Prints what the server sends until it closes the connection.
+    """
+
+    while True:
+        data = await reader.read(4096)
+        if not data:
+            return
+        sys.stdout.write(data.decode(errors='replace'))
+        sys.stdout.flush()
+
+
+async def type_lines(writer):
+    """
+    Sends every line of standard input to the server until it runs out. Standard input is read by the loop's default
+    executor, so the loop keeps printing while it waits.
+    """
+
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            return
+        writer.write(line.encode())
+        await writer.drain()
+
+
+async def play(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    reader, writer = await asyncio.open_connection(host, port)
+    shown = asyncio.create_task(show(reader))
+    typed = asyncio.create_task(type_lines(writer))
+    await asyncio.wait([shown, typed], return_when=asyncio.FIRST_COMPLETED)
+    if not shown.done():
+        # Out of input: give the server a moment to answer, then hang up
+        try:
+            await asyncio.wait_for(shown, LINGER)
+        except asyncio.TimeoutError:
+            pass
+    typed.cancel()
+    writer.close()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(play(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_HOST,
+                         int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT))
+    except (KeyboardInterrupt, ConnectionError):
+        pass
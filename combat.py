@@ -0,0 +1,156 @@
+"""
+File: Distant Skies (combat)
+Description: Battles between the fleets of different players that end a turn at the same body.
+
+Every engagement of a turn is fought in one pass over flat lists of every ship taking part, read straight from the
+ship store columns. Each ship fires once: its attack, scaled by its build's targeting and by a random roll, is added
+to its side's firepower. A side splits its firepower evenly between the other sides in the engagement, and the fire a
+side takes is spread evenly over its ships, each of which shrugs off part of it with its build's shield generator.
+Ships whose hull drops to 0 are destroyed. The rolls come from a random number generator seeded with the system name
+and the turn, and engagements and fleets are always taken in the same order, so a turn always plays out the same way
+(which is also what lets the journal replay it).
+"""
+
+import distant_skies as ds
+import movement
+from dataclasses import dataclass, field
+from typing import Union
+from operator import mul, sub
+import random as rand
+
+
+HIT_CHANCE = .5
+TARGETING_SCALE = 200
+SHIELD_SCALE = 100
+ROLL_LOW = .5
+ROLL_HIGH = 1.5
+
+
+@dataclass(frozen=False)
+class Battle:
+    """
+    losses maps the name of each player that fought to the number of ships they lost.
+    """
+    location: Union["Planet", "Moon"]
+    fleets: list["Fleet"]
+    losses: dict[int] = field(default_factory=dict)
+
+
+def engagements(game):
+    """
+    Finds every body where fleets of more than one player are, counting fleets docked at a colony as being at the
+    colony's body. Fleets in flight never fight. Only the bodies in game.unsettled are looked at, since nowhere else
+    can anything have changed since the last battles.
+    :param game: Game object
+    :return: list of lists of Fleet objects, one list per engagement, in a fixed order
+    """
+
+    registry = game.system.registry
+    seats = {id(player): seat for seat, player in enumerate(game.players)}
+    battles = []
+    for body_id in sorted(game.unsettled):
+        fleets = registry.body(body_id).fleets
+        owners = sorted((seats[key], here) for key, here in fleets.items() if key in seats and here)
+        if len(owners) > 1:
+            battles.append([fleet for _, here in owners
+                            for fleet in sorted(here.values(), key=lambda fleet: fleet.name)])
+    return battles
+
+
+def resolve(battles, rng):
+    """
+    Fights one round of every engagement and writes the damage to the ships' hulls.
+    :param battles: list of lists of Fleet objects, as found by engagements()
+    :param rng: random.Random object for the rolls
+    :return: list with, for each engagement, a list of (Fleet, set of the rows of its destroyed ships)
+    """
+
+    # Flatten every ship of every engagement into parallel lists of how hard it hits and how well it is shielded, with
+    # each fleet's ships side by side
+    ship_fire = []
+    ship_shields = []
+    side_engagement = []
+    side_ships = []
+    fleet_spans = []
+    build_stats = dict()
+    for engagement, fleets in enumerate(battles):
+        sides = dict()
+        for fleet in fleets:
+            side = sides.get(id(fleet.owner))
+            if side is None:
+                side = sides[id(fleet.owner)] = len(side_engagement)
+                side_engagement.append(engagement)
+                side_ships.append(0)
+            store = fleet.members.store
+            rows = fleet.members.rows
+            stats = build_stats.get(id(store))
+            if stats is None or len(stats[0]) < len(store.builds):
+                stats = build_stats[id(store)] = (
+                    [HIT_CHANCE + build.parts.get('targeting', 0) / TARGETING_SCALE for build in store.builds],
+                    [SHIELD_SCALE / (SHIELD_SCALE + build.parts.get('shield generator', 0)) for build in store.builds])
+            targeting, shields = stats
+            build_ids = list(map(store.build_ids.__getitem__, rows))
+            start = len(ship_fire)
+            ship_fire.extend(map(mul, map(store.attack.__getitem__, rows), map(targeting.__getitem__, build_ids)))
+            ship_shields.extend(map(shields.__getitem__, build_ids))
+            fleet_spans.append((engagement, side, fleet, start, len(ship_fire)))
+            side_ships[side] += len(rows)
+
+    # Every ship rolls once
+    spread = ROLL_HIGH - ROLL_LOW
+    random = rng.random
+    ship_fire = list(map(mul, ship_fire, [ROLL_LOW + spread * random() for _ in range(len(ship_fire))]))
+
+    side_fire = [0.] * len(side_engagement)
+    for _, side, _, start, end in fleet_spans:
+        side_fire[side] += sum(ship_fire[start:end])
+    engagement_fire = [0.] * len(battles)
+    engagement_sides = [0] * len(battles)
+    for engagement, fire in zip(side_engagement, side_fire):
+        engagement_fire[engagement] += fire
+        engagement_sides[engagement] += 1
+
+    # The fire a side takes is what every other side aims at it, spread over its ships
+    side_damage = [(engagement_fire[engagement] - fire) / max(engagement_sides[engagement] - 1, 1) / max(ships, 1)
+                   for engagement, fire, ships in zip(side_engagement, side_fire, side_ships)]
+
+    results = [[] for _ in battles]
+    for engagement, side, fleet, start, end in fleet_spans:
+        hull = fleet.members.store.hull
+        rows = fleet.members.rows
+        left = list(map(sub, map(hull.__getitem__, rows), map(side_damage[side].__mul__, ship_shields[start:end])))
+        for row, value in zip(rows, left):
+            hull[row] = value
+        results[engagement].append((fleet, {row for row, value in zip(rows, left) if value <= 0}))
+    return results
+
+
+def fight(game):
+    """
+    Fights out every engagement at the start of the game's current turn and removes the destroyed ships.
+    :param game: Game object
+    :return: list of Battle objects
+    """
+
+    battles = engagements(game)
+    game.unsettled.clear()
+    if not battles:
+        return []
+    rng = rand.Random(game.system.name + ':' + str(game.turn))
+    reports = []
+    registry = game.system.registry
+    for fleets, results in zip(battles, resolve(battles, rng)):
+        location = fleets[0].location
+        if isinstance(location, ds.Colony):
+            location = movement.body_at(registry, location)
+        battle = Battle(location, fleets)
+        for fleet, destroyed in results:
+            battle.losses[fleet.owner.name] = battle.losses.get(fleet.owner.name, 0) + len(destroyed)
+            if destroyed:
+                ds.destroy_ships(fleet, destroyed)
+                if not fleet.members and fleet.owner.sight is not None:
+                    fleet.owner.sight.recheck(fleet.owner, location)
+        # Whoever is left may fight again next turn
+        game.unsettled.add(registry.id_of(location))
+        reports.append(battle)
+    return reports
@@ -0,0 +1,344 @@
+"""
+File: Distant Skies (commands)
+Description: Turns what players type into commands, and checks them before any of them are carried out.
+
+A line can hold several commands separated by semicolons, and "run [file]" reads more commands from a file (any number
+to a line; blank lines and lines starting with # are skipped). Each command is split into words once and looked up in
+a CommandTable by its first words ("purchase", "move fleet", "get ships"), which gives the handler a Command holding
+the words after them.
+
+Every command in a line, including those read from files, is checked before the first of them is carried out. If any
+of them has a problem, none of them run and every problem is reported at once, so a whole turn of orders can be given
+in one go without half of it going through. Checks see the game as it was before the line, so a command cannot refer
+to something an earlier command in the same line creates (a fleet that a purchase would start, say). What the commands
+of a line add up to is checked after them (see CommandTable.check_lines()), such as whether the player can afford every
+purchase in it together.
+
+The functions at the bottom work out the arguments of the commands the console game and the server share, so both
+accept the same syntax.
+"""
+
+import distant_skies as ds
+import economy
+import generation as gen
+from dataclasses import dataclass
+from typing import Callable
+import os
+
+
+SEPARATOR = ';'
+COMMENT = '#'
+MACRO = 'run'
+# Files a macro can run in turn, so a file that runs itself stops instead of looping forever
+MAX_DEPTH = 8
+
+
+@dataclass(frozen=False)
+class Spec:
+    """
+    A registered command. words are the lowercase words it starts with, and syntax is shown when it is misused.
+    check(command) returns a problem (str) or None, and can leave what it worked out in command.arguments for
+    handler(command), which carries the command out. A final command (like "end") has to come after every other command
+    of its line, including those read from files.
+    """
+    words: tuple
+    syntax: str
+    handler: Callable
+    check: Callable = None
+    final: bool = False
+
+
+@dataclass(frozen=False)
+class Command:
+    """
+    One command of a line. words are the words typed after the spec's words, as typed.
+    """
+    spec: Spec
+    words: tuple
+    text: str
+    arguments: tuple = None
+
+    @property
+    def name(self):
+        return ' '.join(self.spec.words)
+
+    @property
+    def rest(self):
+        return ' '.join(self.words)
+
+    def split(self, *keywords):
+        """
+        Splits the words at the first of each keyword (any case), so split('at', 'named') of the words
+        "fighter at alpha named Hope" gives ['fighter', 'alpha', 'Hope'].
+        :param keywords: str, lowercase
+        :return: list of the words before the first keyword, then after each keyword, as str (None for a keyword that
+        is not there)
+        """
+
+        parts = {None: []}
+        current = None
+        for word in self.words:
+            lowered = word.lower()
+            if lowered in keywords and lowered not in parts:
+                current = lowered
+                parts[current] = []
+            else:
+                parts[current].append(word)
+        return [' '.join(parts[None])] + [' '.join(parts[keyword]) if keyword in parts else None
+                                          for keyword in keywords]
+
+
+class CommandTable:
+    """
+    The commands a game understands, by the words they start with. With macros off, "run" is not a command, so that a
+    server does not read files for its clients.
+    """
+
+    def __init__(self, macros=True):
+        self.specs = dict()
+        self.macros = macros
+        self.line_checks = []
+        self._longest = 0
+
+    def register(self, words, syntax, handler, check=None, final=False):
+        """
+        :param words: str, the words the command starts with, such as 'move fleet'
+        :return: the new Spec
+        """
+
+        spec = Spec(tuple(words.lower().split()), syntax, handler, check, final)
+        self.specs.update({spec.words: spec})
+        self._longest = max(self._longest, len(spec.words))
+        return spec
+
+    def check_lines(self, check):
+        """
+        Adds a check of whole lines.
+        :param check: callable that takes the list of the Command objects of a line that passed their own checks, and
+        returns a problem (str) or None
+        """
+
+        self.line_checks.append(check)
+
+    def lookup(self, words):
+        """
+        :param words: list of str, a command split into words
+        :return: the Spec whose words start the most of words, or None
+        """
+
+        lowered = tuple(word.lower() for word in words[:self._longest])
+        for length in range(len(lowered), 0, -1):
+            spec = self.specs.get(lowered[:length])
+            if spec is not None:
+                return spec
+        return None
+
+    def syntaxes(self, verb=None):
+        """
+        :param verb: str, only give the commands starting with this word, or None for every command
+        :return: list of str, the syntax of each command
+        """
+
+        return [spec.syntax for spec in self.specs.values() if verb is None or spec.words[0] == verb.lower()]
+
+    def parse(self, line, depth=0, where=''):
+        """
+        Splits a line into commands and checks each of them.
+        :param line: str, one or more commands separated by semicolons
+        :param depth: int, number of macro files this line was read through
+        :param where: str, put before every problem to say where the line came from
+        :return: tuple of (list of Command objects, list of problems as str). Nothing should be carried out if there
+        are any problems.
+        """
+
+        commands = []
+        problems = []
+        for text in line.split(SEPARATOR):
+            words = text.split()
+            if not words:
+                continue
+            if self.macros and words[0].lower() == MACRO:
+                found, more = self.read_macro(text.strip()[len(MACRO):].strip(), depth + 1, where)
+                commands.extend(found)
+                problems.extend(more)
+                continue
+            spec = self.lookup(words)
+            if spec is None:
+                syntaxes = self.syntaxes(words[0])
+                if syntaxes:
+                    problems.append(where + 'Incorrect syntax for this command. The syntax for this action is:\n> ' +
+                                    '\n> '.join(syntaxes))
+                else:
+                    problems.append(where + '"' + text.strip() + '" is not a command.')
+                continue
+            command = Command(spec, tuple(words[len(spec.words):]), text.strip())
+            problem = spec.check(command) if spec.check is not None else None
+            if problem is None:
+                commands.append(command)
+            else:
+                problems.append(where + problem)
+        if depth == 0:
+            for command in commands[:-1]:
+                if command.spec.final:
+                    problems.append(command.name.capitalize() + ' has to be the last command.')
+            for check in self.line_checks:
+                problem = check(commands)
+                if problem is not None:
+                    problems.append(problem)
+        return commands, problems
+
+    def read_macro(self, path, depth, where=''):
+        """
+        Parses every line of a file of commands.
+        :param where: str, put before problems with the file itself to say where it was run from
+        :return: tuple of (list of Command objects, list of problems as str), as for parse()
+        """
+
+        if not path:
+            return [], [where + 'The syntax for this action is:\n> ' + MACRO + ' [file of commands]']
+        if depth > MAX_DEPTH:
+            return [], [where + path + ' runs more than ' + str(MAX_DEPTH) + ' files inside each other.']
+        try:
+            with open(os.path.expanduser(path)) as macro:
+                lines = macro.read().splitlines()
+        except OSError as error:
+            return [], [where + 'Cannot read ' + path + ' (' + (error.strerror or str(error)) + ').']
+        commands = []
+        problems = []
+        for number, line in enumerate(lines, 1):
+            if line.strip().startswith(COMMENT):
+                continue
+            found, more = self.parse(line, depth, path + ', line ' + str(number) + ': ')
+            commands.extend(found)
+            problems.extend(more)
+        return commands, problems
+
+
+def find_fleet(player, name):
+    """
+    :param player: Player object
+    :param name: str, name of one of the player's fleets in any case
+    :return: Fleet object, or None if the player has no fleet by that name
+    """
+
+    return player.owned_fleets.get(name.lower())
+
+
+def body_problem(registry, name):
+    """
+    :param registry: BodyRegistry object
+    :param name: str, name of a body
+    :return: str saying why name is not a body of the system, with suggestions, or None if it is
+    """
+
+    if registry.resolve(name) is not None:
+        return None
+    close = registry.starting_with(name) or registry.close_to(name)
+    return (name + ' is not a body in the ' + registry.system.name + ' system.' +
+            (' Did you mean ' + ' or '.join(body.name for body in close) + '?' if close else ''))
+
+
+def establish_arguments(registry, command):
+    """
+    Checks "establish [body] [named name]" and sets command.arguments to (body name, colony name). With no body, both
+    are None and the player is asked for everything.
+    :return: str, the problem with the command, or None
+    """
+
+    body, name = command.split('named')
+    if not body:
+        if name is not None:
+            return 'Say where to establish ' + name + ':\n> establish [body] named ' + name
+        command.arguments = (None, None)
+        return None
+    if name == '':
+        return 'Say what to name the colony after "named".'
+    if name is not None and name in gen.used_names(registry.system):
+        return 'There is already a colony called ' + name + '.'
+    command.arguments = (body, name)
+    return body_problem(registry, body)
+
+
+def purchase_arguments(player, command):
+    """
+    Checks "purchase [model] [at colony] [named name] [joining fleet]" and sets command.arguments to (Build, Colony,
+    ship name, fleet name). The colony can be left out if the player has only one. With no model, every argument is
+    None and the player is asked for everything.
+    :return: str, the problem with the command, or None
+    """
+
+    model, site, name, joining = command.split('at', 'named', 'joining')
+    if not model:
+        if site is not None or name is not None or joining is not None:
+            return 'The syntax for this action is:\n> ' + command.spec.syntax
+        command.arguments = (None, None, None, None)
+        return None
+    build = ds.builds.get(model.lower())
+    if build is None:
+        return 'There is no model called ' + model + '. The models are ' + ', '.join(ds.builds) + '.'
+    if site is None:
+        if len(player.owned_colonies) != 1:
+            return 'Say where to build the ' + build.name + ':\n> purchase ' + model + ' at [colony]'
+        colony = next(iter(player.owned_colonies.values()))
+    else:
+        colony = player.owned_colonies.get(site.lower())
+        if colony is None:
+            return 'You have no colony called ' + site + '.'
+    if name == '':
+        return 'Say what to name the ship after "named".'
+    if name is not None and (name.lower() in player.ships or name.lower() in player.ordered):
+        return 'This name is already being used for one of your ships.'
+    fleet = None
+    if joining is not None:
+        fleet = joining.lower() if joining.lower() in colony.docked else None
+        if fleet is None:
+            return 'There is no fleet called ' + joining + ' at ' + colony.name + '.'
+    command.arguments = (build, colony, name, fleet)
+    return None
+
+
+def purchases_problem(player, found):
+    """
+    Checks the purchases of a line together, since purchase_arguments() sees each of them on its own: the player has to
+    be able to afford all of them, and no two can give their ships the same name. Purchases that ask for everything
+    are left to ask.
+    :param player: Player object
+    :param found: list of Command objects of one line, after purchase_arguments()
+    :return: str, the problem, or None
+    """
+
+    purchases = [command.arguments for command in found
+                 if command.spec.words == ('purchase',) and command.arguments[0] is not None]
+    total = sum(economy.cost(build) for build, _, _, _ in purchases)
+    if total > player.resources:
+        return ('The ships in this line cost ' + str(total) + ' resources together, and you have ' +
+                str(player.resources) + '.')
+    names = set()
+    for _, _, name, _ in purchases:
+        if name is not None and name.lower() in names:
+            return 'Two ships in this line are named ' + name + '.'
+        if name is not None:
+            names.add(name.lower())
+    return None
+
+
+def move_arguments(player, registry, command):
+    """
+    Checks "move fleet [fleet] [to body]" and sets command.arguments to (Fleet, body name). With no body, the player is
+    asked for it.
+    :return: str, the problem with the command, or None
+    """
+
+    # Fleet names have spaces in them ("fighter1 Fleet"), so the name is everything up to "to"
+    name, destination = command.split('to')
+    if not name:
+        return 'The syntax for this action is:\n> ' + command.spec.syntax
+    fleet = find_fleet(player, name)
+    if fleet is None:
+        return 'You have no fleet called ' + name + '.'
+    if isinstance(fleet.location, ds.Orbit):
+        return fleet.name + ' is already en route to ' + fleet.location.destination.name + '.'
+    if destination == '':
+        return 'Say where to send ' + fleet.name + ':\n> move fleet ' + name + ' to [body]'
+    command.arguments = (fleet, destination)
+    return None if destination is None else body_problem(registry, destination)
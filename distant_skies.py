@@ -8,65 +8,277 @@ Email: kentbo0528@gmail.com
 
 from helpers import *
 import generation as gen
+from bodies import BodyRegistry
+from travel import TravelTable
+from journal import Journal
+from movement import Movement, body_at, fleet_speed, needs_refuel
+import economy
+from scheduler import Scheduler, ARRIVE, BUILD, PRODUCE, COMBAT
+import combat
+import commands
+import instrument
+import opponents
+import snapshots
+import visibility
+from ships import Ship, ShipList, ShipStore, current_store, gather, use_store
 from dataclasses import dataclass, field, is_dataclass, asdict
 from typing import Union
+from array import array
+from itertools import repeat
+from functools import partial
 import json
+import random as rand
 
 
 @dataclass(frozen=False)
 class Colony:
+    """
+    docked maps the lower-case names of the fleets at the colony to the Fleet objects. body is the Planet or Moon the
+    colony is on, so that finding it does not take a search of the whole system.
+    """
     owner: Union["Player", None]
     name: str = 'no_save_referenced'
     docked: dict["Fleet"] = field(default_factory=dict)
     prod_per_turn: int = 25
+    body: Union["Planet", "Moon", None] = field(default=None, repr=False, compare=False)
 
 
 @dataclass(frozen=True)
 class Build:
+    """
+    turns is how many turns a ship of this build takes to finish. Builds that take 0 turns are finished at once.
+    """
     name: str
     parts: dict
+    turns: int = 0
 
 
-@dataclass(frozen=False)
-class Ship:
-    name: str
-    build: "Build"
-    parent_fleet: str
-    fuel: float = 100
-    drive_charge: float = 100
-    attack: float = 100
-
-
-@dataclass(frozen=False)
+@dataclass(frozen=False, slots=True)
 class Fleet:
+    """
+    members is a ShipList: the rows of the fleet's ships in the ship store (see ships.py). A plain list of Ship
+    objects passed in is converted.
+    """
     name: str
     owner: Union["Player", None]
     location: Union["Planet", "Moon", "Colony", "Orbit"]
-    members: list["Ship"] = field(default_factory=list)
+    members: "ShipList" = field(default_factory=ShipList)
+
+    def __post_init__(self):
+        if not isinstance(self.members, ShipList):
+            self.members = ShipList(self.members)
 
 
 @dataclass(frozen=True)
 class Orbit:
+    """
+    A fleet in flight from origin to destination. departed and arrival are the turns it left and will arrive on.
+    """
     origin: Union["Planet", "Moon"]
     destination: Union["Planet", "Moon"]
+    departed: int = 0
+    arrival: int = 0
 
 
 @dataclass(frozen=False)
 class Player:
+    """
+    owned_colonies and owned_fleets map lower-case colony and fleet names to the player's Colony and Fleet objects.
+    ships, build_counts and fleets_at are indexes over owned_fleets, kept up to date by add_ship() and Movement:
+    ships maps lower-case ship names to where the ships are stored, as (ShipStore, row) pairs, and is built from the
+    ship store the first time it is asked for after reindex(). build_counts maps build names to how many ships of that
+    build the player has, and fleets_at maps location keys (see location_key()) to dicts of the fleets there. ordered
+    maps the lower-case names of ships still being built to their Build objects. income and net_worth are running
+    totals kept by the functions in economy.py. history is the snapshots.History of the game the player is in, which is
+    told about changes to the player while it has snapshots open. opponent is the opponents.Opponent that gives a
+    computer player's commands, or None for a person. sight is the visibility.Sight of the bodies the player can see,
+    kept up to date by found_colony(), land() and Movement once the player is in a Game. refuelling maps the id() of
+    each of the player's fleets whose ships are not all full, at a body where the player has a colony, to the Fleet
+    (see movement.py).
+    """
     name: str
     net_worth: int = 0
+    resources: int = 0
+    income: int = 0
     owned_colonies: dict["Colony"] = field(default_factory=dict)
     owned_fleets: dict["Fleet"] = field(default_factory=dict)
+    _ships: dict[tuple] = field(default=None, init=False, repr=False, compare=False)
+    build_counts: dict[int] = field(default_factory=dict, repr=False, compare=False)
+    fleets_at: dict[dict] = field(default_factory=dict, repr=False, compare=False)
+    ordered: dict["Build"] = field(default_factory=dict, repr=False, compare=False)
+    history: "snapshots.History" = field(default=None, repr=False, compare=False)
+    opponent: "opponents.Opponent" = field(default=None, repr=False, compare=False)
+    sight: "visibility.Sight" = field(default=None, repr=False, compare=False)
+    refuelling: dict["Fleet"] = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def ships(self):
+        """
+        :return: dict, the ship index described above. reindex() leaves it to be built here, since loading a game
+        would otherwise decode the name of every ship, and most turns never look a ship up by name.
+        """
+
+        if self._ships is None:
+            self._ships = dict()
+            stores = dict()
+            for fleet in self.owned_fleets.values():
+                store = fleet.members.store
+                stores.setdefault(id(store), (store, array('I')))[1].extend(fleet.members.rows)
+            for store, rows in stores.values():
+                self._ships.update(zip(store.names_of(rows, lower=True), zip(repeat(store), rows)))
+        return self._ships
+
+    def index_ship(self, ship):
+        if self.history:
+            self.history.keep_key(self.ships, ship.name.lower())
+            self.history.keep_key(self.build_counts, ship.build.name)
+        self.ships.update({ship.name.lower(): (ship.store, ship.row)})
+        self.build_counts[ship.build.name] = self.build_counts.get(ship.build.name, 0) + 1
+
+    def index_fleet(self, fleet):
+        key = location_key(fleet.location)
+        if self.history:
+            self.history.keep_key(self.fleets_at, key)
+            if key in self.fleets_at:
+                self.history.keep_key(self.fleets_at[key], fleet.name)
+        self.fleets_at.setdefault(key, dict()).update({fleet.name: fleet})
+        if key is not None:
+            self.visit(fleet)
+
+    def unindex_fleet(self, fleet):
+        key = location_key(fleet.location)
+        here = self.fleets_at.get(key)
+        if here is not None:
+            if self.history:
+                self.history.keep_key(self.fleets_at, key)
+                self.history.keep_key(here, fleet.name)
+            here.pop(fleet.name, None)
+            if not here:
+                del self.fleets_at[key]
+        if key is not None:
+            self.leave(fleet)
+
+    def visit(self, fleet):
+        """
+        Files a fleet that is not travelling under its body's fleets.
+        """
+
+        body = body_of(fleet.location)
+        here = body.fleets.get(id(self))
+        if self.history:
+            self.history.keep_key(body.fleets, id(self))
+            if here is not None:
+                self.history.keep_key(here, id(fleet))
+        if here is None:
+            here = body.fleets[id(self)] = dict()
+        here[id(fleet)] = fleet
+
+    def leave(self, fleet):
+        """
+        Takes a fleet out of its body's fleets, before it leaves or after it is lost.
+        """
+
+        body = body_of(fleet.location)
+        here = body.fleets.get(id(self))
+        if here is not None:
+            if self.history:
+                self.history.keep_key(body.fleets, id(self))
+                self.history.keep_key(here, id(fleet))
+            here.pop(id(fleet), None)
+            if not here:
+                del body.fleets[id(self)]
+
+    def land(self, fleets):
+        """
+        Files fleets that have just arrived under the bodies they are at now, instead of under None.
+        :param fleets: list of this player's Fleet objects
+        """
+
+        in_flight = self.fleets_at.get(None, dict())
+        fleets_at = self.fleets_at
+        for fleet in fleets:
+            in_flight.pop(fleet.name, None)
+            here = fleets_at.get(id(fleet.location))
+            if here is None:
+                here = fleets_at[id(fleet.location)] = dict()
+            here[fleet.name] = fleet
+            self.visit(fleet)
+            if self.sight is not None:
+                self.sight.see(fleet.location)
+        if not in_flight:
+            fleets_at.pop(None, None)
+
+    def reindex(self):
+        """
+        Rebuilds every index from owned_fleets, for players whose fleets were filled in directly. Nothing is told to
+        history, so this is only for players that have no snapshots open, such as those of a game being loaded.
+        """
+
+        for key, here in self.fleets_at.items():
+            if key is not None:
+                for fleet in here.values():
+                    body_of(fleet.location).fleets.pop(id(self), None)
+        self._ships = None
+        self.build_counts.clear()
+        self.fleets_at.clear()
+        # The same as index_fleet() and visit() for each fleet, without asking history about every one of them
+        fleets_at = self.fleets_at
+        stores = dict()
+        for fleet in self.owned_fleets.values():
+            key = location_key(fleet.location)
+            here = fleets_at.get(key)
+            if here is None:
+                here = fleets_at[key] = dict()
+            here[fleet.name] = fleet
+            if key is not None:
+                body_of(fleet.location).fleets.setdefault(id(self), dict())[id(fleet)] = fleet
+            store = fleet.members.store
+            stores.setdefault(id(store), (store, array('I')))[1].extend(fleet.members.rows)
+        # Builds are counted straight from the ship store columns, all of a store's rows at once, rather than through
+        # index_ship() one Ship at a time
+        for store, rows in stores.values():
+            build_ids = gather(store.build_ids, rows)
+            for build_id, build in enumerate(store.builds):
+                count = build_ids.count(build_id)
+                if count:
+                    self.build_counts[build.name] = self.build_counts.get(build.name, 0) + count
+
+    def fleets_here(self, location):
+        """
+        :param location: Planet, Moon or Colony object
+        :return: list of this player's fleets at exactly that location
+        """
+
+        return list(self.fleets_at.get(location_key(location), dict()).values())
 
 
 @dataclass(frozen=False)
 class System:
     """
-    planets is a list of Planet objects.
+    planets is a list of Planet objects. seed is the key of the Stream the system was generated from (see
+    generation.generate_systems()), which its colony names are drawn from too, or None for systems made by hand or
+    loaded from a save.
     """
     stars: frozenset
     planets: list
     name: str = 'Centauri'
+    seed: int = field(default=None, repr=False, compare=False)
+    registry: "BodyRegistry" = field(init=False, repr=False, compare=False)
+    _travel: "TravelTable" = field(init=False, default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.registry = BodyRegistry(self)
+
+    def travel(self):
+        """
+        :return: the TravelTable of the system, built again only if its bodies or stars have changed since it was last
+        asked for
+        """
+
+        key = (self.registry.version, self.stars)
+        if self._travel is None or self._travel.key != key:
+            self._travel = TravelTable(self, key)
+        return self._travel
 
 
 @dataclass(frozen=True)
@@ -77,31 +289,104 @@ class Star:
 @dataclass(frozen=False)
 class Planet:
     """
-    moons is a list of Moon objects.
+    moons is a list of Moon objects. fleets maps the id() of every player with fleets at the planet (or docked at its
+    colonies) to a dict of those fleets by id(), kept up to date by the players' indexes (see Player.index_fleet()).
     """
     name: str
     area: int
     moons: list
     colonies: dict[any] = field(default_factory=dict)
+    fleets: dict[dict] = field(default_factory=dict, repr=False, compare=False)
 
 
 @dataclass(frozen=False)
 class Moon:
+    """
+    fleets is the same as a Planet's.
+    """
     name: str
     area: int
     colonies: dict["Colony"] = field(default_factory=dict)
+    fleets: dict[dict] = field(default_factory=dict, repr=False, compare=False)
 
 
 @dataclass(frozen=False)
 class Game:
+    """
+    history is the game's snapshots.History, shared with its players, for undoing commands. Each player is given a
+    visibility.Sight of the game's system, worked out from what they already have. unsettled is the set of the IDs of
+    the bodies where a fleet has turned up (landed or been built) since the last battles, and of those where the last
+    battles were fought, which are the only bodies combat.engagements() looks at. It is not taken back by undo, since
+    a body left in it only costs a look.
+    """
     system: "System"
     players: list["Player"]
+    turn: int = 0
+    saves: int = 0
+    scheduler: "Scheduler" = field(init=False, repr=False, compare=False)
+    movement: "Movement" = field(init=False, repr=False, compare=False)
+    history: "snapshots.History" = field(init=False, repr=False, compare=False)
+    unsettled: set[int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.history = snapshots.History()
+        registry = self.system.registry
+        self.unsettled = {registry.id_of(body) for body in registry.bodies if body.fleets}
+        for player in self.players:
+            player.history = self.history
+            player.sight = visibility.Sight(self.system.registry)
+            player.sight.rebuild(player)
+        self.scheduler = Scheduler()
+        self.scheduler.handle(BUILD, partial(finish_ships, self))
+        self.scheduler.handle(PRODUCE, partial(produce, self))
+        self.movement = Movement(self)
+        for player in self.players:
+            self.scheduler.at(self.turn + 1, PRODUCE, player)
+
+
+dreadnaught = Build(
+    'dreadnaught',
+    {
+        'hyperdrive': 200,
+        'life support': 100,
+        'targeting': 100
+    },
+    2
+)
+colony_ship = Build(
+    'colony ship',
+    {
+        'shield generator': 500
+    },
+    1
+)
+capital_ship = Build(
+    'capital ship',
+    {
+        'hyperdrive': 300,
+        'life support': 200,
+        'shield generator': 100
+    },
+    3
+)
+fighter = Build(
+    'fighter',
+    {
+        'life support': 50
+    }
+)
+builds = {
+    'dreadnaught': dreadnaught,
+    'colony ship': colony_ship,
+    'capital ship': capital_ship,
+    'fighter': fighter
+}
 
 
 def join_players():
     """
-    Creates a list of players.
-    :return: ordered list of players, which are each strings
+    Creates a list of players, any number of which can be computer players.
+    :return: ordered list of Player objects, the people first and then the computer players
     """
     while True:
         playercount = num_choice('Number of players: ', 2, 8)
@@ -109,56 +394,241 @@ def join_players():
             slow_print('Please input a number between 2 and 4.', 2)
             continue
         break
+    computers = num_choice('Number of computer players: ', 0, playercount)
+    playercount -= computers
 
     players = []
-    if bool_choice('Would you like for the players to have names? '):
+    if playercount and bool_choice('Would you like for the players to have names? '):
         for player in range(1, playercount + 1):
-            players.append(Player(input('Name for Player ' + str(player) + ': ')))
+            message = 'Name for Player ' + str(player) + ': '
+            slow_print(message, 1, False)
+            players.append(Player(read_input(message)))
     else:
         player = 0
         while playercount > player:
             player += 1
             players.append(Player('Player ' + str(player)))
+    for computer in range(1, computers + 1):
+        players.append(Player('Computer ' + str(computer), opponent=opponents.Opponent(seed=rand.getrandbits(64))))
 
     return players
 
 
-def play():
+def body_of(location):
+    """
+    :param location: the location of a fleet that is not travelling
+    :return: the Planet or Moon object it is at, or on
+    """
 
-    dreadnaught = Build(
-        'dreadnaught',
-        {
-            'hyperdrive': 200,
-            'life support': 100,
-            'targeting': 100
-        }
-    )
-    colony_ship = Build(
-        'colony ship',
-        {
-            'shield generator': 500
-        }
-    )
-    capital_ship = Build(
-        'capital ship',
-        {
-            'hyperdrive': 300,
-            'life support': 200,
-            'shield generator': 100
-        }
-    )
-    fighter = Build(
-        'fighter',
-        {
-            'life support': 50
-        }
-    )
-    builds = {
-        'dreadnaught': dreadnaught,
-        'colony ship': colony_ship,
-        'capital ship': capital_ship,
-        'fighter': fighter
-    }
+    return location.body if isinstance(location, Colony) else location
+
+
+def location_key(location):
+    """
+    :param location: the location of a fleet
+    :return: the key a Player's fleets_at index files the fleet under. Fleets that are travelling are filed under None.
+    """
+
+    if location is None or isinstance(location, Orbit):
+        return None
+    return id(location)
+
+
+def found_colony(player, body, name, prod_per_turn=Colony.prod_per_turn):
+    """
+    Puts a new colony on a body. Whether there is room for it is up to the caller.
+    :param player: Player object that will own the colony
+    :param body: Planet or Moon object
+    :param name: str, name of the colony
+    :param prod_per_turn: int, resources the colony produces each turn
+    :return: the new Colony object
+    """
+
+    # The player's fleets here can be refuelled from now on
+    short = [fleet for fleet in body.fleets.get(id(player), dict()).values() if needs_refuel(fleet)]
+    if player.history:
+        player.history.keep(player)
+        player.history.keep_key(body.colonies, name.lower())
+        player.history.keep_key(player.owned_colonies, name.lower())
+        if player.sight is not None:
+            player.history.keep(player.sight)
+        for fleet in short:
+            player.history.keep_key(player.refuelling, id(fleet))
+    colony = Colony(player, name, prod_per_turn=prod_per_turn, body=body)
+    body.colonies.update({name.lower(): colony})
+    player.owned_colonies.update({name.lower(): colony})
+    player.refuelling.update({id(fleet): fleet for fleet in short})
+    if player.sight is not None:
+        player.sight.see(body)
+    economy.gain_colony(player, colony)
+    return colony
+
+
+def add_ship(player, build, name, build_site, joining=None):
+    """
+    Adds a new ship at one of the player's colonies.
+    :param player: Player object buying the ship
+    :param build: Build object of the new ship
+    :param name: str, name of the ship
+    :param build_site: Colony object the ship is built at
+    :param joining: str or NoneType, name of a fleet docked at build_site for the ship to join, in any case. If None,
+    the ship starts a new fleet of its own, named after it and numbered if a fleet by that name is already the
+    player's or docked at build_site (a ship can share the name of one that was lost, and its fleet may still be
+    around).
+    :return: the new Ship object
+    """
+
+    history = player.history
+    if history:
+        history.keep_store(build_site.docked[joining.lower()].members.store if joining is not None else current_store())
+    if joining is not None:
+        fleet = build_site.docked[joining.lower()]
+        if history:
+            history.keep_length(fleet.members.rows)
+        ship = Ship(name, build, '', store=fleet.members.store)
+        fleet.members.append(ship)
+    else:
+        ship = Ship(name, build, '')
+        fleet_name = ship.name + ' Fleet'
+        number = 1
+        while fleet_name.lower() in player.owned_fleets or fleet_name.lower() in build_site.docked:
+            number += 1
+            fleet_name = ship.name + ' Fleet ' + str(number)
+        if history:
+            history.keep_key(build_site.docked, fleet_name.lower())
+            history.keep_key(player.owned_fleets, fleet_name.lower())
+        fleet = Fleet(fleet_name, player, build_site, [ship])
+        build_site.docked.update({fleet.name.lower(): fleet})
+        player.owned_fleets.update({fleet.name.lower(): fleet})
+        player.index_fleet(fleet)
+    ship.parent_fleet = fleet.name
+    player.index_ship(ship)
+    return ship
+
+
+def destroy_ships(fleet, rows):
+    """
+    Removes ships from a fleet for good, and the fleet itself if that leaves it empty.
+    :param fleet: Fleet object
+    :param rows: set of the ships' rows in fleet.members.store
+    """
+
+    owner = fleet.owner
+    store = fleet.members.store
+    for row in rows:
+        if owner is not None:
+            build = store.builds[store.build_ids[row]]
+            owner.ships.pop(store.name(row).lower(), None)
+            owner.build_counts[build.name] -= 1
+            economy.lose_ship(owner, build)
+        store.free(row)
+    fleet.members.discard(rows)
+    if not fleet.members:
+        if isinstance(fleet.location, Colony):
+            fleet.location.docked.pop(fleet.name.lower(), None)
+        if owner is not None:
+            owner.unindex_fleet(fleet)
+            owner.owned_fleets.pop(fleet.name.lower(), None)
+            owner.refuelling.pop(id(fleet), None)
+
+
+def order_ship(game, player, build, name, build_site, joining=None):
+    """
+    Orders a new ship at one of the player's colonies. It is added at once if its build takes no turns, and otherwise
+    when its BUILD event comes up (see finish_ships()). The player pays for it straight away; whether they can afford
+    it is up to the caller. Arguments are the same as for add_ship().
+    :param game: Game object
+    :return: the new Ship object, or None if it is still being built
+    """
+
+    if game.history:
+        game.history.keep(player)
+    economy.spend(player, build)
+    if build.turns <= 0:
+        game.unsettled.add(game.system.registry.id_of(build_site.body))
+        return add_ship(player, build, name, build_site, joining)
+    if game.history:
+        game.history.keep_key(player.ordered, name.lower())
+        game.history.keep_event(game.scheduler, game.turn + build.turns, BUILD)
+    player.ordered[name.lower()] = build
+    game.scheduler.at(game.turn + build.turns, BUILD, player, build, name, build_site, joining)
+    return None
+
+
+def finish_ships(game, turn, orders):
+    """
+    Handles BUILD events. A ship whose fleet has left the build site by the time it is finished starts a fleet of its
+    own, and one whose build site has changed hands is lost.
+    :param game: Game object
+    :param turn: int
+    :param orders: list of (player, build, name, build_site, joining), as given to order_ship()
+    :return: list of (Player, Ship) of the finished ships
+    """
+
+    finished = []
+    for player, build, name, build_site, joining in orders:
+        player.ordered.pop(name.lower(), None)
+        if build_site.owner is not player:
+            economy.lose_ship(player, build)
+            continue
+        if joining is not None and joining.lower() not in build_site.docked:
+            joining = None
+        game.unsettled.add(game.system.registry.id_of(build_site.body))
+        finished.append((player, add_ship(player, build, name, build_site, joining)))
+    return finished
+
+
+def produce(game, turn, players):
+    """
+    Handles PRODUCE events: every player collects their income, and fleets at their owners' colonies are refuelled
+    (see Movement.refuel()), once per turn.
+    :param game: Game object
+    :param turn: int
+    :param players: list of (player,)
+    """
+
+    game.movement.refuel()
+    for player, in players:
+        economy.collect(player)
+        game.scheduler.at(turn + 1, PRODUCE, player)
+
+
+def start_move(game, fleet, destination):
+    """
+    Sends a fleet on its way, if it is not travelling already and its ships have the fuel and drive charge for the
+    trip (see movement.py).
+    :param game: Game object the fleet is in
+    :param fleet: Fleet object
+    :param destination: Planet or Moon object
+    :return: None if the fleet left, or a str explaining why it could not
+    """
+
+    if isinstance(fleet.location, Orbit):
+        return fleet.name + ' is already en route to ' + fleet.location.destination.name + '.'
+    trip = game.movement.trip(fleet, destination)
+    problem = trip.problem()
+    if problem is None:
+        game.movement.depart(trip)
+    return problem
+
+
+def end_turn(game):
+    """
+    Moves the game on to its next turn, runs the events due on it, and then fights out any battles. Every snapshot of
+    the game is forgotten, since none of this is recorded.
+    :param game: Game object
+    :return: list of (kind, results): what Scheduler.run() returned (the Fleet objects that arrived for ARRIVE and
+    (Player, Ship) pairs for BUILD), then (COMBAT, list of combat.Battle objects)
+    """
+
+    game.history.clear()
+    game.turn += 1
+    results = game.scheduler.run(game.turn)
+    results.append((COMBAT, combat.fight(game)))
+    return results
+
+
+def play():
 
     def read_system():
 
@@ -176,7 +646,7 @@ def play():
             slow_print('> One ' + str(types[star.temp]) + ' type star')
 
         for planet in system.planets:
-            planet.name = system.name + ' ' + planet.name
+            system.registry.rename(planet, system.name + ' ' + planet.name)
             if planet.area == 0:
                 slow_print('> A gas giant planet, ' + planet.name + ', with ', new_line=False)
             else:
@@ -189,7 +659,7 @@ def play():
                     slow_print(str(len(planet.moons)) + ' moons.')
                 moon_count = 0
                 for moon in planet.moons:
-                    moon.name = system.name + ' ' + moon.name
+                    system.registry.rename(moon, system.name + ' ' + moon.name)
                     moon_count += 1
                     if moon.area != 1:
                         slow_print('\t' + moon.name + ' has ' + str(moon.area) + ' sites suitable for colonies.')
@@ -200,16 +670,39 @@ def play():
 
     def rename_system(new_name):
 
-        system.name = new_name
-        for planet in system.planets:
-            planet.name = new_name + ' ' + planet.name[-1]
-            for moon in planet.moons:
-                moon.name = new_name + ' ' + moon.name[-2:]
+        system.registry.rename_system(new_name)
+
+    def suggest_bodies(name):
+        """
+        Tells the player which bodies they might have meant by name.
+        """
+
+        close = system.registry.starting_with(name) or system.registry.close_to(name)
+        if close:
+            slow_print('Did you mean ' + ' or '.join(body.name for body in close) + '?', 2)
+
+    def choose_body(message):
+        """
+        Loops until the player names a body in the system. Unambiguous beginnings of names are accepted.
+        :param message: str, message sent to console
+        :return: Planet or Moon object
+        """
+
+        while True:
+            name = any_choice(message)
+            body = system.registry.resolve(name)
+            if body is not None:
+                return body
+            slow_print(name + ' is not a body in the ' + system.name + ' system.', 2)
+            suggest_bodies(name)
 
     def list_colonies(location):
         """
         :param location: Moon or Planet object with an attribute "colonies".
         """
+        if location not in player.sight:
+            slow_print('You cannot see ' + location.name + '. Found a colony on it or send a fleet there first.', 2)
+            return
         num = len(location.colonies)
         if num == 1:
             slow_print('This body has 1 colony:')
@@ -220,112 +713,181 @@ def play():
         for colony in location.colonies.values():
             slow_print(colony.name + ' is owned by ' + colony.owner.name + '.')
 
-    def establish_colony(celest_body):
+    def colony_name(name, ask):
+        """
+        :param name: str, the name the player gave the colony, or None
+        :param ask: bool, if True and name is None, ask the player whether they want to name the colony, and if the
+        name is already taken, ask for another
+        :return: str, name, the name the player chose, or a random unused name. None if name is already taken and ask
+        is False.
+        """
+
+        if name is None and ask and bool_choice('Would you like to give this colony a custom name? '):
+            name = any_choice('Custom name: ')
+        if name is None:
+            return gen.random_name(system)
+        while not gen.used_names(system).add(name):
+            if not ask:
+                return None
+            slow_print('There is already a colony called ' + name + '. Please choose another name.', 2)
+            name = any_choice('Custom name: ')
+        return name
+
+    def establish_colony(celest_body, name=None, ask=True):
         """
         Establishes a colony on a given body if and only if the player owns a ship that currently orbits the body, the
         ship is carrying enough resources to establish said colony, and if there is an open space for a colony on the
         body. If the ship in question is a colony ship, the colony resource requirement will be waived.
         :param celest_body: name of the body the player wants to establish a colony on
+        :param name: str, name of the colony, or None to ask the player (or pick one at random if ask is False)
+        :param ask: bool, whether to ask the player for anything left out
         :return:
         """
 
-        for planet in system.planets:
-            if celest_body.lower() == planet.name.lower():
-                if len(planet.colonies) < planet.area:
-                    if bool_choice('Would you like to give this colony a custom name? '):
-                        name = any_choice('Custom name: ').lower()
-                    else:
-                        name = gen.random_name(system).lower()
-                    colony = Colony(player, name.lower())
-                    planet.colonies.update({name: colony})
-                    player.owned_colonies.update({name: colony})
-                    colonies.add(colony.name)
-                    slow_print('New colony ' + colony.name.capitalize() + ' successfully established on ' + planet.name +
-                               ', outputting 25 resources per turn.')
-                    return True
-                elif planet.area == 0:
-                    slow_print('You cannot establish a colony on a gas giant planet.')
+        body = system.registry.resolve(celest_body)
+        if body is None:
+            slow_print((celest_body + ' was not found anywhere in the system.'), 2)
+            suggest_bodies(celest_body)
+            return False
+
+        if isinstance(body, Planet):
+            planet = body
+            if len(planet.colonies) < planet.area:
+                chosen = colony_name(name, ask)
+                if chosen is None:
+                    slow_print('There is already a colony called ' + name + '.', 2)
                     return False
-                else:
-                    slow_print('This planet already has the maximum number of colonies.', 2)
+                colony = found_colony(player, planet, chosen.lower())
+                journal.record('colony', players.index(player), planet.name, colony.name)
+                colonies.add(colony.name)
+                slow_print('New colony ' + colony.name.capitalize() + ' successfully established on ' + planet.name +
+                           ', outputting 25 resources per turn.')
+                return True
+            elif planet.area == 0:
+                slow_print('You cannot establish a colony on a gas giant planet.')
+                return False
+            else:
+                slow_print('This planet already has the maximum number of colonies.', 2)
+                return False
+        else:
+            moon = body
+            if len(moon.colonies) < moon.area:
+                chosen = colony_name(name, ask)
+                if chosen is None:
+                    slow_print('There is already a colony called ' + name + '.', 2)
                     return False
+                colony = found_colony(player, moon, chosen)
+                journal.record('colony', players.index(player), moon.name, colony.name)
+                colonies.add(colony.name)
+                slow_print('New colony ' + colony.name + ' successfully established on ' + moon.name +
+                           ', outputting 25 resources per turn.')
+                return True
             else:
-                for moon in planet.moons:
-                    if celest_body.lower() == moon.name.lower():
-                        if len(moon.colonies) < moon.area:
-                            if bool_choice('Would you like to give this colony a custom name? '):
-                                name = any_choice('Custom name: ')
-                            else:
-                                name = gen.random_name(system)
-                            colony = Colony(player, name)
-                            moon.colonies.update({name.lower(): colony})
-                            player.owned_colonies.update({name.lower(): colony})
-                            colonies.add(colony.name)
-                            slow_print('New colony ' + colony.name + ' successfully established on ' + moon.name +
-                                       ', outputting 25 resources per turn.')
-                            return True
-                        else:
-                            slow_print('This moon already has the maximum number of colonies.', 2)
-                            return False
-
-        slow_print((body + ' was not found anywhere in the system.'), 2)
-        return False
-
-    def purchase_ship():
-        """
-        Create a Ship object from a player request.
-        :return: Build object in the form of the requested build.
-        """
-        selection = ''
-        try:
-            selection = builds[list_choice('Please choose a model.\n> ', builds).lower()]
-        except KeyError:
-            print('You somehow managed to input a word that simultaneously is and isn\'t the name of a ship in the '
-                  'catalog. Please contact Kent and tell him how you figured that out. And don\'t do it again.')
+                slow_print('This moon already has the maximum number of colonies.', 2)
+                return False
+
+    def purchase_ship(selection=None, build_site=None, name=None, joining=None):
+        """
+        Orders a ship for the player. If no build is given, the player is asked for everything.
+        :param selection: Build object, or None to ask the player
+        :param build_site: Colony object the player owns
+        :param name: str, name of the ship, or None for the next free name of its build
+        :param joining: str, name of a fleet docked at build_site for the ship to join, or None for a new fleet
+        """
+        ask = selection is None
+        if ask:
+            try:
+                selection = builds[list_choice('Please choose a model.\n> ', builds).lower()]
+            except KeyError:
+                slow_print('You somehow managed to input a word that simultaneously is and isn\'t the name of a ship '
+                           'in the catalog. Please contact Kent and tell him how you figured that out. And don\'t do '
+                           'it again.')
+                return
+        if not economy.can_afford(player, selection):
+            slow_print('A ' + selection.name + ' costs ' + str(economy.cost(selection)) + ' resources, and you have ' +
+                       str(player.resources) + '.', 2)
             return
-        finally:
-            num = 1
-            for fleet in player.owned_fleets.values():
-                for ship in fleet.members:
-                    if ship.build.name == selection.name:
-                        num += 1
+        num = player.build_counts.get(selection.name, 0) + 1
 
+        if build_site is None:
             build_site = player.owned_colonies[
                 list_choice('Where will you construct this ship? ', player.owned_colonies)
             ]
 
-            if bool_choice('Do you want to name your ship? '):
-                while True:
-                    name = any_choice('Custom ship name: ')
-                    for fleet in player.owned_fleets.values():
-                        for ship in fleet.members:
-                            if name == ship.name:
-                                slow_print('This name is already being used for one of your ships. '
-                                           'Please choose another name.')
-                    break
-            else:
+        if name is None and ask and bool_choice('Do you want to name your ship? '):
+            while True:
+                name = any_choice('Custom ship name: ')
+                if name.lower() in player.ships or name.lower() in player.ordered:
+                    slow_print('This name is already being used for one of your ships. '
+                               'Please choose another name.')
+                    continue
+                break
+        elif name is None:
+            name = selection.name + str(num)
+            while name.lower() in player.ships or name.lower() in player.ordered:
+                num += 1
                 name = selection.name + str(num)
-            ship = Ship(name, selection, '')
-            print(len(build_site.docked))
-            if (len(build_site.docked) != 0) and bool_choice('There are fleets available at ' + build_site.name +
-                                                             ' for your new ship to join. Merge ' + ship.name +
-                                                             ' with one of them? '):
-                joining = list_choice('Which fleet would you like to add your ship to? ', build_site.docked)
-                build_site.docked[joining].append(ship)
-                ship.parent_fleet = joining.name
-            else:
-                fleet = Fleet(ship.name + ' Fleet', player, build_site, [ship])
-                build_site.docked.update({fleet.name: fleet})
-                player.owned_fleets.update({fleet.name: fleet})
-                ship.parent_fleet = fleet.name
-            slow_print('Purchase successful! ' + ship.name + ' has been added to your fleet at ' + build_site.name + '.')
+        elif name.lower() in player.ships or name.lower() in player.ordered:
+            # Taken by a ship bought earlier in the same line
+            slow_print('This name is already being used for one of your ships.', 2)
+            return
+        if ask and (len(build_site.docked) != 0) and bool_choice('There are fleets available at ' + build_site.name +
+                                                                 ' for your new ship to join. Merge ' + name +
+                                                                 ' with one of them? '):
+            while joining is None:
+                choice = list_choice('Which fleet would you like to add your ship to? ', build_site.docked)
+                joining = choice if choice in build_site.docked else None
+                if joining is None:
+                    slow_print('There is no fleet called ' + choice + ' at ' + build_site.name + '.', 2)
+        ship = order_ship(game, player, selection, name, build_site, joining)
+        journal.record('order', players.index(player), selection.name, name, build_site.name.lower(), joining)
+        if ship is None:
+            slow_print('Purchase successful! ' + name + ' will be finished at ' + build_site.name + ' on turn ' +
+                       str(game.turn + selection.turns) + '.')
+        else:
+            slow_print('Purchase successful! ' + ship.name + ' has been added to your fleet at ' +
+                       build_site.name + '.')
+
+    def show_standings():
+        """
+        Prints every player's net worth, richest first, and what the player whose turn it is has to spend.
+        """
+        ranks = [str(rank) + '. ' + ranked.name + ' (' + str(ranked.net_worth) + ')'
+                 for rank, ranked in enumerate(economy.leaderboard(players), 1)]
+        renderer.write('Standings: ' + ', '.join(ranks), instant=True)
+        renderer.write(player.name + ' has ' + str(player.resources) + ' resources and earns ' + str(player.income) +
+                       ' per turn.', instant=True)
 
-    def view_ships(target_player):
+    def view_ships(target_player, location=None):
         """
-        :param target_player: A Player object instance, NOT a string
+        :param target_player: A Player object instance, NOT a string. Only the ships of other players at bodies the
+        player can see are shown.
+        :param location: Planet or Moon object to only show the ships at (including its colonies), or None for all
         """
-        slow_print('The following ships are in ' + target_player.name + '\'s possession:')
-        for fleet in target_player.owned_fleets.values():
+        if target_player is not player:
+            seen = player.sight.shared(target_player.sight)
+            if location is not None and not seen & player.sight.bit(location):
+                slow_print('You cannot see any of ' + target_player.name + '\'s ships at ' + location.name + '.')
+                return
+            fleets = [fleet for body in ([location] if location is not None else player.sight.each(seen))
+                      for here in [body] + list(body.colonies.values()) for fleet in target_player.fleets_here(here)]
+            if not fleets:
+                slow_print(target_player.name + ' has no ships you can see' +
+                           ('.' if location is None else ' at ' + location.name + '.'))
+                return
+            slow_print('You can see the following ships of ' + target_player.name + '\'s:')
+        elif location is None:
+            fleets = target_player.owned_fleets.values()
+            slow_print('The following ships are in ' + target_player.name + '\'s possession:')
+        else:
+            fleets = target_player.fleets_here(location)
+            for colony in location.colonies.values():
+                fleets += target_player.fleets_here(colony)
+            if not fleets:
+                slow_print(target_player.name + ' has no ships at ' + location.name + '.')
+                return
+            slow_print('The following ships of ' + target_player.name + '\'s are at ' + location.name + ':')
+        for fleet in fleets:
             for ship in fleet.members:
                 if isinstance(fleet.location, Orbit):
                     slow_print(
@@ -333,6 +895,7 @@ def play():
                                + ', a ' + ship.build.name
                                + ', currently en route from '
                                + fleet.location.origin.name + ' to ' + fleet.location.destination.name
+                               + ', arriving on turn ' + str(fleet.location.arrival)
                                )
                 else:
                     slow_print(
@@ -341,68 +904,126 @@ def play():
                                + ', currently at ' + fleet.location.name
                                )
 
+    def travel_estimates(fleet, count=8):
+        """
+        Tells the player how long the fleet would take to reach the bodies nearest to it.
+        :param fleet: Fleet object that is not travelling
+        :param count: int, most bodies to list
+        """
+
+        table = system.travel()
+        origin = body_at(system.registry, fleet.location)
+        speed = fleet_speed(fleet)
+        estimates = []
+        for _, body in table.nearest(origin, count):
+            turns = table.turns(origin, body, speed)
+            estimates.append(body.name + ' (' + str(turns) + (' turn)' if turns == 1 else ' turns)'))
+        if estimates:
+            slow_print(fleet.name + ' is at ' + origin.name + '. Nearest bodies: ' + ', '.join(estimates) + '.')
+
     def move_fleet(fleet, destination):
         """
         :param fleet: is a Fleet object
         :param destination: is a Colony, Planet, or Moon object
         """
-        origin = fleet.location
-        if not isinstance(origin, Orbit):
-            fleet.location = Orbit(fleet.location, destination)
+        problem = start_move(game, fleet, destination)
+        if problem is None:
+            journal.record('move', players.index(player), fleet.name, destination.name)
+            slow_print(fleet.name + ' has left for ' + destination.name + ' and will arrive on turn ' +
+                       str(fleet.location.arrival) + '.')
         else:
-            pass
-
-
-
-    def normal(request):
-
-        words = request.split()
-        verb = words[0].lower()
-
-        if verb == 'save':
-            gen.save_game(Game(system, players))
-        elif verb == 'establish':
-            target_body = list_choice('Target body: ', bodies)
-            establish_colony(target_body)
-        elif verb == 'get' or verb == 'view':
-            if words[1] == 'colonies':
-                try:
-                    body_name = ''
-                    for word in words[3:]:
-                        body_name += ' ' + word
-                    body_name = body_name.strip().lower()
-                    target_body = bodies[body_name]
-                    print(target_body)
-                    list_colonies(target_body)
-                except IndexError:
-                    slow_print('Incorrect syntax for this command. The syntax for this action is:'
-                               '\n> ' + verb + ' colonies for [name of body]')
-                except KeyError:
-                    slow_print('Cannot find ' + words[3] + ' in the Proxima system.')
-            elif words[1] == 'ships':
-                try:
-                    for named in players:
-                        if named.name == words[3]:
-                            view_ships(named)
-                except IndexError:
-                    view_ships(player)
-            else:
-                slow_print('"' + words[1] + '" is not a recognized object for the verb "get."')
-        elif verb == 'purchase':
-            purchase_ship()
-        elif verb == 'move':
-            if words[1] == 'fleet':
-                fleets = player.owned_fleets.keys()
-                fleet = words[2]
-                if fleet in fleets:
-                    destination = list_choice('Please enter a destination.', colonies)
-                    move_fleet(player.owned_fleets[fleet], destination)
+            slow_print(problem, 2)
+
+    def establish(command):
+        body, name = command.arguments
+        if body is None:
+            establish_colony(any_choice('Target body: '))
+        else:
+            establish_colony(body, name, False)
+
+    def check_colonies(command):
+        before, body = command.split('for')
+        if before or not body:
+            return 'Incorrect syntax for this command. The syntax for this action is:\n> ' + command.spec.syntax
+        command.arguments = system.registry.resolve(body)
+        return commands.body_problem(system.registry, body)
+
+    def check_ships(command):
+        before, body = command.split('at')
+        if body is not None:
+            if before or not body:
+                return 'Incorrect syntax for this command. The syntax for this action is:\n> ' + command.spec.syntax
+            command.arguments = (None, system.registry.resolve(body))
+            return commands.body_problem(system.registry, body)
+        words = command.words[1:] if command.words and command.words[0].lower() in ('of', 'for') else command.words
+        if not words:
+            command.arguments = (None, None)
+            return None
+        owner = ' '.join(words)
+        command.arguments = (next((named for named in players if named.name.lower() == owner.lower()), None), None)
+        return None if command.arguments[0] is not None else 'There is no player called ' + owner + '.'
+
+    def move(command):
+        fleet, destination = command.arguments
+        if destination is None:
+            travel_estimates(fleet)
+            move_fleet(fleet, choose_body('Please enter a destination.\n> '))
+        else:
+            move_fleet(fleet, system.registry.resolve(destination))
+
+    def undo(command):
+        """
+        Takes back the player's latest command this turn that changed anything.
+        """
+
+        undone = game.history.undo()
+        if undone is None:
+            slow_print('You have nothing to undo this turn.', 2)
+            return
+        journal.record('undo')
+        slow_print('Took back "' + undone + '".')
+
+    orders = commands.CommandTable()
+    orders.register('save', 'save', lambda command: journal.snapshot())
+    orders.register('establish', 'establish [name of body] [named colony name]', establish,
+                    lambda command: commands.establish_arguments(system.registry, command))
+    for verb in ('get', 'view'):
+        orders.register(verb + ' colonies', verb + ' colonies for [name of body]',
+                        lambda command: list_colonies(command.arguments), check_colonies)
+        orders.register(verb + ' ships', verb + ' ships [of player | at name of body]',
+                        lambda command: view_ships(command.arguments[0] or player, command.arguments[1]), check_ships)
+    orders.register('purchase', 'purchase [model] [at colony] [named ship name] [joining fleet]',
+                    lambda command: purchase_ship(*command.arguments),
+                    lambda command: commands.purchase_arguments(player, command))
+    orders.register('move fleet', 'move fleet [name of fleet] [to name of body]', move,
+                    lambda command: commands.move_arguments(player, system.registry, command))
+    orders.register('undo', 'undo', undo)
+    orders.check_lines(lambda found: commands.purchases_problem(player, found))
+    orders.register('end', 'end', lambda command: 'end', final=True)
+    orders.register('stop', 'stop', lambda command: 'stop', final=True)
+
+    def carry_out(command):
+        """
+        :param command: Command object that has been checked
+        :return: 'end' or 'stop' for those commands, otherwise None
+        """
+
+        if command.spec.final:
+            return command.spec.handler(command)
+        journal.record('command', players.index(player), command.text)
+        # Replaying the journal takes the same snapshot at the same place (see journal._apply())
+        game.history.snapshot(command.text)
+        if instrument.active is None:
+            return command.spec.handler(command)
+        return instrument.active.measure('command', command.name, command.spec.handler, command)
 
 # Start of actual game
 
     if bool_choice('[new] | [continue]\n> ', 'new', 'continue'):
 
         players = join_players()
+        for player in players:
+            economy.grant(player, economy.STARTING_RESOURCES)
 
         system = gen.generate_system()
         system_name = any_choice('What name will you give to this system?\n> ')
@@ -412,40 +1033,137 @@ def play():
         if bool_choice('Would you like to rename this system?\n> '):
             rename_system(any_choice('What name will you give to this system?\n> ').lower().capitalize())
 
+        use_store(ShipStore())
+        game = Game(system, players)
+        journal = Journal(game)
+        journal.snapshot()
+
     else:
         game = gen.load_game(any_choice('save name?\n> '))
         system = game.system
         players = game.players
+        journal = Journal(game)
 
-    bodies = gen.celestial_dict(system)
-    print(bodies)
+    # A game of computer players alone would never stop by itself
+    last_turn = None
+    if all(player.opponent is not None for player in players):
+        last_turn = game.turn + num_choice('Every player is a computer. How many turns should they play? ', 1)
 
-    print('\n========================'
-          '\nThe game will now begin!'
-          '\n========================\n')
+    renderer.write('\n========================'
+                   '\nThe game will now begin!'
+                   '\n========================\n', instant=True)
 
     colonies = set()
 
-    slow_print('All players have been given one ship to create a colony with.')
-    for player in players:
-        slow_print('Where would ' + player.name + ' like to place their first colony? \n> ', 1, False)
-        body = input()
-        while not establish_colony(body):
-            slow_print('Where would ' + player.name + ' like to place their first colony? \n> ', 1, False)
-            body = input()
-
-    while True:
+    try:
+        slow_print('All players have been given one ship to create a colony with.')
         for player in players:
-            while True:
-                console_msg = 'It is currently ' + player.name + '\'s turn.\n> '
-                command = any_choice(console_msg)
-                if command.strip()[0:3] == 'end':
-                    break
-                elif command != 'stop':
-                    normal(command)
-                else:
-                    return
+            if player.owned_colonies:
+                continue
+            if player.opponent is not None:
+                establish_colony(player.opponent.first_colony(game), player.opponent.colony_name(game, player), False)
+                continue
+            console_msg = 'Where would ' + player.name + ' like to place their first colony? \n> '
+            slow_print(console_msg, 1, False)
+            body = read_input(console_msg)
+            while not establish_colony(body):
+                slow_print(console_msg, 1, False)
+                body = read_input(console_msg)
+        journal.flush()
+
+        while True:
+            for player in players:
+                show_standings()
+                while True:
+                    console_msg = 'It is currently ' + player.name + '\'s turn.\n> '
+                    if player.opponent is None:
+                        line = any_choice(console_msg)
+                    else:
+                        line = player.opponent.command(game, player)
+                        slow_print(console_msg + line)
+                    found, problems = orders.parse(line)
+                    for problem in problems:
+                        slow_print(problem, 2)
+                    outcome = None
+                    if not problems:
+                        for command in found:
+                            outcome = carry_out(command)
+                    if outcome == 'end':
+                        # The next player cannot undo this one's commands
+                        game.history.clear()
+                        journal.flush()
+                        break
+                    elif outcome == 'stop':
+                        journal.flush()
+                        return game
+            if instrument.active is None:
+                results = end_turn(game)
+            else:
+                results = instrument.active.measure('turn', 'end_turn', end_turn, game)
+            for line in describe_turn(results):
+                slow_print(line)
+            journal.end_turn()
+            if last_turn is not None and game.turn >= last_turn:
+                return game
+    except EOFError:
+        # The input ran out (end of a script, or ctrl-D at the console)
+        journal.flush()
+        return game
+
+
+def describe_turn(results):
+    """
+    :param results: what end_turn() returned
+    :return: list of str, one line for every arrival, finished ship and battle
+    """
+
+    lines = []
+    for kind, found in results:
+        if kind == ARRIVE:
+            for fleet in found:
+                lines.append(fleet.owner.name + '\'s ' + fleet.name + ' has arrived at ' + fleet.location.name + '.')
+        elif kind == BUILD:
+            for owner, ship in found:
+                lines.append(owner.name + '\'s ' + ship.name + ' has been finished and is waiting in ' +
+                             ship.parent_fleet + '.')
+        elif kind == COMBAT:
+            for battle in found:
+                lines.append('Battle at ' + battle.location.name + '! ' +
+                             ', '.join(name + ' lost ' + str(lost) + (' ship' if lost == 1 else ' ships')
+                                       for name, lost in battle.losses.items()) + '.')
+    return lines
+
+
+def run_headless(script, seed=None):
+    """
+    Plays a whole game from a script, without printing, sleeping or writing save files.
+    :param script: list of answers, an open file or path to a file of answers (one per line), or a function that takes
+    each prompt message and returns the answer (or None to stop)
+    :param seed: seed for the random number generator, so the same script always plays out the same way
+    :return: the Game object as it was when the script ended
+    """
+
+    source = PolicyInput(script) if callable(script) else ScriptedInput(script)
+    previous_input = set_input(source)
+    previous_output = renderer.mode, renderer.sink
+    previous_directory = gen.SAVE_DIRECTORY
+    set_output(INSTANT, NullSink())
+    gen.SAVE_DIRECTORY = None
+    gen.forget_names()
+    previous_store = current_store()
+    rand.seed(seed)
+    try:
+        return play()
+    finally:
+        use_store(previous_store)
+        set_input(previous_input)
+        renderer.mode, renderer.sink = previous_output
+        gen.SAVE_DIRECTORY = previous_directory
+        gen.forget_names()
 
 
 if __name__ == '__main__':
-    play()
+    # Play through the module as the other modules import it, so that their isinstance checks (movement.body_at(),
+    # say) see the same classes as the game does
+    import distant_skies
+    distant_skies.play()
@@ -0,0 +1,97 @@
+"""
+File: Distant Skies (economy)
+Description: Running totals of each player's income and net worth.
+
+Player.income is what a player's colonies produce each turn, and Player.net_worth is their resources plus what
+everything they own is worth: each colony at COLONY_VALUE_TURNS turns of its production, and each ship (finished or
+still being built) at what it cost. Both are kept up to date a step at a time by the functions here, so nothing ever
+has to walk a player's colonies or ships to find them. A ship costs the sum of its build's parts.
+
+Colonies never change hands yet, so a colony only ever adds to its founder's totals. Handing one over would have to
+move it between the players' owned_colonies, the totals, their Sight and the undo history, and be journalled.
+"""
+
+
+STARTING_RESOURCES = 1000
+COLONY_VALUE_TURNS = 10
+
+
+def cost(build):
+    """
+    :param build: Build object
+    :return: int, resources a ship of this build costs
+    """
+
+    return sum(build.parts.values())
+
+
+def colony_value(colony):
+    return colony.prod_per_turn * COLONY_VALUE_TURNS
+
+
+def grant(player, amount):
+    """
+    Gives a player resources out of nowhere, such as their starting resources.
+    """
+
+    player.resources += amount
+    player.net_worth += amount
+
+
+def collect(player):
+    """
+    Adds one turn of the player's income to their resources.
+    """
+
+    player.resources += player.income
+    player.net_worth += player.income
+
+
+def gain_colony(player, colony):
+    player.income += colony.prod_per_turn
+    player.net_worth += colony_value(colony)
+
+
+def can_afford(player, build):
+    return player.resources >= cost(build)
+
+
+def spend(player, build):
+    """
+    Pays for a ship. The player's net worth does not change, since the ship is worth what it cost.
+    """
+
+    player.resources -= cost(build)
+
+
+def lose_ship(player, build):
+    """
+    Takes a ship that was destroyed, or never finished, off the player's net worth.
+    """
+
+    player.net_worth -= cost(build)
+
+
+def recount(player, builds):
+    """
+    Works out a player's income and net worth from scratch, for players that were put together directly (such as by
+    loading a save). Needs the player's indexes to be up to date (see Player.reindex()).
+    :param player: Player object
+    :param builds: dict of Build objects by name, for reading build_counts
+    """
+
+    colonies = player.owned_colonies.values()
+    player.income = sum(colony.prod_per_turn for colony in colonies)
+    player.net_worth = (player.resources + sum(map(colony_value, colonies)) +
+                        sum(cost(builds[name]) * count for name, count in player.build_counts.items()
+                            if name in builds) +
+                        sum(map(cost, player.ordered.values())))
+
+
+def leaderboard(players):
+    """
+    :param players: list of Player objects
+    :return: list of the players, richest first
+    """
+
+    return sorted(players, key=lambda player: player.net_worth, reverse=True)
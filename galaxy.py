@@ -0,0 +1,162 @@
+"""
+File: Distant Skies (galaxy)
+Description: A galaxy of any number of systems, each generated only when it is first needed.
+
+A system is never stored in full until something asks for it. System number index of a galaxy is system number index
+of the sequence generate_systems() gives for the galaxy's seed, so it comes out the same every time. Systems that
+have been asked for are kept in a cache of at most cache_size, least recently used first. When the cache is full, the
+least recently used system that nothing is using is dropped back to its seed and delta: the names it was given after it
+was generated, by body ID, which is the only thing about an untouched system that can change. Asking for it again
+generates it afresh and gives it those names back, so it comes back as it was left. Memory therefore grows with the
+number of systems in use and renamed, not with the size of the galaxy.
+
+A system is in use while any of its bodies has a colony, or while it is pinned. Anything that holds on to a system's
+bodies, such as a Game played in it or fleets sent to it, should pin() the system while it does, and release() it
+afterwards, since a dropped system comes back as new Planet and Moon objects. Systems in use are never dropped, so the
+cache grows past cache_size if more than that many are in use at once.
+"""
+
+import generation as gen
+from collections import OrderedDict
+
+
+CACHE_SIZE = 64
+
+
+class Galaxy:
+    """
+    size systems, by index from 0. deltas maps the index of every dropped system that was renamed to (system name,
+    dict of body ID to name), and pins maps indexes to the number of pins they hold. generated counts the systems
+    generated so far, including those generated again after being dropped.
+    """
+
+    def __init__(self, seed, size, cache_size=CACHE_SIZE, max_size=99):
+        """
+        :param seed: int or str, the galaxy's seed
+        :param size: int, number of systems in the galaxy
+        :param cache_size: int, most systems kept when they are not in use
+        :param max_size: int, most planets in a system
+        """
+
+        self.seed = seed
+        self.size = size
+        self.cache_size = cache_size
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.deltas = dict()
+        self.pins = dict()
+        self.generated = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        return self.system(index)
+
+    def name_of(self, index):
+        """
+        :return: str, the name system number index is given when it is generated
+        """
+
+        return 'System ' + str(index + 1)
+
+    def generate(self, index):
+        """
+        Generates system number index as it was before anything was done to it.
+        :return: System object
+        """
+
+        batch = gen.generate_systems(1, self.seed, self.max_size, True, start=index)
+        system = batch.system(0, self.name_of(index), True)
+        self.generated += 1
+        return system
+
+    def system(self, index):
+        """
+        :param index: int, from 0 to len(galaxy) - 1
+        :return: System object, generated (with any names it was given before being dropped) if it is not cached
+        """
+
+        if not 0 <= index < self.size:
+            raise IndexError('The galaxy has no system ' + str(index) + '.')
+        system = self.cache.get(index)
+        if system is not None:
+            self.cache.move_to_end(index)
+            return system
+
+        system = self.generate(index)
+        delta = self.deltas.pop(index, None)
+        if delta is not None:
+            name, renamed = delta
+            system.name = name
+            for body_id, body_name in renamed.items():
+                system.registry.rename(system.registry.body(body_id), body_name)
+        self.cache[index] = system
+        self.trim()
+        return system
+
+    def in_use(self, index):
+        """
+        :return: bool, True if system number index is cached and pinned or colonized
+        """
+
+        if self.pins.get(index):
+            return True
+        system = self.cache.get(index)
+        return system is not None and any(body.colonies for body in system.registry.bodies)
+
+    def pin(self, index):
+        """
+        Keeps system number index from being dropped until it is released as many times as it was pinned.
+        :return: System object
+        """
+
+        self.pins[index] = self.pins.get(index, 0) + 1
+        return self.system(index)
+
+    def release(self, index):
+        count = self.pins.get(index, 0) - 1
+        if count > 0:
+            self.pins[index] = count
+        else:
+            self.pins.pop(index, None)
+            self.trim()
+
+    def trim(self):
+        """
+        Drops the least recently used systems not in use until at most cache_size are cached.
+        """
+
+        excess = len(self.cache) - self.cache_size
+        if excess <= 0:
+            return
+        unused = []
+        for index in self.cache:
+            if not self.in_use(index):
+                unused.append(index)
+                if len(unused) == excess:
+                    break
+        for index in unused:
+            self.drop(index)
+
+    def drop(self, index):
+        """
+        Takes system number index out of the cache, keeping what it needs to come back as it is now.
+        """
+
+        system = self.cache.pop(index)
+        renamed = {body_id: body.name for body_id, (body, original) in
+                   enumerate(zip(system.registry.bodies, self.original_names(index, system))) if body.name != original}
+        if renamed or system.name != self.name_of(index):
+            self.deltas[index] = (system.name, renamed)
+
+    def original_names(self, index, system):
+        """
+        :param system: System object of system number index
+        :return: list of the names its bodies were generated with, by body ID
+        """
+
+        prefix = self.name_of(index) + ' '
+        return ([prefix + str(number) for number in range(1, len(system.planets) + 1)] +
+                [prefix + str(number) + chr(97 + moon) for number, planet in enumerate(system.planets, 1)
+                 for moon in range(len(planet.moons))])
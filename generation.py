@@ -1,8 +1,25 @@
 import distant_skies as ds
 from helpers import *
 import random as rand
+from array import array
+from dataclasses import dataclass
+import journal
 import math
+import names
 import os
+import savefile
+import streams
+
+
+# Relative odds of a system having 1, 2, 3, 4 or 5 stars
+STAR_COUNTS = [1, 2, 3, 4, 5]
+STAR_WEIGHTS = [59.62, 31.52, 6.25, 1.88, .44]
+
+# Where games are saved. None keeps everything in memory.
+SAVE_DIRECTORY = 'saves'
+
+_name_samplers = dict()
+_used_names = dict()
 
 
 def generate_system():
@@ -114,33 +131,8 @@ def generate_system():
         system.name = new_name
 
     if want_random:
-        # Generate the stars that make up the system center
-        star_num = rand.choices([1, 2, 3, 4, 5], [59.62, 31.52, 6.25, 1.88, .44])[0]
-        suns = set()
-        while star_num > 0:
-            suns.add(generate_star(True))
-            star_num -= 1
-
-        # Frost line distance calculation
-        frost_line = 0
-        for sun in suns:
-            frost_line += sun.temp**.5
-
-        # Generate the planets
-        planet_num = 0
-        # At least one round of planets per star
-        for i in range(1, len(suns)+1):
-            planet_num += math.floor((rand.randint(4, 10))/(2*i))
-        planets = []
-        if planet_num > max_size:
-            planet_num = max_size
-        for current_planet in range(1, planet_num + 1):
-            if current_planet <= frost_line:
-                current_planet = generate_terrestrial(str(current_planet))
-            else:
-                current_planet = generate_gas_giant(str(current_planet))
-            planets.append(current_planet)
-
+        # Seeded from the module-level random state, so a game played with a seed still comes out the same every time
+        return generate_systems(1, rand.getrandbits(64), max_size, True).system(0)
     else:
         star_num = num_choice('Number of stars in the system: ')
         suns = set()
@@ -168,77 +160,277 @@ def generate_system():
     return ds.System(suns, planets, 'Default')
 
 
+@dataclass(frozen=False)
+class SystemBatch:
+    """
+    Compact form of many random systems. Each system's stars, planets and moons sit in flat arrays, and the offset
+    arrays mark where each system (or planet, for moons) starts and stops. Star temps are stored once per distinct temp,
+    the same way generate_system() keeps them in a set. keys holds the key of each system's Stream.
+    """
+    star_offsets: array
+    star_temps: array
+    planet_offsets: array
+    planet_areas: array
+    moon_offsets: array
+    moon_areas: array
+    keys: array
+
+    def __len__(self):
+        return len(self.star_offsets) - 1
+
+    def __getitem__(self, index):
+        return self.system(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.system(index)
+
+    def system(self, index, name='Default', prefixed=False):
+        """
+        Builds the System object for one entry of the batch.
+        :param index: int, position of the system in the batch
+        :param name: str, name given to the System
+        :param prefixed: bool, if True, put the system name in front of every body name ("Vega 1a" instead of "1a"), as
+        BodyRegistry.rename_system() would
+        :return: System object
+        """
+
+        if index < 0:
+            index += len(self)
+        suns = frozenset(ds.Star(temp) for temp in
+                         self.star_temps[self.star_offsets[index]:self.star_offsets[index + 1]])
+        planets = []
+        first = self.planet_offsets[index]
+        prefix = name + ' ' if prefixed else ''
+        for planet in range(first, self.planet_offsets[index + 1]):
+            planet_name = prefix + str(planet - first + 1)
+            moons = []
+            for moon in range(self.moon_offsets[planet], self.moon_offsets[planet + 1]):
+                moons.append(ds.Moon(planet_name + chr(97 + moon - self.moon_offsets[planet]), self.moon_areas[moon]))
+            planets.append(ds.Planet(planet_name, self.planet_areas[planet], moons))
+
+        return ds.System(suns, planets, name, self.keys[index])
+
+
+def system_stream(seed, index):
+    """
+    :param seed: the seed given to generate_systems()
+    :param index: int, number of the system in the sequence the seed gives
+    :return: the Stream that every random part of the system is derived from
+    """
+
+    return streams.stream(seed).child(index)
+
+
+def draw_stars(system, star_weights=STAR_WEIGHTS):
+    """
+    :param system: Stream of the system (see system_stream())
+    :param star_weights: relative odds of a system having 1, 2, 3, 4 or 5 stars
+    :return: set of the temps of the system's stars
+    """
+
+    count = streams.Stream(system.key).choices(STAR_COUNTS, star_weights)[0]
+    # Draw 0 is the star count and draws 1 to 5 are the stars', so the planet rolls after them are always the same draws
+    return {1 + int(system.at(star) * 7) for star in range(1, count + 1)}
+
+
+def draw_planet_count(system, star_count, max_size=99):
+    """
+    :param star_count: int, number of distinct star temps in the system
+    :return: int, number of planets in the system
+    """
+
+    return min(sum((4 + int(system.at(5 + i) * 7)) // (2 * i) for i in range(1, star_count + 1)), max_size)
+
+
+def draw_planet(system, number, frost_line):
+    """
+    Works out one planet, and its moons, from its own stream.
+    :param number: int, the planet's number, from 1
+    :param frost_line: float, the sum of temp**.5 over the system's stars
+    :return: tuple of (area of the planet, list of the areas of its moons)
+    """
+
+    at = system.child(number).at
+    area = 3 + int(at(0) * 4) if number <= frost_line else 0
+    moon_size = area or 8
+    moons_num = math.floor(math.exp(3 * at(1) - 1))
+    if moon_size < 8 and moons_num > 4:
+        moons_num -= 2
+    if moon_size > 5:
+        moons_num += 1
+        moon_size = moon_size // 2
+    # Every moon has a draw of its own from 2 on, so any moon can be worked out without the others
+    return area, [1 + int(at(moon) * (moon_size - 1)) for moon in range(2, moons_num + 3)]
+
+
+def generate_systems(n, seed=None, max_size=99, compact=False, star_weights=STAR_WEIGHTS, start=0):
+    """
+    Generates n random systems without asking the player anything. The odds match the old random branch of
+    generate_system(): star counts follow STAR_WEIGHTS, the frost line is the sum of temp**.5 over the stars, and moon
+    counts follow math.floor(math.exp(3 * random() - 1)).
+
+    Nothing is drawn from the module-level random state. Every system has its own Stream, derived from the seed and
+    the system's number, which its stars and planet count are drawn from, and every planet (with its moons) draws from
+    a stream of its own derived from that. System number i of a seed therefore comes out the same however many systems
+    are generated with it and in whatever order, so generate_systems(n, seed, start=k) gives systems k to k + n - 1 of
+    the same sequence (to split a sweep between processes), and draw_planet() works out a single planet again on its
+    own.
+    :param n: int, number of systems to generate
+    :param seed: int, str or None; the same seed always gives the same systems
+    :param max_size: int, maximum number of planets in a system
+    :param compact: bool, if True, return a SystemBatch instead of a list of System objects
+    :param star_weights: relative odds of a system having 1, 2, 3, 4 or 5 stars
+    :param start: int, number of the first system to generate
+    :return: list of System objects, or a SystemBatch
+    """
+
+    root = streams.stream(seed)
+    roots = [temp**.5 for temp in range(8)]
+
+    star_offsets = array('l', [0])
+    star_temps = array('b')
+    planet_offsets = array('l', [0])
+    planet_areas = array('b')
+    moon_offsets = array('l', [0])
+    moon_areas = array('b')
+    keys = array('Q')
+
+    for index in range(start, start + n):
+        system = root.child(index)
+        keys.append(system.key)
+        suns = draw_stars(system, star_weights)
+        star_temps.extend(suns)
+        star_offsets.append(len(star_temps))
+
+        frost_line = 0
+        for temp in suns:
+            frost_line += roots[temp]
+
+        for number in range(1, draw_planet_count(system, len(suns), max_size) + 1):
+            area, moons = draw_planet(system, number, frost_line)
+            planet_areas.append(area)
+            moon_areas.extend(moons)
+            moon_offsets.append(len(moon_areas))
+        planet_offsets.append(len(planet_areas))
+
+    batch = SystemBatch(star_offsets, star_temps, planet_offsets, planet_areas, moon_offsets, moon_areas, keys)
+    if compact:
+        return batch
+    return list(batch)
+
+
 def celestial_dict(system):
     """
-    Generates a dictionary of the available bodies in the system.
+    The dictionary of the available bodies in the system. It belongs to the system's BodyRegistry, so it follows
+    renames made through the registry.
     :param system: System object
-    :return: dictionary with body names as the key and the Planet or Moon object as the value
+    :return: dictionary with normalized body names as the key and the Planet or Moon object as the value
     """
 
-    bodies = dict()
+    return system.registry.names
 
-    for planet in system.planets:
-        for moon in planet.moons:
-            bodies.update({moon.name.lower(): moon})
-        bodies.update({planet.name.lower(): planet})
 
-    return bodies
+def random_line(afile):
+    return names.library(afile).pick() + '\n'
 
 
-def random_line(afile):
-    file = open(afile)
-    line = next(file)
-    for num, aline in enumerate(file, 2):
-        if rand.randrange(num):
-            continue
-        line = aline
-    return line
+def name_sampler(system):
+    """
+    :param system: System object
+    :return: the NameSampler that hands out colony names for this system, drawing from the system's own stream if it
+    has one
+    """
 
+    try:
+        return _name_samplers[system.name]
+    except KeyError:
+        rng = rand if system.seed is None else streams.Stream(system.seed).child('names')
+        sampler = names.library('colony_name_library.txt').sampler(rng)
+        _name_samplers.update({system.name: sampler})
+        return sampler
 
-def random_name(system):
+
+def used_names(system):
     """
-    :return: str
+    :param system: System object
+    :return: the UsedNames registry for this system's save, loaded from disk the first time it is asked for
     """
 
+    path = save_directory(system.name)
+    if path is not None:
+        path += '/used_names.txt'
     try:
-        # try to open the used_names file
-        used_names = open('saves/save_game_' + system.name + '/used_names.txt', 'a+')
-    except FileNotFoundError:
-        # if it doesn't exist...
-        try:
-            # create the directory
-            os.makedirs('saves/save_game_' + system.name)
-        except FileExistsError:
-            # if it already exists...
-            pass
-    finally:
-        # directory shoud now exist. Now open .txt file
-        used_names = open('saves/save_game_' + system.name + '/used_names.txt', 'w+')
+        return _used_names[system.name]
+    except KeyError:
+        registry = names.UsedNames(path)
+        _used_names.update({system.name: registry})
+        return registry
+
 
+def forget_names():
+    """
+    Drops the name samplers and used-name registries of every game played so far, so the next game starts afresh.
+    """
+
+    for registry in _used_names.values():
+        registry.flush()
+    _used_names.clear()
+    _name_samplers.clear()
+
+
+def random_name(system):
+    """
+    :return: str
+    """
+
+    registry = used_names(system)
+    sampler = name_sampler(system)
     while True:
-        name = random_line('colony_name_library.txt')[0:-1]
-        if name not in used_names:
-            used_names.seek(0, 2)
-            used_names.write('\n' + name)
-            used_names.close()
+        name = sampler.draw()
+        if registry.add(name):
             return name
 
 
-def load_game(save_name):
-    with open('saves/save_game_' + save_name + '.txt', 'r') as save:
-        suns = set()
-        for line in save:
-            data = save.read().strip()
-            for i in range(0, len(data)):
-                char = data[i]
-                if char == 's':
-                    suns.add(ds.Star(int(data[i+1])))
+def save_directory(save_name):
+    """
+    :param save_name: str, name of the system the game is saved under
+    :return: str, the folder holding that game's saves, or None if games are not being saved
+    """
 
+    if SAVE_DIRECTORY is None:
+        return None
+    return SAVE_DIRECTORY + '/save_game_' + save_name
 
 
+def save_path(save_name):
+    return save_directory(save_name) + '/game.sav'
+
+
+def load_game(save_name):
+    """
+    Loads the latest full save of a game and replays its journal on top of it.
+    :param save_name: str, name of the system the game was saved under
+    :return: Game object
+    """
+
+    with open(save_path(save_name), 'rb', buffering=1 << 16) as save:
+        game = savefile.load(save)
+    journal.replay(game)
+    return game
 
-def save_game(new_game):
 
-    with open('saves/save_game_' + new_game.system.name + '.txt', 'w+') as save:
-        pass
+def save_game(new_game):
+    """
+    Writes the whole game to its save file. The file is written beside the old one first and then swapped in, so a
+    crash while saving never leaves a half-written save behind.
+    :param new_game: Game object
+    """
 
+    if SAVE_DIRECTORY is None:
+        return
+    path = save_path(new_game.system.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as save:
+        savefile.dump(new_game, save)
+    os.replace(path + '.tmp', path)
@@ -5,9 +5,17 @@ Author: Kent Carrier
 Email: kentbo0528@gmail.com
 """
 
+import atexit
+import queue
+import sys
+import threading
 import time
 
 
+INSTANT = 'instant'
+TYPEWRITER = 'typewriter'
+
+
 def num_choice(message, lower=0, upper=None):
     """
     Loops until the user inputs a valid integer choice.
@@ -19,7 +27,7 @@ def num_choice(message, lower=0, upper=None):
 
     while True:
         slow_print(message, 1, False)
-        choice = input()
+        choice = read_input(message)
         try:
             choice = int(choice.strip())
         except ValueError:
@@ -49,7 +57,7 @@ def bool_choice(message, yes='y', no='n'):
 
     while True:
         slow_print(message, 1, False)
-        choice = input().strip()
+        choice = read_input(message).strip()
         if choice is None or choice == '':
             slow_print('Please input "' + yes + '" or "' + no + '".', 2)
         elif choice[:len(yes)].lower() == yes:
@@ -71,8 +79,7 @@ def list_choice(message, choices):
     while True:
 
         slow_print(message, 1, False)
-        choice = input().lower()
-        print(choice)
+        choice = read_input(message).lower()
         try:
             if isinstance(choices, list) or isinstance(choices, set):
                 if choice not in choices:
@@ -127,17 +134,203 @@ def any_choice(message):
 
     while True:
         slow_print(message, 1, False)
-        choice = input()
+        choice = read_input(message)
         if choice == '' or choice is None:
             slow_print('Do not leave the field blank.', 2)
         else:
             return choice.strip()
 
 
+class NullSink:
+    """
+    An output sink that throws everything away, for games that run without a console.
+    """
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class Renderer:
+    """
+    Writes game text to a sink (sys.stdout unless told otherwise) in one of two modes. In INSTANT mode every message is
+    a single buffered write. In TYPEWRITER mode messages are handed to a background thread that types them out one
+    character at a time, so the game carries on, and reads input, while text is still appearing. skip() finishes
+    everything still being typed at once.
+    """
+
+    def __init__(self, mode=TYPEWRITER, sink=None):
+        self.mode = mode
+        self.sink = sink
+        self._queue = queue.Queue()
+        self._skip = threading.Event()
+        self._thread = None
+
+    def output(self):
+        return self.sink if self.sink is not None else sys.stdout
+
+    def busy(self):
+        """
+        :return: True if text is still waiting to be typed out
+        """
+
+        return self._queue.unfinished_tasks > 0
+
+    def write(self, message, speed=1, new_line=True, instant=False):
+        """
+        :param message: str, or a tuple or list of parts that are joined together
+        :param speed: number, higher values type faster
+        :param new_line: bool, if True, end the message with a new line
+        :param instant: bool, if True, write the message at once even in TYPEWRITER mode
+        """
+
+        if not isinstance(message, str):
+            message = ''.join(str(part) for part in message)
+        text = message + '\n' if new_line else message
+
+        if (instant or self.mode == INSTANT) and not self.busy():
+            output = self.output()
+            output.write(text)
+            output.flush()
+            return
+
+        delay = 0
+        if self.mode == TYPEWRITER and message and not instant:
+            delay = .05/(speed*(len(message)**.5))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._type, name='renderer', daemon=True)
+            self._thread.start()
+        self._queue.put((text, delay))
+
+    def _type(self):
+        while True:
+            text, delay = self._queue.get()
+            output = self.output()
+            for i in range(len(text)):
+                if delay == 0 or self._skip.is_set():
+                    output.write(text[i:])
+                    break
+                output.write(text[i])
+                output.flush()
+                time.sleep(delay)
+            output.flush()
+            if self._queue.qsize() == 0:
+                self._skip.clear()
+            self._queue.task_done()
+
+    def skip(self):
+        """
+        Finishes typing everything that is waiting, without delays, and returns once it is all written.
+        """
+
+        if self.busy():
+            self._skip.set()
+            self._queue.join()
+
+
+class StdinInput:
+    """
+    Reads answers typed at the console.
+    """
+
+    interactive = True
+
+    def __call__(self, prompt):
+        return input()
+
+
+class ScriptedInput:
+    """
+    Answers prompts from a fixed script, one line per prompt. Raises EOFError once the script runs out.
+    """
+
+    interactive = False
+
+    def __init__(self, lines):
+        """
+        :param lines: list of str, an open file, or the path to a file with one answer per line
+        """
+
+        if isinstance(lines, str):
+            with open(lines) as script:
+                lines = script.read().splitlines()
+        self.lines = iter([line.rstrip('\r\n') for line in lines])
+
+    def __call__(self, prompt):
+        try:
+            return next(self.lines)
+        except StopIteration:
+            raise EOFError('The script has no more answers.')
+
+
+class PolicyInput:
+    """
+    Answers prompts by calling a function with the prompt's message. The function returns the answer as a str, or
+    None to stop the game.
+    """
+
+    interactive = False
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    def __call__(self, prompt):
+        answer = self.policy(prompt)
+        if answer is None:
+            raise EOFError('The policy stopped answering.')
+        return answer
+
+
+renderer = Renderer()
+atexit.register(renderer.skip)
+input_source = StdinInput()
+
+
+def set_output(mode=None, sink=None):
+    """
+    :param mode: INSTANT, TYPEWRITER, or None to keep the current mode
+    :param sink: object with write() and flush(), such as NullSink(); None keeps the current sink
+    """
+
+    renderer.skip()
+    if mode is not None:
+        renderer.mode = mode
+    if sink is not None:
+        renderer.sink = sink
+
+
+def set_input(source):
+    """
+    :param source: callable that takes the prompt message and returns the answer, such as StdinInput(),
+    ScriptedInput(lines) or PolicyInput(function). One with no interactive attribute is taken not to be a person.
+    :return: the input source that was in use before
+    """
+
+    global input_source
+    previous = input_source
+    input_source = source
+    return previous
+
+
+def read_input(prompt=''):
+    """
+    Reads one answer from the current input source. At the console, pressing enter on an empty line while text is still
+    being typed out skips the animation instead of answering.
+    :param prompt: str, the message the answer is for
+    :return: str
+    """
+
+    while True:
+        line = input_source(prompt)
+        if line == '' and getattr(input_source, 'interactive', False) and renderer.busy():
+            renderer.skip()
+            continue
+        renderer.skip()
+        return line
+
+
 def slow_print(message, speed=1, new_line=True):
 
-    for i in message:
-        print(i, end='', flush=True)
-        time.sleep(.05/(speed*(len(message)**.5)))
-    if new_line:
-        print('')
+    renderer.write(message, speed, new_line)
@@ -0,0 +1,228 @@
+"""
+File: Distant Skies (instrumentation)
+Description: Timing, allocation and profiling of the commands players give and the turns they end.
+
+Nothing is recorded until enable() is called, and until then the game only checks that active is None before each
+command and turn, so leaving instrumentation off costs next to nothing. Once enabled, the Recorder keeps, for every
+verb and for ending turns:
+
+- a count and running totals of wall-clock seconds (and, with memory=True, of bytes allocated, through tracemalloc);
+- the last WINDOW timings, from which rolling p50, p95 and p99 are worked out when asked for;
+- with profile_threshold set, the cProfile stats of every command slower than the threshold (every command is then
+  run under the profiler, so only turn this on while hunting for something).
+
+Timings of commands that ask questions include the time spent waiting for the answers, so they mean the most in
+headless runs (see distant_skies.run_headless()). summary() gives everything as a dict, dump() writes it as JSON, and
+exposition() gives it in the Prometheus text format for scraping.
+"""
+
+from collections import deque
+import cProfile
+import io
+import json
+import math
+import os
+import pstats
+import time
+import tracemalloc
+
+
+WINDOW = 1024
+QUANTILES = (.5, .95, .99)
+# Slow commands whose profiles are kept
+PROFILES_KEPT = 20
+
+active = None
+
+
+def percentile(ordered, fraction):
+    """
+    :param ordered: sorted list of numbers
+    :param fraction: float from 0 to 1
+    :return: the nearest-rank percentile of ordered, or 0 if it is empty
+    """
+
+    if not ordered:
+        return 0
+    return ordered[min(max(math.ceil(fraction * len(ordered)) - 1, 0), len(ordered) - 1)]
+
+
+class Series:
+    """
+    The measurements of one verb (or of ending turns): totals since the recorder was enabled, and the latest WINDOW
+    timings and allocations for the rolling percentiles.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.count = 0
+        self.seconds = 0.
+        self.allocated = 0
+        self.worst = 0.
+        self.recent = deque(maxlen=window)
+        self.recent_allocated = deque(maxlen=window)
+
+    def add(self, seconds, allocated=None):
+        self.count += 1
+        self.seconds += seconds
+        self.worst = max(self.worst, seconds)
+        self.recent.append(seconds)
+        if allocated is not None:
+            self.allocated += allocated
+            self.recent_allocated.append(allocated)
+
+    def summary(self):
+        """
+        :return: dict of the totals and rolling percentiles
+        """
+
+        ordered = sorted(self.recent)
+        found = {
+            'count': self.count,
+            'seconds': self.seconds,
+            'max': self.worst,
+        }
+        for fraction in QUANTILES:
+            found['p' + str(round(fraction * 100))] = percentile(ordered, fraction)
+        if self.recent_allocated:
+            ordered = sorted(self.recent_allocated)
+            found['allocated'] = self.allocated
+            for fraction in QUANTILES:
+                found['allocated_p' + str(round(fraction * 100))] = percentile(ordered, fraction)
+        return found
+
+
+class Recorder:
+    """
+    series maps each kind ('command' or 'turn') to a dict of Series by name (the verb, or 'end_turn'). profiles holds
+    (kind, name, seconds, pstats text) of the slowest commands caught by the profiler, newest last.
+    """
+
+    def __init__(self, window=WINDOW, memory=False, profile_threshold=None, profile_directory=None):
+        """
+        :param window: int, timings kept for the rolling percentiles
+        :param memory: bool, if True, also count the bytes each command allocates (tracemalloc slows everything down)
+        :param profile_threshold: float, seconds above which a command's profile is kept, or None not to profile
+        :param profile_directory: str, folder to also write kept profiles to as .prof files, or None
+        """
+
+        self.window = window
+        self.memory = memory
+        self.profile_threshold = profile_threshold
+        self.profile_directory = profile_directory
+        self.series = {'command': dict(), 'turn': dict()}
+        self.profiles = deque(maxlen=PROFILES_KEPT)
+        self._profiled = 0
+        self._started_tracing = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def measure(self, kind, name, function, *args):
+        """
+        Calls function(*args) and records how long it took under kind and name.
+        :return: what function returned
+        """
+
+        profile = cProfile.Profile() if self.profile_threshold is not None else None
+        if self.memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            if profile is None:
+                return function(*args)
+            return profile.runcall(function, *args)
+        finally:
+            seconds = time.perf_counter() - start
+            allocated = None
+            if self.memory:
+                allocated = max(tracemalloc.get_traced_memory()[1] - memory_before, 0)
+            series = self.series[kind].get(name)
+            if series is None:
+                series = self.series[kind][name] = Series(self.window)
+            series.add(seconds, allocated)
+            if profile is not None and seconds >= self.profile_threshold:
+                self.keep_profile(kind, name, seconds, profile)
+
+    def keep_profile(self, kind, name, seconds, profile):
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(20)
+        self.profiles.append((kind, name, seconds, text.getvalue()))
+        self._profiled += 1
+        if self.profile_directory is not None:
+            os.makedirs(self.profile_directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.profile_directory,
+                                            kind + '-' + name + '-' + str(self._profiled) + '.prof'))
+
+    def summary(self):
+        """
+        :return: dict of kind to dict of name to what Series.summary() returns
+        """
+
+        return {kind: {name: series.summary() for name, series in sorted(named.items())}
+                for kind, named in self.series.items()}
+
+    def dump(self, path):
+        """
+        Writes summary() to path as JSON, with the profiles caught so far.
+        """
+
+        with open(path, 'w') as output:
+            json.dump({'series': self.summary(),
+                       'profiles': [{'kind': kind, 'name': name, 'seconds': seconds, 'stats': stats}
+                                    for kind, name, seconds, stats in self.profiles]}, output, indent=2)
+
+    def exposition(self):
+        """
+        :return: str, the totals and rolling percentiles in the Prometheus text format
+        """
+
+        lines = []
+        labels = {'command': 'verb', 'turn': 'step'}
+        for kind, named in self.series.items():
+            metric = 'distant_skies_' + kind + '_seconds'
+            lines.append('# TYPE ' + metric + ' summary')
+            for name, series in sorted(named.items()):
+                label = labels[kind] + '="' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+                found = series.summary()
+                for fraction in QUANTILES:
+                    lines.append(metric + '{' + label + ',quantile="' + str(fraction) + '"} ' +
+                                 repr(found['p' + str(round(fraction * 100))]))
+                lines.append(metric + '_sum{' + label + '} ' + repr(series.seconds))
+                lines.append(metric + '_count{' + label + '} ' + str(series.count))
+                if series.recent_allocated:
+                    lines.append('distant_skies_' + kind + '_allocated_bytes_sum{' + label + '} ' +
+                                 str(series.allocated))
+        return '\n'.join(lines) + '\n'
+
+
+def enable(**options):
+    """
+    Starts recording, throwing away anything recorded before.
+    :param options: keyword arguments for Recorder
+    :return: the new Recorder
+    """
+
+    global active
+    disable()
+    active = Recorder(**options)
+    return active
+
+
+def disable():
+    """
+    Stops recording.
+    :return: the Recorder that was recording, or None
+    """
+
+    global active
+    recorder = active
+    active = None
+    if recorder is not None:
+        recorder.close()
+    return recorder
@@ -0,0 +1,155 @@
+"""
+File: Distant Skies (journal)
+Description: Append-only record of everything that changes a game between full saves.
+
+Every command and every change it makes (colonies founded, ships bought, fleets sent off, turns ended) is written to
+saves/save_game_<system>/journal.log as one line of JSON. The log is flushed when a player ends their turn, so the
+cost of autosaving grows with the number of commands, not with the size of the game. Every SNAPSHOT_INTERVAL turns
+the whole game is saved and the log starts over. Loading reads the latest save and then replays the log on top of it.
+
+Replaying takes a snapshot of the game at every command, as the game did when the command was given, so that an undo
+in the log takes back the same changes it took back then (see snapshots.py).
+"""
+
+import distant_skies as ds
+import generation as gen
+import json
+import os
+
+
+SNAPSHOT_INTERVAL = 10
+
+
+def journal_path(save_name):
+    directory = gen.save_directory(save_name)
+    if directory is None:
+        return None
+    return directory + '/journal.log'
+
+
+class Journal:
+
+    def __init__(self, game):
+        """
+        :param game: Game object to keep a journal for. Its system name decides where the journal lives.
+        """
+
+        self.game = game
+        self.path = journal_path(game.system.name)
+        self._pending = []
+        if self.path is not None and not os.path.exists(self.path):
+            self._start()
+
+    def _start(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as log:
+            log.write(json.dumps(['snapshot', self.game.saves]) + '\n')
+
+    def record(self, kind, *args):
+        """
+        Queues one entry. Entries reach the disk at the next flush.
+        :param kind: str, what happened ('command', 'colony', 'order', 'move', 'undo' or 'turn')
+        :param args: JSON-friendly details of what happened
+        """
+
+        self._pending.append(json.dumps([kind, *args]))
+
+    def flush(self):
+        if self.path is None:
+            self._pending.clear()
+        if not self._pending:
+            return
+        with open(self.path, 'a') as log:
+            log.write('\n'.join(self._pending) + '\n')
+        self._pending.clear()
+
+    def snapshot(self):
+        """
+        Saves the whole game and starts an empty journal on top of that save. What was done before the save can no
+        longer be undone.
+        """
+
+        self.game.history.clear()
+        self.game.saves += 1
+        gen.save_game(self.game)
+        self._pending.clear()
+        self._start()
+
+    def end_turn(self):
+        """
+        Call after distant_skies.end_turn(). Records the new turn number, writes everything queued so far, and takes a
+        full snapshot every SNAPSHOT_INTERVAL turns.
+        """
+
+        self.record('turn', self.game.turn)
+        if self.game.turn % SNAPSHOT_INTERVAL == 0:
+            self.snapshot()
+        else:
+            self.flush()
+
+
+def _apply(game, bodies, entry):
+    kind = entry[0]
+    if kind == 'command':
+        game.history.snapshot(entry[2])
+    elif kind == 'undo':
+        game.history.undo()
+    elif kind == 'colony':
+        _, player, body, name = entry
+        ds.found_colony(game.players[player], bodies[body], name)
+    elif kind == 'order':
+        _, player, build, name, build_site, joining = entry
+        player = game.players[player]
+        ds.order_ship(game, player, ds.builds[build], name, player.owned_colonies[build_site], joining)
+    elif kind == 'ship':
+        # Journals from before ships took turns to build
+        _, player, build, name, build_site, joining = entry
+        player = game.players[player]
+        ds.add_ship(player, ds.builds[build], name, player.owned_colonies[build_site], joining)
+    elif kind == 'move':
+        _, player, fleet, destination = entry
+        ds.start_move(game, game.players[player].owned_fleets[fleet.lower()], bodies[destination])
+    elif kind == 'turn':
+        ds.end_turn(game)
+
+
+def replay(game):
+    """
+    Applies the journal written since game was last saved. Commands given before the game was loaded cannot be undone
+    afterwards.
+    :param game: Game object freshly loaded from its save
+    :return: int, number of entries applied
+    """
+
+    path = journal_path(game.system.name)
+    if path is None:
+        return 0
+    try:
+        log = open(path, 'r')
+    except FileNotFoundError:
+        return 0
+
+    applied = 0
+    with log:
+        try:
+            header = json.loads(next(log))
+        except (StopIteration, ValueError):
+            return 0
+        # A journal left over from an earlier save must not be applied twice
+        if header != ['snapshot', game.saves]:
+            return 0
+
+        bodies = game.system.registry
+        for line in log:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line can be cut short if the game stopped while writing it
+                break
+            _apply(game, bodies, entry)
+            applied += 1
+
+    game.history.clear()
+    return applied
@@ -0,0 +1,270 @@
+"""
+File: Distant Skies (movement)
+Description: Fleet travel between bodies, resolved once per turn.
+
+A fleet that leaves is given its whole trip at once: how many turns it takes, and the fuel and drive charge its ships
+spend on it, which come straight out of the ship store columns. Every ship burns fuel for each turn in flight, more
+the more parts it carries, and a ship with a hyperdrive spends drive charge for the distance, more the higher its
+rating (which is also what makes it fast). Its Orbit records the turn it left and the turn it arrives, and its arrival
+is an ARRIVE event in the game's Scheduler. Ending a turn then only has to touch the fleets that arrive on it, however
+many others are still in flight.
+
+Fleets at a body where their owner has a colony are topped up by REFILL_PER_TURN fuel and drive charge every turn,
+once the player's PRODUCE event comes up (see Movement.refuel()). Only the fleets in their owners' refuelling dicts
+are looked at: a fleet is put there when it lands short of fuel or drive charge at a body where its owner has a
+colony, or when its owner founds a colony where it is, and taken out once it is full, leaves or is lost. Fleets in
+flight or far from home cost nothing from one turn to the next.
+
+Distances come from the system's TravelTable (see travel.py).
+"""
+
+import distant_skies as ds
+import math
+from scheduler import ARRIVE
+
+
+BASE_SPEED = 1
+FUEL_PER_TURN = 5
+# A ship burns another FUEL_PER_TURN every turn for each PARTS_PER_FUEL of parts it carries
+PARTS_PER_FUEL = 1000
+# A ship spends one drive charge per unit of distance for each DRIVE_PER_CHARGE of hyperdrive rating
+DRIVE_PER_CHARGE = 100
+# Most fuel and drive charge a ship holds, which is what new ships start with (see ShipStore.add())
+CAPACITY = 100
+REFILL_PER_TURN = 25
+
+
+def body_at(registry, location):
+    """
+    :param registry: BodyRegistry of the system the location is in
+    :param location: Planet, Moon or Colony object
+    :return: the Planet or Moon object at location
+    """
+
+    if not isinstance(location, ds.Colony):
+        return location
+    if location.body is None:
+        raise ValueError(location.name + ' is not on any body of the ' + registry.system.name + ' system.')
+    return location.body
+
+
+def needs_refuel(fleet):
+    """
+    :return: bool, whether any ship of the fleet has less than CAPACITY fuel or drive charge
+    """
+
+    store = fleet.members.store
+    fuel = store.fuel
+    charge = store.drive_charge
+    return any(fuel[row] < CAPACITY or charge[row] < CAPACITY for row in fleet.members.rows)
+
+
+def has_colony(player, body):
+    """
+    :param player: Player object
+    :param body: Planet or Moon object
+    :return: bool, whether the player has a colony on the body
+    """
+
+    return any(colony.owner is player for colony in body.colonies.values())
+
+
+def speed(build):
+    """
+    :param build: Build object
+    :return: float, the distance a ship of this build covers in one turn
+    """
+
+    return BASE_SPEED + build.parts.get('hyperdrive', 0) / 100
+
+
+def fleet_speed(fleet):
+    """
+    :return: float, the speed of the slowest ship in the fleet
+    """
+
+    store = fleet.members.store
+    speeds = [speed(build) for build in store.builds]
+    return min(map(speeds.__getitem__, fleet.members.column('build_ids')), default=BASE_SPEED)
+
+
+def fuel_per_turn(build):
+    """
+    :param build: Build object
+    :return: float, the fuel a ship of this build burns for each turn in flight
+    """
+
+    return FUEL_PER_TURN * (1 + sum(build.parts.values()) / PARTS_PER_FUEL)
+
+
+def charge_per_distance(build):
+    """
+    :param build: Build object
+    :return: float, the drive charge a ship of this build spends per unit of distance, 0 for ships with no hyperdrive
+    """
+
+    return build.parts.get('hyperdrive', 0) / DRIVE_PER_CHARGE
+
+
+class Trip:
+    """
+    What a fleet's journey will cost, worked out before it leaves. fuel and charge list what one ship of each build
+    (by build ID in the fleet's ship store) spends on it.
+    """
+
+    def __init__(self, fleet, origin, destination, registry):
+        store = fleet.members.store
+        self.fleet = fleet
+        self.origin = origin
+        self.destination = destination
+        self.distance = registry.system.travel().distance(origin, destination)
+        self.turns = max(math.ceil(self.distance / fleet_speed(fleet)), 1)
+        self.fuel = [math.ceil(self.turns * fuel_per_turn(build)) for build in store.builds]
+        self.charge = [math.ceil(self.distance * charge_per_distance(build)) for build in store.builds]
+        self.rows = fleet.members.rows
+        self.build_ids = list(map(store.build_ids.__getitem__, self.rows))
+
+    def problem(self):
+        """
+        :return: str explaining why the fleet cannot make the trip, or None if it can
+        """
+
+        store = self.fleet.members.store
+        if self.distance == 0:
+            return self.fleet.name + ' is already at ' + self.destination.name + '.'
+        for column, costs, what in ((store.fuel, self.fuel, 'fuel'), (store.drive_charge, self.charge, 'drive charge')):
+            for row, build_id in zip(self.rows, self.build_ids):
+                if column[row] < costs[build_id]:
+                    return (self.fleet.name + ' does not have enough ' + what + ' to reach ' + self.destination.name +
+                            ' (' + store.name(row) + ' needs ' + str(costs[build_id]) + ' and has ' +
+                            str(math.floor(column[row])) + ').')
+        return None
+
+    def pay(self):
+        """
+        Takes the fuel and drive charge for the trip from the fleet's ships.
+        """
+
+        store = self.fleet.members.store
+        fuel = store.fuel
+        charge = store.drive_charge
+        for row, build_id in zip(self.rows, self.build_ids):
+            fuel[row] -= self.fuel[build_id]
+            charge[row] -= self.charge[build_id]
+
+
+class Movement:
+    """
+    Sends off, lands and refuels the fleets of one game. Arrivals are ARRIVE events in game.scheduler, and the fleets
+    that are refuelled are kept in each player's refuelling dict.
+    """
+
+    def __init__(self, game):
+        self.game = game
+        self.in_flight = 0
+        game.scheduler.handle(ARRIVE, self.land)
+        registry = game.system.registry
+        for player in game.players:
+            player.refuelling.clear()
+            homes = {id(colony.body) for colony in player.owned_colonies.values()}
+            for fleet in player.owned_fleets.values():
+                if isinstance(fleet.location, ds.Orbit):
+                    game.scheduler.at(fleet.location.arrival, ARRIVE, fleet, fleet.location)
+                    self.in_flight += 1
+                elif id(body_at(registry, fleet.location)) in homes and needs_refuel(fleet):
+                    player.refuelling[id(fleet)] = fleet
+
+    def __len__(self):
+        """
+        :return: int, number of fleets in flight
+        """
+
+        return self.in_flight
+
+    def trip(self, fleet, destination):
+        """
+        :param fleet: Fleet object that is not travelling
+        :param destination: Planet or Moon object
+        :return: Trip object
+        """
+
+        registry = self.game.system.registry
+        return Trip(fleet, body_at(registry, fleet.location), destination, registry)
+
+    def depart(self, trip):
+        """
+        Sends a fleet off on a trip it can make, paying for it.
+        :param trip: Trip object whose problem() is None
+        """
+
+        fleet = trip.fleet
+        history = self.game.history
+        if history:
+            store = fleet.members.store
+            history.keep(self)
+            history.keep(fleet)
+            if fleet.owner.sight is not None:
+                history.keep(fleet.owner.sight)
+            history.keep_items(store.fuel, trip.rows)
+            history.keep_items(store.drive_charge, trip.rows)
+            history.keep_key(fleet.owner.refuelling, id(fleet))
+            if isinstance(fleet.location, ds.Colony):
+                history.keep_key(fleet.location.docked, fleet.name.lower())
+            history.keep_event(self.game.scheduler, self.game.turn + trip.turns, ARRIVE)
+        trip.pay()
+        if isinstance(fleet.location, ds.Colony):
+            fleet.location.docked.pop(fleet.name.lower(), None)
+        arrival = self.game.turn + trip.turns
+        fleet.owner.unindex_fleet(fleet)
+        fleet.location = ds.Orbit(trip.origin, trip.destination, self.game.turn, arrival)
+        fleet.owner.index_fleet(fleet)
+        if fleet.owner.sight is not None:
+            fleet.owner.sight.recheck(fleet.owner, trip.origin)
+        self.game.scheduler.at(arrival, ARRIVE, fleet, fleet.location)
+        self.in_flight += 1
+        fleet.owner.refuelling.pop(id(fleet), None)
+
+    def land(self, turn, events):
+        """
+        Handles ARRIVE events, putting the fleets that land short at a body where their owner has a colony in the
+        owner's refuelling.
+        :param turn: int, the turn that has just begun
+        :param events: list of (Fleet, Orbit) of the fleets due. A fleet whose location is no longer that Orbit (it
+        was lost on the way) is skipped.
+        :return: list of the Fleet objects that arrived
+        """
+
+        arrived = []
+        owners = dict()
+        registry = self.game.system.registry
+        for fleet, orbit in events:
+            self.in_flight -= 1
+            if fleet.location is not orbit:
+                continue
+            fleet.location = orbit.destination
+            arrived.append(fleet)
+            self.game.unsettled.add(registry.id_of(orbit.destination))
+            if has_colony(fleet.owner, orbit.destination) and needs_refuel(fleet):
+                fleet.owner.refuelling[id(fleet)] = fleet
+            owners.setdefault(id(fleet.owner), (fleet.owner, []))[1].append(fleet)
+        for owner, fleets in owners.values():
+            owner.land(fleets)
+        return arrived
+
+    def refuel(self):
+        """
+        Tops up the fleets in every player's refuelling by REFILL_PER_TURN fuel and drive charge each, up to
+        CAPACITY. Fleets that are full again are taken out of it.
+        """
+
+        for player in self.game.players:
+            refuelling = player.refuelling
+            for key, fleet in list(refuelling.items()):
+                store = fleet.members.store
+                full = True
+                for column in (store.fuel, store.drive_charge):
+                    for row in fleet.members.rows:
+                        column[row] = min(column[row] + REFILL_PER_TURN, CAPACITY)
+                        full = full and column[row] >= CAPACITY
+                if full:
+                    del refuelling[key]
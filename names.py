@@ -0,0 +1,226 @@
+"""
+File: Distant Skies (names)
+Description: Indexed access to the colony name library, and the record of names used in each game.
+"""
+
+from array import array
+import atexit
+import random as rand
+import mmap
+import os
+import struct
+import sys
+import weakref
+
+
+# magic, version, byte order, library size, library mtime, name count
+HEADER = struct.Struct('<4sHHQQQ')
+MAGIC = b'DSNX'
+VERSION = 1
+BYTE_ORDER = 1 if sys.byteorder == 'little' else 2
+
+_libraries = dict()
+_registries = weakref.WeakSet()
+
+
+class NameLibrary:
+    """
+    A name library file with a line-offset table beside it (<library>.idx). The table is built once, rebuilt only
+    when the library file changes, and memory-mapped, so looking up any name costs the same no matter how big the
+    library is. Blank lines are not indexed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + '.idx'
+        stat = os.stat(path)
+        if not self._valid_index(stat):
+            self._build_index(stat)
+
+        with open(self.index_path, 'rb') as index_file:
+            self._index_map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = HEADER.unpack_from(self._index_map)[5]
+        self._offsets = memoryview(self._index_map)[HEADER.size:].cast('Q')
+
+        if stat.st_size:
+            with open(path, 'rb') as library_file:
+                self._data = mmap.mmap(library_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b''
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.name(index)
+
+    def _valid_index(self, stat):
+        try:
+            with open(self.index_path, 'rb') as index_file:
+                header = index_file.read(HEADER.size)
+        except FileNotFoundError:
+            return False
+        if len(header) != HEADER.size:
+            return False
+        magic, version, byte_order, size, mtime, count = HEADER.unpack(header)
+        return (magic == MAGIC and version == VERSION and byte_order == BYTE_ORDER and size == stat.st_size and
+                mtime == stat.st_mtime_ns and os.path.getsize(self.index_path) == HEADER.size + 8 * count)
+
+    def _build_index(self, stat):
+        """
+        Scans the library once and writes the start offset of every non-blank line to the index file.
+        """
+
+        offsets = array('Q')
+        position = 0
+        with open(self.path, 'rb') as library_file:
+            for line in library_file:
+                if line.strip():
+                    offsets.append(position)
+                position += len(line)
+
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER, stat.st_size, stat.st_mtime_ns, len(offsets)))
+            index_file.write(offsets.tobytes())
+        os.replace(temp_path, self.index_path)
+
+    def name(self, index):
+        """
+        :param index: int, position of the name among the non-blank lines of the library
+        :return: str, the name without its line ending
+        """
+
+        start = self._offsets[index]
+        end = self._data.find(b'\n', start)
+        if end == -1:
+            end = len(self._data)
+        return self._data[start:end].decode('utf-8').strip()
+
+    def pick(self, rng=rand):
+        """
+        :param rng: random.Random instance (or the random module) to draw with
+        :return: str, a random name from the library, which may have been picked before
+        """
+
+        if not self.count:
+            raise LookupError(self.path + ' does not contain any names.')
+        return self.name(rng.randrange(self.count))
+
+    def sampler(self, rng=rand):
+        return NameSampler(self, rng)
+
+
+class NameSampler:
+    """
+    Draws names from a NameLibrary without replacement. It runs a Fisher-Yates shuffle one step at a time and only
+    remembers the positions it has swapped, so every draw is O(1) and the last name left is as cheap as the first.
+    """
+
+    def __init__(self, library, rng=rand):
+        self.library = library
+        self.rng = rng
+        self.remaining = library.count
+        self._swaps = dict()
+
+    def __len__(self):
+        return self.remaining
+
+    def draw(self):
+        """
+        :return: str, a name that this sampler has not returned before
+        """
+
+        if not self.remaining:
+            raise LookupError('Every name in ' + self.library.path + ' has already been used.')
+        choice = self.rng.randrange(self.remaining)
+        self.remaining -= 1
+        index = self._swaps.pop(choice, choice)
+        if choice != self.remaining:
+            self._swaps[choice] = self._swaps.pop(self.remaining, self.remaining)
+        return self.library.name(index)
+
+
+def library(path='colony_name_library.txt'):
+    """
+    :param path: str, path to a name library with one name per line
+    :return: the NameLibrary for path, indexed and mapped the first time it is asked for
+    """
+
+    try:
+        return _libraries[path]
+    except KeyError:
+        name_library = NameLibrary(path)
+        _libraries.update({path: name_library})
+        return name_library
+
+
+class UsedNames:
+    """
+    The colony names already taken in one game, ignoring case. Names are kept in a set for O(1) checks, and new ones
+    are appended to an on-disk log in batches, so a burst of new colonies costs one write instead of one per name. The
+    log is read back on the next start, so used names survive restarts.
+    """
+
+    def __init__(self, path, batch_size=64):
+        """
+        :param path: str, path of the log, or None to keep the names in memory only
+        :param batch_size: int, number of new names to collect before writing them out
+        """
+
+        self.path = path
+        self.batch_size = batch_size
+        self.names = set()
+        self._pending = []
+        if path is not None:
+            try:
+                with open(path, 'r') as log:
+                    for line in log:
+                        line = line.strip()
+                        if line:
+                            self.names.add(line.lower())
+            except FileNotFoundError:
+                pass
+        _registries.add(self)
+
+    def __contains__(self, name):
+        return name.lower() in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        """
+        Marks name as used.
+        :param name: str
+        :return: True if the name was free, False if it was already in use
+        """
+
+        if name.lower() in self.names:
+            return False
+        self.names.add(name.lower())
+        self._pending.append(name)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        Appends every name added since the last flush to the log.
+        """
+
+        if not self._pending or self.path is None:
+            self._pending.clear()
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as log:
+            log.write('\n'.join(self._pending) + '\n')
+        self._pending.clear()
+
+
+@atexit.register
+def _flush_registries():
+    for registry in _registries:
+        registry.flush()
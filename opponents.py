@@ -0,0 +1,529 @@
+"""
+File: Distant Skies (opponents)
+Description: Computer players, which choose their commands by Monte Carlo tree search.
+
+A computer player gives the same commands a person would type (establish, purchase, move fleet and end), through the
+same command table, so its orders are checked, journaled and carried out like anyone else's. To choose each command,
+it boils the game down to a Position: a few lists of numbers, with one short list per fleet, which can be copied and
+played forward many thousands of times without touching the real game. The search tree holds the commands the player
+could give this turn, one after another. From each leaf, the rest of the turn, the other players' turns and
+ROLLOUT_TURNS more turns are played out at random on a copy of the Position, and the player's lead in net worth at the
+end scores the leaf. The player then gives the command that was searched the most.
+
+The search runs for budget seconds per command, or for a fixed number of iterations, which makes a computer player's
+choices depend only on its seed. The longer it runs, the more rollouts back each choice. With more than one worker,
+that many processes search the same Position at once, each with its own seed, and their counts are added up.
+
+Rollouts are rough on purpose: battles deal their average damage, fuel and drive charge are not counted, and everyone
+plays at random. Commands the real game would turn down (a trip a fleet has no fuel for, say) are never given.
+
+Usage: python opponents.py [players] [turns] [seconds per command] [workers]
+"""
+
+import distant_skies as ds
+import combat
+import economy
+import generation as gen
+from movement import body_at, fleet_speed
+from scheduler import BUILD
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import math
+import random as rand
+import sys
+import time
+
+
+# Seconds a computer player searches for each command, and the processes it searches in
+BUDGET = .02
+WORKERS = 1
+# Commands a computer player gives in a turn before it ends the turn
+MAX_COMMANDS = 4
+ROLLOUT_TURNS = 6
+# Commands each player gives at most in a turn of a rollout
+ROLLOUT_COMMANDS = 2
+EXPLORATION = 2 ** .5
+# A lead in net worth of this much scores about three quarters of a win
+SCORE_SCALE = 250
+# Bodies a fleet is offered to move to
+TARGETS = 4
+
+ESTABLISH = 'establish'
+PURCHASE = 'purchase'
+MOVE = 'move'
+END = 'end'
+
+# What each list in Position.groups holds
+SEAT, BODY, ARRIVAL, SHIPS, FIRE, SHIELD, HULL, VALUE, SPEED = range(9)
+
+_pools = dict()
+
+
+@dataclass(frozen=False)
+class Position:
+    """
+    A game boiled down for rollouts. Bodies are numbered by BodyRegistry ID and players by seat (their place in
+    Game.players). room holds the colonies each body still has room for, and distances the distance between every two
+    bodies (see TravelTable). homes holds the body each seat builds its ships at, or None. groups holds a list for each
+    fleet and each ship still being built: [seat, body it is at or bound for, turn it gets there, ships, the damage its
+    ships deal in a round, the part of the damage it takes that gets through its shields, the hull each ship has left,
+    what its ships cost, speed]. builds holds (cost, turns, damage, shield, speed) for each build, in the order of
+    distant_skies.builds.
+    """
+    turn: int
+    room: list
+    distances: "array"
+    size: int
+    homes: list
+    resources: list
+    income: list
+    net_worth: list
+    groups: list
+    builds: list
+    prod_per_turn: int
+
+    def copy(self):
+        return Position(self.turn, self.room[:], self.distances, self.size, self.homes[:], self.resources[:],
+                        self.income[:], self.net_worth[:], [group[:] for group in self.groups], self.builds,
+                        self.prod_per_turn)
+
+    def open_body(self, seat):
+        """
+        :return: int, the body with room for a colony nearest to the seat's home (or with the most room, if the seat
+        has no home yet), or None if every body is full
+        """
+
+        home = self.homes[seat]
+        if home is None:
+            body = max(range(len(self.room)), key=self.room.__getitem__, default=None)
+            return body if body is not None and self.room[body] > 0 else None
+        row = home * self.size
+        return min((body for body, room in enumerate(self.room) if room > 0),
+                   key=lambda body: self.distances[row + body], default=None)
+
+    def targets(self, seat):
+        """
+        :return: list of the bodies worth sending the seat's fleets to: the nearest TARGETS bodies where other players
+        have fleets or build their ships, and the seat's own home
+        """
+
+        found = {group[BODY] for group in self.groups if group[SEAT] != seat and group[ARRIVAL] <= self.turn}
+        found.update(home for other, home in enumerate(self.homes) if other != seat and home is not None)
+        home = self.homes[seat]
+        if home is None:
+            return sorted(found)[:TARGETS]
+        found.discard(home)
+        row = home * self.size
+        return sorted(found, key=lambda body: self.distances[row + body])[:TARGETS] + [home]
+
+    def actions(self, seat):
+        """
+        :return: list of every command the seat could give now, as tuples: (ESTABLISH, body), (PURCHASE, build index),
+        (MOVE, group index, body) and (END,)
+        """
+
+        found = []
+        body = self.open_body(seat)
+        if body is not None:
+            found.append((ESTABLISH, body))
+        if self.homes[seat] is not None:
+            found.extend((PURCHASE, index) for index, build in enumerate(self.builds)
+                         if build[0] <= self.resources[seat])
+        targets = None
+        for index, group in enumerate(self.groups):
+            if group[SEAT] == seat and group[ARRIVAL] <= self.turn:
+                if targets is None:
+                    targets = self.targets(seat)
+                found.extend((MOVE, index, target) for target in targets if target != group[BODY])
+        found.append((END,))
+        return found
+
+    def apply(self, seat, action):
+        """
+        Carries out one of the seat's commands, as returned by actions().
+        """
+
+        kind = action[0]
+        if kind == ESTABLISH:
+            self.room[action[1]] -= 1
+            self.income[seat] += self.prod_per_turn
+            self.net_worth[seat] += self.prod_per_turn * economy.COLONY_VALUE_TURNS
+            if self.homes[seat] is None:
+                self.homes[seat] = action[1]
+        elif kind == PURCHASE:
+            cost, turns, damage, shield, speed = self.builds[action[1]]
+            self.resources[seat] -= cost
+            self.groups.append([seat, self.homes[seat], self.turn + turns, 1, damage, shield, 100., cost, speed])
+        elif kind == MOVE:
+            group = self.groups[action[1]]
+            distance = self.distances[group[BODY] * self.size + action[2]]
+            group[BODY] = action[2]
+            group[ARRIVAL] = self.turn + max(math.ceil(distance / group[SPEED]), 1)
+
+    def random_action(self, seat, rng):
+        """
+        :param rng: random.Random object
+        :return: one of the seat's commands, picked at random: first what kind of command, then which one
+        """
+
+        kinds = [END]
+        if any(self.room):
+            kinds.append(ESTABLISH)
+        affordable = [index for index, build in enumerate(self.builds) if build[0] <= self.resources[seat]]
+        if affordable and self.homes[seat] is not None:
+            kinds.append(PURCHASE)
+        idle = [index for index, group in enumerate(self.groups) if group[SEAT] == seat and group[ARRIVAL] <= self.turn]
+        if idle:
+            kinds.append(MOVE)
+        kind = rng.choice(kinds)
+        if kind == ESTABLISH:
+            return ESTABLISH, rng.choice([body for body, room in enumerate(self.room) if room > 0])
+        if kind == PURCHASE:
+            return PURCHASE, rng.choice(affordable)
+        if kind == MOVE:
+            group = rng.choice(idle)
+            targets = [target for target in self.targets(seat) if target != self.groups[group][BODY]]
+            if targets:
+                return MOVE, group, rng.choice(targets)
+        return (END,)
+
+    def play_turn(self, seat, rng):
+        """
+        Gives up to ROLLOUT_COMMANDS random commands for the seat.
+        """
+
+        for _ in range(ROLLOUT_COMMANDS):
+            action = self.random_action(seat, rng)
+            if action[0] == END:
+                return
+            self.apply(seat, action)
+
+    def end_turn(self):
+        """
+        Moves on to the next turn: every seat collects its income, and groups of different seats at the same body
+        fight one round.
+        """
+
+        self.turn += 1
+        for seat, income in enumerate(self.income):
+            self.resources[seat] += income
+            self.net_worth[seat] += income
+
+        at = dict()
+        for group in self.groups:
+            if group[ARRIVAL] <= self.turn:
+                at.setdefault(group[BODY], []).append(group)
+        destroyed = False
+        for here in at.values():
+            if len(here) < 2:
+                continue
+            damage = dict()
+            ships = dict()
+            for group in here:
+                damage[group[SEAT]] = damage.get(group[SEAT], 0) + group[FIRE]
+                ships[group[SEAT]] = ships.get(group[SEAT], 0) + group[SHIPS]
+            if len(damage) < 2:
+                continue
+            total = sum(damage.values())
+            for group in here:
+                seat = group[SEAT]
+                group[HULL] -= (total - damage[seat]) / (len(damage) - 1) / ships[seat] * group[SHIELD]
+                if group[HULL] <= 0:
+                    self.net_worth[seat] -= group[VALUE]
+                    destroyed = True
+        if destroyed:
+            self.groups = [group for group in self.groups if group[HULL] > 0]
+
+    def play_out(self, seat, rng):
+        """
+        Plays the rest of the turn after the seat has given its commands, then ROLLOUT_TURNS - 1 more turns, at random.
+        :return: float from 0 to 1, the seat's score at the end (see score())
+        """
+
+        for other in range(seat + 1, len(self.homes)):
+            self.play_turn(other, rng)
+        self.end_turn()
+        for _ in range(ROLLOUT_TURNS - 1):
+            for other in range(len(self.homes)):
+                self.play_turn(other, rng)
+            self.end_turn()
+        return self.score(seat)
+
+    def score(self, seat):
+        """
+        :return: float from 0 to 1, more the further the seat's net worth is ahead of the richest other seat's
+        """
+
+        lead = self.net_worth[seat] - max((worth for other, worth in enumerate(self.net_worth) if other != seat),
+                                          default=0)
+        return 1 / (1 + math.exp(-lead / SCORE_SCALE))
+
+
+def build_stats(build):
+    """
+    :param build: Build object
+    :return: tuple of (cost, turns, damage, shield, speed) of a ship of the build, as Position.builds holds them
+    """
+
+    return (economy.cost(build), build.turns,
+            100 * (combat.HIT_CHANCE + build.parts.get('targeting', 0) / combat.TARGETING_SCALE),
+            combat.SHIELD_SCALE / (combat.SHIELD_SCALE + build.parts.get('shield generator', 0)),
+            1 + build.parts.get('hyperdrive', 0) / 100)
+
+
+def build_site(player):
+    """
+    :return: the Colony object the player builds its ships at: the one with the most fleets docked, or None if the
+    player has no colonies
+    """
+
+    return max(player.owned_colonies.values(), key=lambda colony: len(colony.docked), default=None)
+
+
+def position(game):
+    """
+    Boils a game down to a Position.
+    :param game: Game object
+    :return: tuple of (Position, list of the Fleet object of each group, or None for ships still being built, list of
+    the build site of each seat (see build_site()))
+    """
+
+    registry = game.system.registry
+    table = game.system.travel()
+    seats = {id(player): seat for seat, player in enumerate(game.players)}
+    builds = list(ds.builds.values())
+    stats = {id(build): build_stats(build) for build in builds}
+
+    groups = []
+    fleets = []
+    for seat, player in enumerate(game.players):
+        for fleet in player.owned_fleets.values():
+            store = fleet.members.store
+            rows = fleet.members.rows
+            if not rows:
+                continue
+            location = fleet.location
+            if isinstance(location, ds.Orbit):
+                body, arrival = registry.id_of(location.destination), location.arrival
+            else:
+                body, arrival = registry.id_of(body_at(registry, location)), game.turn
+            ship_stats = [stats.get(id(build)) or build_stats(build)
+                          for build in map(store.builds.__getitem__, map(store.build_ids.__getitem__, rows))]
+            groups.append([seat, body, arrival, len(rows),
+                           sum(store.attack[row] / 100 * found[2] for row, found in zip(rows, ship_stats)),
+                           sum(found[3] for found in ship_stats) / len(rows),
+                           sum(map(store.hull.__getitem__, rows)) / len(rows),
+                           sum(found[0] for found in ship_stats), fleet_speed(fleet)])
+            fleets.append(fleet)
+    for turn, (player, build, name, site, joining) in game.scheduler.pending(BUILD):
+        cost, _, damage, shield, speed = stats.get(id(build)) or build_stats(build)
+        groups.append([seats[id(player)], registry.id_of(site.body), turn, 1, damage, shield, 100., cost, speed])
+        fleets.append(None)
+
+    sites = [build_site(player) for player in game.players]
+    homes = [None if site is None else registry.id_of(site.body) for site in sites]
+    state = Position(game.turn, [max(body.area - len(body.colonies), 0) for body in registry.bodies],
+                     table.distances, table.size, homes,
+                     [player.resources for player in game.players], [player.income for player in game.players],
+                     [player.net_worth for player in game.players], groups, [stats[id(build)] for build in builds],
+                     ds.Colony.prod_per_turn)
+    return state, fleets, sites
+
+
+class Node:
+    """
+    One command in the search tree, with the commands that can follow it that have not been tried yet.
+    """
+
+    __slots__ = ('action', 'children', 'untried', 'visits', 'total')
+
+    def __init__(self, action, untried):
+        self.action = action
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.total = 0.
+
+
+def search(state, seat, actions, budget, iterations=None, seed=None, given=0):
+    """
+    Searches the commands the seat could give next. This is what each worker runs.
+    :param state: Position object
+    :param actions: list of the commands to choose from
+    :param budget: float, seconds to search for, if iterations is None
+    :param iterations: int, number of rollouts to run, or None to run as many as budget allows
+    :param given: int, commands the seat has given this turn already
+    :return: dict of each command tried to how many times it was searched
+    """
+
+    rng = rand.Random(seed)
+    root = Node(None, list(actions))
+    deadline = time.perf_counter() + budget
+    done = 0
+    while (done < iterations) if iterations is not None else (done == 0 or time.perf_counter() < deadline):
+        current = state.copy()
+        node = root
+        path = [root]
+        depth = given
+        while not node.untried and node.children:
+            scale = EXPLORATION * math.sqrt(math.log(node.visits))
+            node = max(node.children, key=lambda child: child.total / child.visits + scale / math.sqrt(child.visits))
+            current.apply(seat, node.action)
+            path.append(node)
+            depth += 1
+        if node.untried:
+            action = node.untried.pop(rng.randrange(len(node.untried)))
+            current.apply(seat, action)
+            depth += 1
+            child = Node(action, [] if action[0] == END or depth >= MAX_COMMANDS else current.actions(seat))
+            node.children.append(child)
+            path.append(child)
+        score = current.play_out(seat, rng)
+        for visited in path:
+            visited.visits += 1
+            visited.total += score
+        done += 1
+    return {child.action: child.visits for child in root.children}
+
+
+def pool(workers):
+    """
+    :return: ProcessPoolExecutor of workers processes, started the first time it is asked for and kept after that
+    """
+
+    found = _pools.get(workers)
+    if found is None:
+        found = _pools[workers] = ProcessPoolExecutor(workers)
+    return found
+
+
+class Opponent:
+    """
+    Chooses the commands of one computer player. budget, workers and iterations are as for search(), with budget and
+    workers defaulting to BUDGET and WORKERS. given counts the commands given since the player last ended a turn.
+    """
+
+    def __init__(self, budget=None, workers=None, iterations=None, seed=None):
+        self.budget = BUDGET if budget is None else budget
+        self.workers = WORKERS if workers is None else workers
+        self.iterations = iterations
+        self.rng = rand.Random(seed)
+        self.given = 0
+
+    def first_colony(self, game):
+        """
+        :return: str, name of the body with the most room for colonies
+        """
+
+        return max(game.system.registry.bodies, key=lambda body: body.area - len(body.colonies)).name
+
+    def colony_name(self, game, player):
+        """
+        :return: str, the player's name, "colony" and the first number that makes a name not yet taken in the game's
+        system, so that computer players do not need a colony name library
+        """
+
+        taken = gen.used_names(game.system)
+        number = len(player.owned_colonies) + 1
+        while player.name + ' colony ' + str(number) in taken:
+            number += 1
+        return player.name + ' colony ' + str(number)
+
+    def command(self, game, player):
+        """
+        :param game: Game object
+        :param player: Player object this opponent plays
+        :return: str, the player's next command, as a person would type it
+        """
+
+        if self.given >= MAX_COMMANDS:
+            self.given = 0
+            return 'end'
+        seat = game.players.index(player)
+        state, fleets, sites = position(game)
+        actions = [action for action in state.actions(seat) if self.allowed(game, player, fleets, action)]
+        action = actions[0] if len(actions) == 1 else self.choose(state, seat, actions)
+        self.given = 0 if action[0] == END else self.given + 1
+        return self.text(game, player, fleets, sites[seat], action)
+
+    def allowed(self, game, player, fleets, action):
+        """
+        :return: bool, False for commands the real game would turn down
+        """
+
+        if action[0] == PURCHASE:
+            return economy.can_afford(player, list(ds.builds.values())[action[1]])
+        if action[0] == MOVE:
+            fleet = fleets[action[1]]
+            if fleet is None or isinstance(fleet.location, ds.Orbit):
+                return False
+            return game.movement.trip(fleet, game.system.registry.body(action[2])).problem() is None
+        return True
+
+    def choose(self, state, seat, actions):
+        """
+        :return: the command of actions searched the most
+        """
+
+        if self.workers <= 1:
+            found = [search(state, seat, actions, self.budget, self.iterations, self.rng.getrandbits(64), self.given)]
+        else:
+            share = None if self.iterations is None else -(-self.iterations // self.workers)
+            futures = [pool(self.workers).submit(search, state, seat, actions, self.budget, share,
+                                                 self.rng.getrandbits(64), self.given) for _ in range(self.workers)]
+            found = [future.result() for future in futures]
+        visits = [sum(counts.get(action, 0) for counts in found) for action in actions]
+        return actions[visits.index(max(visits))]
+
+    def text(self, game, player, fleets, site, action):
+        """
+        :return: str, the command for action
+        """
+
+        registry = game.system.registry
+        if action[0] == ESTABLISH:
+            return 'establish ' + registry.body(action[1]).name + ' named ' + self.colony_name(game, player)
+        if action[0] == PURCHASE:
+            build = list(ds.builds.values())[action[1]]
+            return ('purchase ' + build.name + ' at ' + site.name +
+                    (' joining ' + next(iter(site.docked)) if site.docked else ''))
+        if action[0] == MOVE:
+            return 'move fleet ' + fleets[action[1]].name + ' to ' + registry.body(action[2]).name
+        return 'end'
+
+
+def play_computers(players=4, turns=20, budget=None, workers=None, seed=None):
+    """
+    Plays a whole game between computer players in a random system, without printing anything.
+    :param players: int, from 2 to 8
+    :param turns: int, turns to play
+    :param budget: float, seconds each computer player searches for each command, or None for BUDGET
+    :param workers: int, processes each computer player searches in, or None for WORKERS
+    :param seed: seed for the game
+    :return: the Game object at the end
+    """
+
+    global BUDGET, WORKERS
+    previous = BUDGET, WORKERS
+    BUDGET = previous[0] if budget is None else budget
+    WORKERS = previous[1] if workers is None else workers
+    try:
+        return ds.run_headless(['new', str(players), str(players), 'yes', 'no', 'Sim', 'no', str(turns)], seed)
+    finally:
+        BUDGET, WORKERS = previous
+
+
+if __name__ == '__main__':
+    # As in distant_skies.py, play through the module as the game imports it
+    import opponents
+    player_count = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    turn_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else BUDGET
+    worker_count = int(sys.argv[4]) if len(sys.argv) > 4 else WORKERS
+    began = time.perf_counter()
+    finished = opponents.play_computers(player_count, turn_count, seconds, worker_count)
+    elapsed = time.perf_counter() - began
+    for rank, ranked in enumerate(economy.leaderboard(finished.players), 1):
+        print(str(rank) + '. ' + ranked.name + ': ' + str(ranked.net_worth) + ' net worth, ' +
+              str(len(ranked.owned_colonies)) + ' colonies, ' + str(len(ranked.ships)) + ' ships')
+    print(str(player_count) + ' computer players, ' + str(turn_count) + ' turns in ' + str(round(elapsed, 2)) + ' s')
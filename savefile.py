@@ -0,0 +1,534 @@
+"""
+File: Distant Skies (save file)
+Description: Reads and writes the binary save format for a whole Game.
+
+A save file is the magic bytes, a version number, and then a stream of records. Every record is a one byte tag, the
+length of its payload, and the payload itself. Payloads are columns of fixed-size numbers (little-endian), so they pack
+and unpack straight from array objects. Each object is written once and is referred to by its position in its table
+(planets, moons, players, colonies, fleets, builds). Names that repeat go in a string table, and string records are
+written just before the first record that needs them; ship names are stored inline with their ships. Ships are
+written in chunks, so neither the writer nor the reader ever holds more than one chunk of raw bytes. Ships still being
+built are written last, as the orders that will finish them.
+"""
+
+import distant_skies as ds
+import economy
+from array import array
+import functools
+import gc
+from itertools import groupby
+import opponents
+import ships
+import struct
+import sys
+
+
+MAGIC = b'DSKY'
+VERSION = 5
+HEADER = struct.Struct('<4sH')
+RECORD = struct.Struct('<cI')
+COUNT = struct.Struct('<I')
+CHUNK_SIZE = 8192
+
+GAME = b'G'
+STRINGS = b'T'
+BUILDS = b'B'
+SYSTEM = b'Y'
+PLANETS = b'P'
+MOONS = b'M'
+PLAYERS = b'L'
+COLONIES = b'C'
+COLONY_LINKS = b'K'
+FLEETS = b'F'
+FLEET_LINKS = b'D'
+SHIPS = b'H'
+ORDERS = b'O'
+END = b'Z'
+
+# Colony and fleet links say which dict on which holder an object sits in
+BODY_COLONIES = 0
+OWNED_COLONIES = 1
+OWNED_FLEETS = 0
+DOCKED = 1
+
+# Added to a player's seat flag for computer players
+COMPUTER = 2
+
+# Fleet location kinds
+NOWHERE = 0
+AT_BODY = 1
+AT_COLONY = 2
+IN_ORBIT = 3
+
+_swap = sys.byteorder != 'little'
+
+
+def _pack(*columns):
+    """
+    :param columns: arrays of equal length
+    :return: bytes holding the row count followed by every column
+    """
+
+    data = [COUNT.pack(len(columns[0]) if columns else 0)]
+    for column in columns:
+        if _swap:
+            column = array(column.typecode, column)
+            column.byteswap()
+        data.append(column.tobytes())
+    return b''.join(data)
+
+
+def _unpack(payload, typecodes):
+    """
+    Reads back what _pack wrote.
+    :param payload: bytes of one record
+    :param typecodes: str, one array typecode per column
+    :return: list of arrays, then the offset where the columns end
+    """
+
+    count = COUNT.unpack_from(payload)[0]
+    offset = COUNT.size
+    columns = []
+    for typecode in typecodes:
+        column = array(typecode)
+        size = column.itemsize * count
+        column.frombytes(payload[offset:offset + size])
+        if _swap:
+            column.byteswap()
+        columns.append(column)
+        offset += size
+    return columns, offset
+
+
+def _paused_gc(function):
+    """
+    Turns the cycle collector off while function runs. Saving and loading create or walk every object in the game at
+    once, and letting the collector rescan them all partway through costs more than the whole load.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if enabled:
+                gc.enable()
+
+    return wrapper
+
+
+def _join(strings):
+    """
+    :param strings: list of str
+    :return: bytes holding the count and the strings joined by null characters
+    """
+
+    text = '\0'.join(strings)
+    if text.count('\0') != max(len(strings) - 1, 0):
+        raise ValueError('Names in a save file cannot contain null characters.')
+    return COUNT.pack(len(strings)) + text.encode('utf-8')
+
+
+def _split(payload, encoded=False):
+    """
+    Reads back what _join wrote.
+    :param encoded: bool, give the strings as UTF-8 bytes rather than decoding them
+    """
+
+    count = COUNT.unpack_from(payload)[0]
+    if not count:
+        return []
+    if encoded:
+        return payload[COUNT.size:].split(b'\0')
+    return payload[COUNT.size:].decode('utf-8').split('\0')
+
+
+class _Writer:
+
+    def __init__(self, file):
+        self.file = file
+        self.string_ids = dict()
+        self.new_strings = []
+
+    def string(self, value):
+        try:
+            return self.string_ids[value]
+        except KeyError:
+            index = len(self.string_ids)
+            self.string_ids[value] = index
+            self.new_strings.append(value)
+            return index
+
+    def record(self, tag, payload):
+        if self.new_strings:
+            strings = self.new_strings
+            self.new_strings = []
+            self.record(STRINGS, _join(strings))
+        self.file.write(RECORD.pack(tag, len(payload)))
+        self.file.write(payload)
+
+
+def _location_of(location, body_ids, colony_ids):
+    if location is None:
+        return NOWHERE, -1, -1, 0, 0
+    if isinstance(location, ds.Orbit):
+        return (IN_ORBIT, body_ids[id(location.origin)], body_ids[id(location.destination)], location.departed,
+                location.arrival)
+    if isinstance(location, ds.Colony):
+        return AT_COLONY, colony_ids[id(location)], -1, 0, 0
+    return AT_BODY, body_ids[id(location)], -1, 0, 0
+
+
+@_paused_gc
+def dump(game, file):
+    """
+    Writes a Game to an open binary file.
+    :param game: Game object
+    :param file: file object opened for binary writing
+    """
+
+    writer = _Writer(file)
+    string = writer.string
+    system = game.system
+    file.write(HEADER.pack(MAGIC, VERSION))
+    writer.record(GAME, _pack(array('q', [game.turn]), array('q', [game.saves])))
+
+    # Bodies: planets first, then every moon in planet order
+    planets = system.planets
+    moons = [moon for planet in planets for moon in planet.moons]
+    bodies = planets + moons
+    body_ids = {id(body): index for index, body in enumerate(bodies)}
+
+    stars = array('H', sorted(star.temp for star in system.stars))
+    writer.record(SYSTEM, COUNT.pack(string(system.name)) + _pack(stars))
+    writer.record(PLANETS, _pack(array('I', [string(planet.name) for planet in planets]),
+                                 array('I', [planet.area for planet in planets]),
+                                 array('I', [len(planet.moons) for planet in planets])))
+    writer.record(MOONS, _pack(array('I', [string(moon.name) for moon in moons]),
+                               array('I', [moon.area for moon in moons])))
+
+    # Players in the game come first, in seat order. Players only reached through an owner come after them.
+    players = list(game.players)
+    player_ids = {id(player): index for index, player in enumerate(players)}
+
+    def player_id(player):
+        if player is None:
+            return -1
+        try:
+            return player_ids[id(player)]
+        except KeyError:
+            player_ids[id(player)] = len(players)
+            players.append(player)
+            return player_ids[id(player)]
+
+    colonies = []
+    colony_ids = dict()
+    colony_links = []
+
+    def add_colony(kind, holder, key, colony):
+        if id(colony) not in colony_ids:
+            colony_ids[id(colony)] = len(colonies)
+            colonies.append(colony)
+        colony_links.append((kind, holder, string(key), colony_ids[id(colony)]))
+
+    for index, body in enumerate(bodies):
+        for key, colony in body.colonies.items():
+            add_colony(BODY_COLONIES, index, key, colony)
+    for index in range(len(game.players)):
+        for key, colony in players[index].owned_colonies.items():
+            add_colony(OWNED_COLONIES, index, key, colony)
+    colony_owners = array('i', [player_id(colony.owner) for colony in colonies])
+
+    fleets = []
+    fleet_ids = dict()
+    fleet_links = []
+
+    def add_fleet(kind, holder, key, fleet):
+        if id(fleet) not in fleet_ids:
+            fleet_ids[id(fleet)] = len(fleets)
+            fleets.append(fleet)
+        fleet_links.append((kind, holder, string(key), fleet_ids[id(fleet)]))
+
+    index = 0
+    while index < len(players):
+        for key, fleet in players[index].owned_fleets.items():
+            add_fleet(OWNED_FLEETS, index, key, fleet)
+        index += 1
+    for index, colony in enumerate(colonies):
+        for key, fleet in colony.docked.items():
+            add_fleet(DOCKED, index, key, fleet)
+    fleet_owners = array('i', [player_id(fleet.owner) for fleet in fleets])
+
+    writer.record(PLAYERS, _pack(array('I', [string(player.name) for player in players]),
+                                 array('q', [player.net_worth for player in players]),
+                                 array('B', [(index < len(game.players)) | (COMPUTER if player.opponent else 0)
+                                             for index, player in enumerate(players)]),
+                                 array('q', [player.resources for player in players])))
+    writer.record(COLONIES, _pack(array('I', [string(colony.name) for colony in colonies]),
+                                  colony_owners,
+                                  array('q', [colony.prod_per_turn for colony in colonies])))
+    writer.record(COLONY_LINKS, _pack(*(array(typecode, column) for typecode, column in
+                                        zip('BIII', zip(*colony_links) if colony_links else ([], [], [], [])))))
+
+    locations = [_location_of(fleet.location, body_ids, colony_ids) for fleet in fleets]
+    writer.record(FLEETS, _pack(array('I', [string(fleet.name) for fleet in fleets]),
+                                fleet_owners,
+                                *(array(typecode, column) for typecode, column in
+                                  zip('Biiqq', zip(*locations) if locations else ([], [], [], [], [])))))
+    writer.record(FLEET_LINKS, _pack(*(array(typecode, column) for typecode, column in
+                                       zip('BIII', zip(*fleet_links) if fleet_links else ([], [], [], [])))))
+
+    # Builds are shared by many ships, so each is written once. Ship columns are copied straight out of the ship
+    # store rows of each fleet (see ships.py), without making a Ship object per ship.
+    builds = []
+    build_ids = dict()
+    ship_fleets = array('I')
+    ship_builds = array('I')
+    parents = array('I')
+    fuels = array('f')
+    charges = array('f')
+    attacks = array('f')
+    hulls = array('f')
+    ship_names = []
+    # Consecutive fleets almost always share a store, so their rows are gathered and copied out together
+    segments = []
+    for index, fleet in enumerate(fleets):
+        store = fleet.members.store
+        if not segments or segments[-1][0] is not store:
+            segments.append((store, array('I')))
+        segments[-1][1].extend(fleet.members.rows)
+        ship_fleets.extend(array('I', [index]) * len(fleet.members.rows))
+    for store, rows in segments:
+        for build in store.builds:
+            if id(build) not in build_ids:
+                build_ids[id(build)] = len(builds)
+                builds.append(build)
+        saved_builds = [build_ids[id(build)] for build in store.builds]
+        saved_strings = [string(parent) for parent in store.strings]
+        read = ships.gatherer(rows)
+        ship_builds.extend(array('I', map(saved_builds.__getitem__, read(store.build_ids))))
+        parents.extend(array('I', map(saved_strings.__getitem__, read(store.parent_ids))))
+        fuels.extend(read(store.fuel))
+        charges.extend(read(store.drive_charge))
+        attacks.extend(read(store.attack))
+        hulls.extend(read(store.hull))
+        ship_names.extend(store.names_of(rows))
+    orders = [(turn, order) for turn, order in game.scheduler.pending(ds.BUILD) if id(order[3]) in colony_ids]
+    for _, (_, build, _, _, _) in orders:
+        if id(build) not in build_ids:
+            build_ids[id(build)] = len(builds)
+            builds.append(build)
+    part_counts = array('I', [len(build.parts) for build in builds])
+    part_names = array('I', [string(part) for build in builds for part in build.parts])
+    part_values = array('d', [value for build in builds for value in build.parts.values()])
+    part_floats = array('B', [isinstance(value, float) for build in builds for value in build.parts.values()])
+    writer.record(BUILDS, _pack(array('I', [string(build.name) for build in builds]), part_counts,
+                                array('q', [build.turns for build in builds])) +
+                  _pack(part_names, part_values, part_floats))
+
+    # Ships, one chunk at a time. A ship belongs to exactly one fleet, so each is written with the fleet it is in.
+    for start in range(0, len(ship_names), CHUNK_SIZE):
+        end = start + CHUNK_SIZE
+        writer.record(SHIPS, _pack(ship_fleets[start:end], ship_builds[start:end], parents[start:end],
+                                   fuels[start:end], charges[start:end], attacks[start:end], hulls[start:end]) +
+                      _join(ship_names[start:end]))
+
+    writer.record(ORDERS, _pack(array('q', [turn for turn, _ in orders]),
+                                array('i', [player_id(order[0]) for _, order in orders]),
+                                array('I', [build_ids[id(order[1])] for _, order in orders]),
+                                array('I', [string(order[2]) for _, order in orders]),
+                                array('I', [colony_ids[id(order[3])] for _, order in orders]),
+                                array('i', [-1 if order[4] is None else string(order[4]) for _, order in orders])))
+
+    writer.record(END, b'')
+
+
+def _records(file):
+    """
+    Yields (tag, payload) for each record in the file, reading one record at a time.
+    """
+
+    while True:
+        head = file.read(RECORD.size)
+        if len(head) < RECORD.size:
+            raise ValueError('The save file ends before its last record.')
+        tag, size = RECORD.unpack(head)
+        payload = file.read(size)
+        if len(payload) < size:
+            raise ValueError('The save file ends in the middle of a record.')
+        if tag == END:
+            return
+        yield tag, payload
+
+
+@_paused_gc
+def load(file):
+    """
+    Reads a Game from an open binary file written by dump().
+    :param file: file object opened for binary reading
+    :return: Game object
+    """
+
+    magic, version = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('This is not a Distant Skies save file.')
+    if version > VERSION:
+        raise ValueError('This save file was made by a newer version of Distant Skies (format ' + str(version) + ').')
+
+    turn = 0
+    saves = 0
+    strings = []
+    builds = []
+    system = None
+    bodies = []
+    players = []
+    seated = []
+    colonies = []
+    fleets = []
+    orders = []
+
+    # The loaded game gets a ship store of its own, which becomes the one new ships go in
+    store = ships.ShipStore()
+    ships.use_store(store)
+
+    for tag, payload in _records(file):
+        if tag == GAME:
+            (turns, save_counts), _ = _unpack(payload, 'qq')
+            turn = turns[0]
+            saves = save_counts[0]
+
+        elif tag == STRINGS:
+            strings.extend(_split(payload))
+
+        elif tag == SYSTEM:
+            name = strings[COUNT.unpack_from(payload)[0]]
+            (temps,), _ = _unpack(payload[COUNT.size:], 'H')
+            system = ds.System(frozenset(ds.Star(temp) for temp in temps), [], name)
+
+        elif tag == PLANETS:
+            (names, areas, moon_counts), _ = _unpack(payload, 'III')
+            for name, area in zip(names, areas):
+                planet = ds.Planet(strings[name], area, [])
+                system.planets.append(planet)
+                bodies.append(planet)
+            parents = [planet for planet, count in zip(system.planets, moon_counts) for _ in range(count)]
+
+        elif tag == MOONS:
+            (names, areas), _ = _unpack(payload, 'II')
+            for parent, name, area in zip(parents, names, areas):
+                moon = ds.Moon(strings[name], area)
+                parent.moons.append(moon)
+                bodies.append(moon)
+
+        elif tag == PLAYERS:
+            if version >= 3:
+                (names, worths, in_game, resources), _ = _unpack(payload, 'IqBq')
+            else:
+                (names, worths, in_game), _ = _unpack(payload, 'IqB')
+                resources = [0] * len(names)
+            for name, worth, seat, stock in zip(names, worths, in_game, resources):
+                player = ds.Player(strings[name], worth, stock)
+                if seat & COMPUTER:
+                    player.opponent = opponents.Opponent()
+                players.append(player)
+                if seat:
+                    seated.append(player)
+
+        elif tag == COLONIES:
+            (names, owners, production), _ = _unpack(payload, 'Iiq')
+            for name, owner, prod in zip(names, owners, production):
+                colonies.append(ds.Colony(players[owner] if owner >= 0 else None, strings[name], prod_per_turn=prod))
+
+        elif tag == COLONY_LINKS:
+            for kind, holder, key, colony in zip(*_unpack(payload, 'BIII')[0]):
+                if kind == BODY_COLONIES:
+                    bodies[holder].colonies[strings[key]] = colonies[colony]
+                    colonies[colony].body = bodies[holder]
+                else:
+                    players[holder].owned_colonies[strings[key]] = colonies[colony]
+
+        elif tag == FLEETS:
+            if version >= 2:
+                (names, owners, kinds, firsts, seconds, departures, arrivals), _ = _unpack(payload, 'IiBiiqq')
+            else:
+                # Before version 2 fleets in flight had no arrival turn, and nothing ever landed them
+                (names, owners, kinds, firsts, seconds), _ = _unpack(payload, 'IiBii')
+                departures = [turn] * len(names)
+                arrivals = [turn + 1] * len(names)
+            for name, owner, kind, first, second, departed, arrival in zip(names, owners, kinds, firsts, seconds,
+                                                                           departures, arrivals):
+                if kind == AT_BODY:
+                    location = bodies[first]
+                elif kind == AT_COLONY:
+                    location = colonies[first]
+                elif kind == IN_ORBIT:
+                    location = ds.Orbit(bodies[first], bodies[second], departed, arrival)
+                else:
+                    location = None
+                fleets.append(ds.Fleet(strings[name], players[owner] if owner >= 0 else None, location))
+
+        elif tag == FLEET_LINKS:
+            for kind, holder, key, fleet in zip(*_unpack(payload, 'BIII')[0]):
+                if kind == OWNED_FLEETS:
+                    # Saves from before fleets were keyed by lower-case names have the names as they are
+                    players[holder].owned_fleets[strings[key].lower()] = fleets[fleet]
+                else:
+                    colonies[holder].docked[strings[key].lower()] = fleets[fleet]
+
+        elif tag == BUILDS:
+            if version >= 3:
+                (names, part_counts, build_turns), offset = _unpack(payload, 'IIq')
+            else:
+                (names, part_counts), offset = _unpack(payload, 'II')
+                build_turns = [0] * len(names)
+            (part_names, part_values, part_floats), _ = _unpack(payload[offset:], 'IdB')
+            position = 0
+            for name, count, turns in zip(names, part_counts, build_turns):
+                parts = dict()
+                for part in range(position, position + count):
+                    value = part_values[part]
+                    parts[strings[part_names[part]]] = value if part_floats[part] else int(value)
+                position += count
+                builds.append(ds.Build(strings[name], parts, turns))
+
+        elif tag == SHIPS:
+            if version >= 4:
+                # Before version 5 the numbers were doubles
+                numbers = 'f' if version >= 5 else 'd'
+                (ship_fleets, build_ids, parents, fuels, charges, attacks, hulls), offset = _unpack(payload,
+                                                                                                   'III' + numbers * 4)
+            else:
+                (ship_fleets, build_ids, parents, fuels, charges, attacks), offset = _unpack(payload, 'IIIddd')
+                hulls = None
+            stored_builds = [store.build_id(build) for build in builds]
+            if stored_builds != list(range(len(builds))):
+                build_ids = array('I', map(stored_builds.__getitem__, build_ids))
+            # Many ships share a parent fleet name, so each name is looked up in the store once
+            stored_parents = {parent: store.string_id(strings[parent]) for parent in set(parents)}
+            rows = store.add_many(_split(payload[offset:], encoded=True), build_ids,
+                                  array('I', map(stored_parents.__getitem__, parents)), fuels, charges, attacks, hulls)
+            # dump() writes the ships of a fleet one after another, so their rows are added a run at a time
+            position = rows.start
+            for fleet, run in groupby(ship_fleets):
+                count = len(list(run))
+                fleets[fleet].members.rows.extend(range(position, position + count))
+                position += count
+
+        elif tag == ORDERS:
+            orders.extend(zip(*_unpack(payload, 'qiIIIi')[0]))
+
+    system.registry.rebuild()
+    for player in players:
+        player.reindex()
+    game = ds.Game(system, seated, turn, saves)
+    for due, player, build, name, build_site, joining in orders:
+        player = players[player]
+        game.scheduler.at(due, ds.BUILD, player, builds[build], strings[name], colonies[build_site],
+                          None if joining < 0 else strings[joining])
+        player.ordered[strings[name].lower()] = builds[build]
+    builds_by_name = {build.name: build for build in builds}
+    for player in players:
+        economy.recount(player, builds_by_name)
+    return game
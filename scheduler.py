@@ -0,0 +1,92 @@
+"""
+File: Distant Skies (scheduler)
+Description: Turn-keyed event queue.
+
+Anything that happens on a later turn (a fleet arriving, a ship being finished, colonies producing) is put in the
+Scheduler as an event for that turn. Ending a turn pops only the events that are due, so its cost grows with what is
+happening, not with how many colonies and fleets there are. Events that fall on the same turn run in order of kind
+(ARRIVE, then BUILD, then PRODUCE) and then in the order they were scheduled, and all the events of one kind on one
+turn are handed to its handler together.
+"""
+
+import heapq
+
+
+ARRIVE = 0
+BUILD = 1
+PRODUCE = 2
+# Not scheduled: distant_skies.end_turn() reports the battles it fought after the events under this kind
+COMBAT = 3
+
+
+class Scheduler:
+    """
+    The heap holds one (turn, kind) key for each turn and kind that has events, and batches maps each key to the list
+    of its events, so a turn with thousands of arrivals costs one heap pop rather than thousands.
+    """
+
+    def __init__(self):
+        self.queue = []
+        self.batches = dict()
+        self.handlers = dict()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def handle(self, kind, handler):
+        """
+        :param kind: int, ARRIVE, BUILD or PRODUCE
+        :param handler: function taking the turn and a list of the arguments of every due event of that kind, in the
+        order they were scheduled. Whatever it returns is passed back by run().
+        """
+
+        self.handlers[kind] = handler
+
+    def at(self, turn, kind, *args):
+        """
+        Schedules an event.
+        :param turn: int, turn the event happens at the start of
+        :param kind: int, ARRIVE, BUILD or PRODUCE
+        :param args: details of the event for its handler
+        """
+
+        key = (turn, kind)
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = self.batches[key] = []
+            heapq.heappush(self.queue, key)
+        batch.append(args)
+        self._count += 1
+
+    def pending(self, kind):
+        """
+        :param kind: int
+        :return: list of (turn, args) of the events of that kind still to come, soonest first
+        """
+
+        return [(turn, args) for turn, event_kind in sorted(self.batches) if event_kind == kind
+                for args in self.batches[turn, event_kind]]
+
+    def next_turn(self):
+        """
+        :return: int, turn of the next event, or None if nothing is scheduled
+        """
+
+        return self.queue[0][0] if self.queue else None
+
+    def run(self, turn):
+        """
+        Runs every event due on or before turn.
+        :param turn: int, the turn that has just begun
+        :return: list of (kind, what its handler returned), one per turn and kind that had events
+        """
+
+        results = []
+        queue = self.queue
+        while queue and queue[0][0] <= turn:
+            key = heapq.heappop(queue)
+            batch = self.batches.pop(key)
+            self._count -= len(batch)
+            results.append((key[1], self.handlers[key[1]](turn, batch)))
+        return results
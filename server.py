@@ -0,0 +1,709 @@
+"""
+File: Distant Skies (server)
+Description: Hosts games over TCP, with every player at their own client (see client.py).
+
+One asyncio event loop serves every connection of every hosted game, so a single process can host hundreds of games
+without a thread per connection. Each connection is a Session coroutine that reads one line at a time; commands use the
+same commands as the console game (see commands.py), several to a line if need be, and anything a command asks for is
+asked of that player alone while everyone else carries on. Clients cannot run files of commands on the server.
+
+Instead of taking turns on one terminal, players give their orders at the same time. A turn ends once every player
+still connected has typed end, and what happened on it (arrivals, finished ships and battles) is pushed to every
+client of the game, with the new standings.
+
+Nothing blocks the loop: turns are ended, and save files put together, read back and written to disk, by the loop's
+default executor (see Table.work()), and a client that stops reading is dropped once MAX_BUFFER bytes are waiting for
+it. Server games keep no journal; the game is saved when its last player leaves, and can be picked up again by naming
+it.
+
+Usage: python server.py [port] [host]
+"""
+
+import commands
+import distant_skies as ds
+import economy
+import generation as gen
+import names
+import savefile
+from movement import body_at, fleet_speed
+from ships import ShipStore, current_store, use_store
+import asyncio
+import contextlib
+import io
+import os
+import random as rand
+import sys
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7325
+# Longest line a client may send, enough for a whole turn of orders separated by semicolons
+MAX_LINE = 8192
+# Bytes that may wait to be sent to a client before it is dropped
+MAX_BUFFER = 1 << 20
+# Connections that may wait to be accepted, so a rush of players joining is not turned away
+BACKLOG = 1024
+HELP = ('Commands: establish [body], purchase [model at colony], move fleet [fleet] [to body], '
+        'get colonies for [body], view ships [at body], standings, save, end, quit. Separate commands with ";" to give '
+        'several at once.')
+
+
+class Table:
+    """
+    One hosted game and the sessions playing it. player_count is None until whoever started the game has said how
+    many players it is for, and configured is set once they have. sessions maps the lower-case names of connected
+    players to their Session, and ended holds the lower-case names of connected players who have ended the current
+    turn. Every game has its own ShipStore, which is made current only while the game is being changed (see act()).
+
+    Ending a turn and saving can take long enough to hold up every other game on the server, so they are done in a
+    worker thread (see work()). While one is, the game belongs to it: sessions carry out their lines of commands inside
+    reading(), which waits for the work to finish, and work waits for the lines already being carried out.
+    """
+
+    def __init__(self, name, player_count, seed=None, game=None, name_library=None, store=None):
+        self.name = name
+        self.player_count = player_count
+        self.rng = rand.Random(seed)
+        self.sessions = dict()
+        self.ended = set()
+        self.configured = asyncio.Event()
+        if player_count is not None:
+            self.configured.set()
+        self.started = asyncio.Event()
+        self.gate = asyncio.Condition()
+        self.readers = 0
+        self.working = False
+        # The task ending the turn, kept so that it is not collected while it runs
+        self.ending = None
+        self.colony_names = name_library.sampler(self.rng) if name_library is not None else None
+        if game is None:
+            self.store = ShipStore()
+            self.system = gen.generate_systems(1, self.rng.getrandbits(64), compact=True).system(0, name)
+            self.system.registry.rename_system(name)
+            self.players = []
+            self.game = None
+        else:
+            self.store = store if store is not None else current_store()
+            self.system = game.system
+            self.players = game.players
+            self.game = game
+            self.started.set()
+
+    def act(self, function, *args):
+        """
+        Calls function with this game's ShipStore as the current one.
+        :return: what function returned
+        """
+
+        previous_store = use_store(self.store)
+        try:
+            return function(*args)
+        finally:
+            use_store(previous_store)
+
+    @contextlib.asynccontextmanager
+    async def reading(self):
+        """
+        Held while a session changes or looks at the game on the event loop. Any number of sessions can hold it at
+        once, but not while work() is running.
+        """
+
+        async with self.gate:
+            await self.gate.wait_for(lambda: not self.working)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            async with self.gate:
+                self.readers -= 1
+                self.gate.notify_all()
+
+    async def work(self, function, *args, reading=False):
+        """
+        Calls function as act() does, but in a worker thread, once no session is in reading() and no other work is
+        running.
+        :param reading: bool, True if the caller is in reading() itself, so that it does not wait for itself
+        :return: what function returned
+        """
+
+        async with self.gate:
+            await self.gate.wait_for(lambda: not self.working and self.readers == int(reading))
+            self.working = True
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self.act, function, *args)
+        finally:
+            async with self.gate:
+                self.working = False
+                self.gate.notify_all()
+
+    def seat(self, name):
+        """
+        :param name: str, a player name
+        :return: the Player object of that name, or None
+        """
+
+        for player in self.players:
+            if player.name.lower() == name.lower():
+                return player
+        return None
+
+    def start(self):
+        """
+        Starts the game once every seat is taken.
+        """
+
+        self.game = self.act(ds.Game, self.system, self.players)
+        self.started.set()
+        self.broadcast('Every seat is taken. The game will now begin!')
+
+    def broadcast(self, message, skip=None):
+        """
+        :param message: str, sent on its own line to every connected player
+        :param skip: Session to leave out, or None
+        """
+
+        for session in list(self.sessions.values()):
+            if session is not skip:
+                session.send(message)
+
+    def standings(self):
+        """
+        :return: str, every player's net worth, richest first
+        """
+
+        return 'Standings: ' + ', '.join(str(rank) + '. ' + ranked.name + ' (' + str(ranked.net_worth) + ')'
+                                         for rank, ranked in enumerate(economy.leaderboard(self.players), 1))
+
+    def end(self, player):
+        """
+        Marks a player as done with the turn, and ends the turn if they were the last connected player to be. The
+        turn is ended by a task of its own (see next_turn()), since the player's line of commands is still being
+        carried out.
+        """
+
+        self.ended.add(player.name.lower())
+        waiting = [self.sessions[key].player.name for key in self.sessions if key not in self.ended]
+        if waiting:
+            self.broadcast(player.name + ' has ended their turn. Waiting for ' + ', '.join(waiting) + '.')
+            return
+        self.ended.clear()
+        self.ending = asyncio.get_running_loop().create_task(self.next_turn(self.ending))
+
+    async def next_turn(self, previous):
+        """
+        Ends the game's turn off the event loop and tells everyone what happened.
+        :param previous: the task ending the turn before, which has to finish first, or None
+        """
+
+        if previous is not None:
+            await previous
+        results = await self.work(ds.end_turn, self.game)
+        async with self.reading():
+            lines = ds.describe_turn(results)
+            for line in lines + ['It is now turn ' + str(self.game.turn) + '.', self.standings()]:
+                self.broadcast(line)
+
+    def leave(self, session):
+        """
+        Takes a session off the table. If it was the last player still waiting to end the turn, the turn ends.
+        """
+
+        key = session.player.name.lower()
+        if self.sessions.get(key) is session:
+            del self.sessions[key]
+        self.ended.discard(key)
+        self.broadcast(session.player.name + ' has left the game.')
+        if self.game is not None and self.sessions and self.ended >= set(self.sessions):
+            self.end(next(iter(self.sessions.values())).player)
+
+    def colony_name(self, body):
+        """
+        :return: str, a colony name not yet taken in the system: the next one from the name library, or the body's
+        name, "colony" and the first number that makes it free
+        """
+
+        taken = gen.used_names(self.system)
+        while self.colony_names is not None and len(self.colony_names):
+            name = self.colony_names.draw()
+            if name not in taken:
+                return name
+        number = len(body.colonies) + 1
+        while body.name + ' colony ' + str(number) in taken:
+            number += 1
+        return body.name + ' colony ' + str(number)
+
+    async def save_bytes(self, reading=False):
+        """
+        :param reading: bool, as for work()
+        :return: bytes, the game as a save file, written off the event loop
+        """
+
+        buffer = io.BytesIO()
+        await self.work(savefile.dump, self.game, buffer, reading=reading)
+        return buffer.getvalue()
+
+
+def write_save(name, data):
+    """
+    Writes save data the same way generation.save_game() does. Runs in an executor, off the event loop.
+    """
+
+    path = gen.save_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as save:
+        save.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def load_save(data):
+    """
+    :param data: bytes of a save file
+    :return: tuple of (Game, the ShipStore its ships are in). Runs in an executor, off the event loop.
+    """
+
+    previous_store = current_store()
+    try:
+        game = savefile.load(io.BytesIO(data))
+        return game, current_store()
+    finally:
+        use_store(previous_store)
+
+
+def read_save(name):
+    """
+    :return: bytes of the game's save file, or None if it has none. Runs in an executor, off the event loop.
+    """
+
+    if gen.SAVE_DIRECTORY is None:
+        return None
+    try:
+        with open(gen.save_path(name), 'rb') as save:
+            return save.read()
+    except OSError:
+        return None
+
+
+class Session:
+    """
+    One connected client.
+    """
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.table = None
+        self.player = None
+        self.orders = self.command_table()
+
+    def command_table(self):
+        """
+        :return: CommandTable of the commands a client can give. Every handler is a coroutine function.
+        """
+
+        orders = commands.CommandTable(macros=False)
+        orders.register('end', 'end', self.end_turn, final=True)
+        orders.register('standings', 'standings', self.standings)
+        orders.register('save', 'save', self.save)
+        orders.register('establish', 'establish [name of body] [named colony name]', self.establish_colony,
+                        lambda command: commands.establish_arguments(self.table.system.registry, command))
+        for verb in ('get', 'view'):
+            orders.register(verb + ' colonies', verb + ' colonies for [name of body]', self.list_colonies,
+                            self.check_colonies)
+            orders.register(verb + ' ships', verb + ' ships [at name of body]', self.view_ships, self.check_ships)
+        orders.register('purchase', 'purchase [model] [at colony] [named ship name] [joining fleet]', self.purchase,
+                        lambda command: commands.purchase_arguments(self.player, command))
+        orders.register('move fleet', 'move fleet [name of fleet] [to name of body]', self.move,
+                        lambda command: commands.move_arguments(self.player, self.table.system.registry, command))
+        orders.check_lines(lambda found: commands.purchases_problem(self.player, found))
+        return orders
+
+    def send(self, message, new_line=True):
+        """
+        Queues text for the client without waiting for it to be sent. A client that has stopped reading is dropped.
+        """
+
+        if self.writer.is_closing():
+            return
+        self.writer.write((message + '\n' if new_line else message).encode())
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.writer.close()
+
+    async def ask(self, message):
+        """
+        :param message: str, the prompt
+        :return: str, the client's answer with surrounding whitespace removed
+        """
+
+        self.send(message, False)
+        await self.writer.drain()
+        try:
+            line = await self.reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise ConnectionError('Line too long.')
+        if not line:
+            raise ConnectionError('The client disconnected.')
+        return line.decode(errors='replace').strip()
+
+    async def ask_body(self, message):
+        """
+        :return: Planet or Moon object the player names, or None if they give up by answering with nothing
+        """
+
+        registry = self.table.system.registry
+        while True:
+            name = await self.ask(message)
+            if not name:
+                return None
+            body = registry.resolve(name)
+            if body is not None:
+                return body
+            close = registry.close_to(name)
+            self.send(name + ' is not a body in the ' + self.table.system.name + ' system.' +
+                      (' Did you mean ' + ', '.join(found.name for found in close) + '?' if close else ''))
+
+    async def run(self):
+        try:
+            await self.join()
+            await self.table.started.wait()
+            if not self.player.owned_colonies:
+                await self.first_colony()
+            async with self.table.reading():
+                self.send(self.table.standings())
+            self.send(HELP)
+            while True:
+                command = await self.ask('Turn ' + str(self.table.game.turn) + '> ')
+                if command.lower() in ('quit', 'stop'):
+                    break
+                found, problems = self.orders.parse(command)
+                for problem in problems:
+                    self.send(problem)
+                if problems:
+                    self.send(HELP)
+                    continue
+                async with self.table.reading():
+                    for order in found:
+                        await order.spec.handler(order)
+        except ConnectionError:
+            pass
+        finally:
+            if self.table is not None and self.player is not None:
+                self.table.leave(self)
+                await self.server.release(self.table)
+            self.writer.close()
+
+    async def join(self):
+        """
+        Asks for the game and the player's name until the client has a seat.
+        """
+
+        self.send('Welcome to Distant Skies.')
+        while self.table is None:
+            name = (await self.ask('Name of the game to join or start: ')).capitalize()
+            if not name:
+                continue
+            table = await self.server.table(name)
+            if table is None:
+                # The name is taken at once, so anyone else joining it waits for the number of players
+                table = self.server.host(name)
+                try:
+                    count = await self.ask('Nobody is playing ' + name + ' yet. Number of players (2 to 8): ')
+                    while not count.isdigit() or not 2 <= int(count) <= 8:
+                        count = await self.ask('Please input a number between 2 and 8: ')
+                except ConnectionError:
+                    del self.server.tables[name.lower()]
+                    table.configured.set()
+                    raise
+                table.player_count = int(count)
+                table.configured.set()
+            elif table.player_count is None:
+                self.send('Someone is setting up ' + table.name + '. Waiting for them...')
+                await table.configured.wait()
+                if self.server.tables.get(name.lower()) is not table:
+                    continue
+            self.table = table
+
+        while self.player is None:
+            name = await self.ask('Your name: ')
+            if not name:
+                continue
+            key = name.lower()
+            player = self.table.seat(name)
+            if key in self.table.sessions:
+                self.send(name + ' is already playing.')
+            elif player is not None:
+                self.player = player
+            elif len(self.table.players) < self.table.player_count:
+                self.player = ds.Player(name)
+                economy.grant(self.player, economy.STARTING_RESOURCES)
+                self.table.players.append(self.player)
+            else:
+                self.send('Every seat in ' + self.table.name + ' is taken. The players are ' +
+                          ', '.join(player.name for player in self.table.players) + '.')
+        self.table.sessions[self.player.name.lower()] = self
+        self.table.broadcast(self.player.name + ' has joined ' + self.table.name + '.')
+        if self.table.game is None:
+            if len(self.table.players) == self.table.player_count:
+                self.table.start()
+            else:
+                self.send('Waiting for ' + str(self.table.player_count - len(self.table.players)) + ' more players.')
+
+    async def first_colony(self):
+        while True:
+            body = await self.ask_body('Where would you like to place your first colony? ')
+            if body is None:
+                continue
+            async with self.table.reading():
+                if self.establish(body):
+                    return
+
+    def establish(self, body, name=None):
+        """
+        Founds a colony on body if it has room.
+        :param name: str, name of the colony, or None to pick one
+        :return: bool, True if the colony was founded
+        """
+
+        if len(body.colonies) >= body.area:
+            if body.area == 0:
+                self.send('You cannot establish a colony on a gas giant planet.')
+            else:
+                self.send('This body already has the maximum number of colonies.')
+            return False
+        name = name or self.table.colony_name(body)
+        if not gen.used_names(self.table.system).add(name):
+            self.send('There is already a colony called ' + name + '. Please choose another name.')
+            return False
+        colony = ds.found_colony(self.player, body, name.lower())
+        self.table.broadcast(self.player.name + ' has established ' + colony.name.capitalize() + ' on ' + body.name +
+                             '.')
+        return True
+
+    async def end_turn(self, command):
+        if self.player.name.lower() in self.table.ended:
+            self.send('You have already ended this turn.')
+        else:
+            self.table.end(self.player)
+
+    async def standings(self, command):
+        self.send(self.table.standings())
+        self.send('You have ' + str(self.player.resources) + ' resources and earn ' + str(self.player.income) +
+                  ' per turn.')
+
+    async def establish_colony(self, command):
+        body, name = command.arguments
+        if body is None:
+            found = await self.ask_body('Target body: ')
+            if found is not None:
+                self.establish(found)
+        else:
+            self.establish(self.table.system.registry.resolve(body), name)
+
+    def check_colonies(self, command):
+        before, body = command.split('for')
+        if before or not body:
+            return 'The syntax for this action is:\n> ' + command.spec.syntax
+        command.arguments = self.table.system.registry.resolve(body)
+        return commands.body_problem(self.table.system.registry, body)
+
+    async def list_colonies(self, command):
+        body = command.arguments
+        if body not in self.player.sight:
+            self.send('You cannot see ' + body.name + '. Found a colony on it or send a fleet there first.')
+            return
+        if not body.colonies:
+            self.send('This body has no colonies.')
+        for colony in body.colonies.values():
+            self.send(colony.name + ' is owned by ' + colony.owner.name + '.')
+
+    def check_ships(self, command):
+        before, body = command.split('at')
+        if before or body == '':
+            return 'The syntax for this action is:\n> ' + command.spec.syntax
+        command.arguments = body
+        return None if body is None else commands.body_problem(self.table.system.registry, body)
+
+    async def view_ships(self, command):
+        body_name = command.arguments
+        fleets = list(self.player.owned_fleets.values())
+        if body_name is not None:
+            body = self.table.system.registry.resolve(body_name)
+            if body is None:
+                self.send('Cannot find ' + body_name + ' in the ' + self.table.system.name + ' system.')
+                return
+            fleets = self.player.fleets_here(body)
+            for colony in body.colonies.values():
+                fleets += self.player.fleets_here(colony)
+        if not fleets:
+            self.send('You have no ships there.' if body_name is not None else 'You have no ships.')
+        for fleet in fleets:
+            if isinstance(fleet.location, ds.Orbit):
+                where = (', en route from ' + fleet.location.origin.name + ' to ' + fleet.location.destination.name +
+                         ', arriving on turn ' + str(fleet.location.arrival))
+            else:
+                where = ', at ' + fleet.location.name
+            for ship in fleet.members:
+                self.send(ship.name.capitalize() + ', a ' + ship.build.name + ' in ' + fleet.name + where)
+
+    async def purchase(self, command):
+        build, site, name, joining = command.arguments
+        if build is None:
+            choice = (await self.ask('Please choose a model (' + ', '.join(ds.builds) + '): ')).lower()
+            build = ds.builds.get(choice)
+            if build is None:
+                self.send('There is no model called ' + choice + '.')
+                return
+            if not economy.can_afford(self.player, build):
+                self.send('A ' + build.name + ' costs ' + str(economy.cost(build)) + ' resources, and you have ' +
+                          str(self.player.resources) + '.')
+                return
+            site = self.player.owned_colonies.get(
+                (await self.ask('Where will you construct this ship (' + ', '.join(self.player.owned_colonies) +
+                                ')? ')).lower())
+            if site is None:
+                self.send('You have no colony by that name.')
+                return
+            name = await self.ask('Ship name (leave blank for one to be picked): ')
+            if site.docked:
+                choice = await self.ask('Fleet at ' + site.name + ' to join (' +
+                                        ', '.join(fleet.name for fleet in site.docked.values()) +
+                                        '), or leave blank for a new fleet: ')
+                joining = choice.lower() if choice.lower() in site.docked else None
+        if not name:
+            number = self.player.build_counts.get(build.name, 0) + 1
+            name = build.name + str(number)
+            while name.lower() in self.player.ships or name.lower() in self.player.ordered:
+                number += 1
+                name = build.name + str(number)
+        elif name.lower() in self.player.ships or name.lower() in self.player.ordered:
+            self.send('This name is already being used for one of your ships.')
+            return
+        # The answers took time, and earlier commands of the same line may have spent resources, so check again that
+        # nothing has changed in the meantime
+        if not economy.can_afford(self.player, build):
+            self.send('A ' + build.name + ' costs ' + str(economy.cost(build)) + ' resources, and you have ' +
+                      str(self.player.resources) + '.')
+            return
+        if site.owner is not self.player:
+            self.send('The purchase could not go through.')
+            return
+        ship = self.table.act(ds.order_ship, self.table.game, self.player, build, name, site,
+                              joining if joining in site.docked else None)
+        if ship is None:
+            self.send('Purchase successful! ' + name + ' will be finished at ' + site.name + ' on turn ' +
+                      str(self.table.game.turn + build.turns) + '.')
+        else:
+            self.send('Purchase successful! ' + ship.name + ' has been added to your fleet at ' + site.name + '.')
+
+    async def move(self, command):
+        fleet, destination = command.arguments
+        system = self.table.system
+        if destination is None:
+            table = system.travel()
+            origin = body_at(system.registry, fleet.location)
+            speed = fleet_speed(fleet)
+            self.send('Nearest bodies: ' + ', '.join(body.name + ' (' + str(table.turns(origin, body, speed)) + ')'
+                                                     for _, body in table.nearest(origin, 8)))
+            destination = await self.ask_body('Please enter a destination: ')
+            if destination is None:
+                return
+        else:
+            destination = system.registry.resolve(destination)
+        if fleet.name.lower() not in self.player.owned_fleets:
+            return
+        problem = ds.start_move(self.table.game, fleet, destination)
+        if problem is None:
+            self.table.broadcast(self.player.name + '\'s ' + fleet.name + ' has left for ' + destination.name +
+                                 ' and will arrive on turn ' + str(fleet.location.arrival) + '.')
+        else:
+            self.send(problem)
+
+    async def save(self, command):
+        if gen.SAVE_DIRECTORY is None:
+            self.send('This server does not save games.')
+            return
+        data = await self.table.save_bytes(reading=True)
+        await asyncio.get_running_loop().run_in_executor(None, write_save, self.table.name, data)
+        self.send('Saved ' + self.table.name + '.')
+
+
+class Server:
+    """
+    Every game hosted by one process, by name. Colony names come from the colony name library if there is one;
+    otherwise colonies are named after their bodies.
+    """
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.tables = dict()
+        # Opened (and indexed, if need be) here, before the loop starts, rather than by the first game to need it
+        try:
+            self.name_library = names.library()
+        except OSError:
+            self.name_library = None
+
+    def host(self, name, player_count=None):
+        """
+        :param name: str
+        :param player_count: int, or None if it has yet to be decided (see Table)
+        :return: the new Table for a game called name
+        """
+
+        seed = None if self.seed is None else str(self.seed) + ':' + name
+        table = self.tables[name.lower()] = Table(name, player_count, seed, name_library=self.name_library)
+        return table
+
+    async def table(self, name):
+        """
+        :return: the Table of the game called name, picked up from its save file if nobody is playing it, or None
+        """
+
+        table = self.tables.get(name.lower())
+        if table is not None:
+            return table
+        data = await asyncio.get_running_loop().run_in_executor(None, read_save, name)
+        table = self.tables.get(name.lower())
+        if table is not None or data is None:
+            return table
+        game, store = await asyncio.get_running_loop().run_in_executor(None, load_save, data)
+        table = self.tables.get(name.lower())
+        if table is not None:
+            return table
+        table = self.tables[name.lower()] = Table(name, len(game.players), game=game, name_library=self.name_library,
+                                                  store=store)
+        return table
+
+    async def release(self, table):
+        """
+        Stops hosting a game nobody is connected to any more, saving it first if it has begun.
+        """
+
+        if table.sessions or self.tables.get(table.name.lower()) is not table:
+            return
+        del self.tables[table.name.lower()]
+        if table.ending is not None:
+            # The last player to leave may have ended the turn on their way out
+            await table.ending
+        if table.game is not None and gen.SAVE_DIRECTORY is not None:
+            data = await table.save_bytes()
+            await asyncio.get_running_loop().run_in_executor(None, write_save, table.name, data)
+
+    async def connect(self, reader, writer):
+        await Session(self, reader, writer).run()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Accepts connections until cancelled.
+        """
+
+        server = await asyncio.start_server(self.connect, host, port, limit=MAX_LINE, backlog=BACKLOG)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(Server().serve(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_HOST,
+                                   int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,452 @@
+"""
+File: Distant Skies (ships)
+Description: Column storage for ships.
+
+Ship data lives in a ShipStore as one array per field, one row per ship. Names are packed into a single bytes buffer,
+builds and fleet names are stored as small integer IDs, and the numbers are 4-byte C floats (fuel, drive charge,
+attack and hull all run from 0 to 100, and whole numbers that size are exact in them). A Ship object is only a
+view of one row (the store and a row number), and a fleet's members are a ShipList of row numbers, so ships cost no
+Python objects at all until they are looked at.
+"""
+
+from array import array
+from itertools import accumulate
+from operator import itemgetter
+import threading
+
+
+_WIDER = {'B': 'H', 'H': 'I', 'I': 'Q'}
+
+
+def gatherer(rows):
+    """
+    :param rows: sequence of int
+    :return: function that takes one of the columns of a ShipStore and returns an array of its values in those rows, of
+    the same type as the column. Several columns gathered through one of these share the work of reading rows.
+    """
+
+    if len(rows) > 1:
+        # itemgetter looks every row up in one call, without running Python code per row
+        get = itemgetter(*rows)
+        return lambda values: array(values.typecode, get(values))
+    return lambda values: array(values.typecode, [values[row] for row in rows])
+
+
+def gather(values, rows):
+    """
+    :param values: array, one of the columns of a ShipStore
+    :param rows: sequence of int
+    :return: array of values[row] for each row, of the same type as values
+    """
+
+    return gatherer(rows)(values)
+
+
+class ShipStore:
+    """
+    The integer columns (build IDs, parent fleet IDs and name lengths) start one byte wide and are widened the first
+    time a value does not fit, so a store with few builds and fleets pays one byte per ship for each of them.
+
+    A new name is written over the old one of its row when it fits, and added to the end of names when it does not.
+    dead counts the bytes of names that belong to no ship (freed rows, and what is left of names written over), and
+    once free() leaves more than half of names dead, compact() packs the live names together again.
+    """
+
+    # One array each, one item per row
+    COLUMNS = ('name_starts', 'name_lengths', 'build_ids', 'parent_ids', 'fuel', 'drive_charge', 'attack', 'hull')
+
+    def __init__(self):
+        self.builds = []
+        self._build_ids = dict()
+        self.strings = []
+        self._string_ids = dict()
+        self.names = bytearray()
+        self.name_starts = array('I')
+        self.name_lengths = array('B')
+        self.build_ids = array('B')
+        self.parent_ids = array('B')
+        self.fuel = array('f')
+        self.drive_charge = array('f')
+        self.attack = array('f')
+        self.hull = array('f')
+        self.free_rows = []
+        self.dead = 0
+        # names decoded, while names is ASCII and has not changed since; False if it is not ASCII
+        self._text = None
+
+    def __len__(self):
+        """
+        :return: int, number of ships currently stored
+        """
+
+        return len(self.build_ids) - len(self.free_rows)
+
+    def _put(self, column, row, value):
+        try:
+            getattr(self, column)[row] = value
+        except OverflowError:
+            self._widen(column)
+            self._put(column, row, value)
+
+    def _append(self, column, value):
+        try:
+            getattr(self, column).append(value)
+        except OverflowError:
+            self._widen(column)
+            self._append(column, value)
+
+    def _extend(self, column, values):
+        if not isinstance(values, array):
+            # Kept as an array so that the values can be read again if the column has to be widened
+            values = array('Q', values)
+        try:
+            getattr(self, column).extend(array(getattr(self, column).typecode, values))
+        except OverflowError:
+            self._widen(column)
+            self._extend(column, values)
+
+    def _widen(self, column):
+        values = getattr(self, column)
+        setattr(self, column, array(_WIDER[values.typecode], values))
+
+    def build_id(self, build):
+        try:
+            return self._build_ids[id(build)]
+        except KeyError:
+            self._build_ids[id(build)] = len(self.builds)
+            self.builds.append(build)
+            return len(self.builds) - 1
+
+    def string_id(self, string):
+        # Most strings are fleet names, which are new to the store when they are first asked for, so this is looked up
+        # with get() rather than catching KeyError
+        index = self._string_ids.get(string)
+        if index is None:
+            index = self._string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    def name(self, row):
+        start = self.name_starts[row]
+        return self.names[start:start + self.name_lengths[row]].decode('utf-8')
+
+    def names_of(self, rows, lower=False):
+        """
+        :param rows: sequence of int
+        :param lower: bool, give the names in lower case
+        :return: list of str, the names of the ships in those rows, decoded together
+        """
+
+        text = self._text
+        if text is None:
+            text = self._text = self.names.decode('ascii') if self.names.isascii() else False
+        if text is False:
+            return [self.name(row).lower() if lower else self.name(row) for row in rows]
+        if lower:
+            text = text.lower()
+        # Every character is one byte, so byte offsets are string offsets too
+        read = gatherer(rows)
+        return [text[start:start + length] for start, length in zip(read(self.name_starts), read(self.name_lengths))]
+
+    def set_name(self, row, name):
+        encoded = name.encode('utf-8')
+        if len(encoded) > 0xFFFF:
+            raise ValueError('Ship names can be at most 65535 bytes long.')
+        length = self.name_lengths[row]
+        if len(encoded) <= length:
+            start = self.name_starts[row]
+            self.names[start:start + len(encoded)] = encoded
+            self.dead += length - len(encoded)
+        else:
+            self.dead += length
+            self.name_starts[row] = len(self.names)
+            self.names += encoded
+        self._put('name_lengths', row, len(encoded))
+        self._text = None
+
+    def add(self, name, build, parent_fleet, fuel=100, drive_charge=100, attack=100, hull=100):
+        """
+        Stores a new ship.
+        :return: int, the ship's row
+        """
+
+        if self.free_rows:
+            row = self.free_rows.pop()
+            # The row's old name is dead, but its bytes can take the new one
+            self.dead -= self.name_lengths[row]
+            self._put('build_ids', row, self.build_id(build))
+            self._put('parent_ids', row, self.string_id(parent_fleet))
+            self.fuel[row] = fuel
+            self.drive_charge[row] = drive_charge
+            self.attack[row] = attack
+            self.hull[row] = hull
+            self.set_name(row, name)
+            return row
+
+        # A new row's name always goes on the end of names, so it is written here rather than through set_name()
+        encoded = name.encode('utf-8')
+        if len(encoded) > 0xFFFF:
+            raise ValueError('Ship names can be at most 65535 bytes long.')
+        row = len(self.build_ids)
+        self._append('build_ids', self.build_id(build))
+        self._append('parent_ids', self.string_id(parent_fleet))
+        self._append('name_lengths', len(encoded))
+        self.name_starts.append(len(self.names))
+        self.names += encoded
+        self._text = None
+        self.fuel.append(fuel)
+        self.drive_charge.append(drive_charge)
+        self.attack.append(attack)
+        self.hull.append(hull)
+        return row
+
+    def add_many(self, names, build_ids, parent_ids, fuel, drive_charge, attack, hull=None):
+        """
+        Stores many ships at once, straight from columns.
+        :param names: list of bytes, the names encoded as UTF-8
+        :param build_ids: array of indexes into self.builds
+        :param parent_ids: array of indexes into self.strings, the parent fleet names
+        :param fuel: array of float
+        :param drive_charge: array of float
+        :param attack: array of float
+        :param hull: array of float, or None for undamaged ships
+        :return: range of the new rows
+        """
+
+        first = len(self.build_ids)
+        lengths = array('Q', map(len, names))
+        if lengths and max(lengths) > 0xFFFF:
+            raise ValueError('Ship names can be at most 65535 bytes long.')
+        starts = array('I', accumulate(lengths, initial=len(self.names)))
+        starts.pop()
+        self.names += b''.join(names)
+        self._text = None
+        self.name_starts.extend(starts)
+        self._extend('name_lengths', lengths)
+        self._extend('build_ids', build_ids)
+        self._extend('parent_ids', parent_ids)
+        if hull is None:
+            hull = array('f', [100]) * (len(self.build_ids) - first)
+        for column, values in zip((self.fuel, self.drive_charge, self.attack, self.hull),
+                                  (fuel, drive_charge, attack, hull)):
+            # Columns of doubles (as older save files hold) are narrowed on the way in
+            column.extend(values if values.typecode == column.typecode else array(column.typecode, values))
+        return range(first, len(self.build_ids))
+
+    def free(self, row):
+        """
+        Releases a row so the next new ship can reuse it.
+        """
+
+        self.dead += self.name_lengths[row]
+        self.free_rows.append(row)
+        if self.dead * 2 > len(self.names):
+            self.compact()
+
+    def compact(self):
+        """
+        Packs the names of the rows in use together at the start of a new names buffer, dropping every dead byte. Freed
+        rows are left with no name bytes at all. This moves every name, so snapshots (see snapshots.py) cannot take it
+        back; free() only calls it while battles are fought, which snapshots do not cover.
+        """
+
+        free = set(self.free_rows)
+        starts = self.name_starts
+        lengths = self.name_lengths
+        old = self.names
+        names = bytearray()
+        for row in range(len(starts)):
+            if row in free:
+                starts[row] = 0
+                lengths[row] = 0
+            else:
+                start = starts[row]
+                starts[row] = len(names)
+                names += old[start:start + lengths[row]]
+        self.names = names
+        self.dead = 0
+        self._text = None
+
+    def memory(self):
+        """
+        :return: int, bytes held by the columns and the name buffer
+        """
+
+        columns = [getattr(self, column) for column in self.COLUMNS]
+        return len(self.names) + sum(column.itemsize * column.buffer_info()[1] for column in columns)
+
+
+_default_store = ShipStore()
+# Each thread has its own current store, so a game changed in a worker thread (see server.py) puts its ships in its own
+# store whatever the other threads are doing
+_local = threading.local()
+
+
+def current_store():
+    """
+    :return: the ShipStore that new Ship objects are put in by this thread
+    """
+
+    return getattr(_local, 'store', _default_store)
+
+
+def use_store(store):
+    """
+    Makes store the one new ships are put in by this thread, such as a fresh store for a new or loaded game.
+    :param store: ShipStore object
+    :return: the ShipStore that was in use before
+    """
+
+    previous = current_store()
+    _local.store = store
+    return previous
+
+
+def _column(name, doc):
+
+    def get(ship):
+        return getattr(ship.store, name)[ship.row]
+
+    def set(ship, value):
+        getattr(ship.store, name)[ship.row] = value
+
+    return property(get, set, doc=doc)
+
+
+class Ship:
+    """
+    One ship, as a view of its row in a ShipStore. Ship(name, build, parent_fleet) stores a new ship in the current
+    store (or in store, if given); Ship.at(store, row) looks at one that is already stored.
+    """
+
+    __slots__ = ('store', 'row')
+
+    def __init__(self, name, build, parent_fleet, fuel=100, drive_charge=100, attack=100, hull=100, store=None):
+        self.store = store if store is not None else current_store()
+        self.row = self.store.add(name, build, parent_fleet, fuel, drive_charge, attack, hull)
+
+    @classmethod
+    def at(cls, store, row):
+        ship = cls.__new__(cls)
+        ship.store = store
+        ship.row = row
+        return ship
+
+    @property
+    def name(self):
+        return self.store.name(self.row)
+
+    @name.setter
+    def name(self, value):
+        self.store.set_name(self.row, value)
+
+    @property
+    def build(self):
+        return self.store.builds[self.store.build_ids[self.row]]
+
+    @build.setter
+    def build(self, value):
+        self.store._put('build_ids', self.row, self.store.build_id(value))
+
+    @property
+    def parent_fleet(self):
+        return self.store.strings[self.store.parent_ids[self.row]]
+
+    @parent_fleet.setter
+    def parent_fleet(self, value):
+        self.store._put('parent_ids', self.row, self.store.string_id(value))
+
+    fuel = _column('fuel', 'float')
+    drive_charge = _column('drive_charge', 'float')
+    attack = _column('attack', 'float')
+    hull = _column('hull', 'float')
+
+    def __eq__(self, other):
+        if not isinstance(other, Ship):
+            return NotImplemented
+        return self.store is other.store and self.row == other.row
+
+    def __hash__(self):
+        return hash((id(self.store), self.row))
+
+    def __repr__(self):
+        return ('Ship(name=' + repr(self.name) + ', build=' + repr(self.build) + ', parent_fleet=' +
+                repr(self.parent_fleet) + ', fuel=' + repr(self.fuel) + ', drive_charge=' + repr(self.drive_charge) +
+                ', attack=' + repr(self.attack) + ', hull=' + repr(self.hull) + ')')
+
+
+class ShipList:
+    """
+    The members of a fleet: the rows of its ships in one ShipStore. Behaves like a list of Ship objects.
+    """
+
+    __slots__ = ('store', 'rows')
+
+    def __init__(self, ships=(), store=None):
+        self.store = store if store is not None else current_store()
+        self.rows = array('I')
+        for ship in ships:
+            self.append(ship)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        store = self.store
+        for row in self.rows:
+            yield Ship.at(store, row)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Ship.at(self.store, row) for row in self.rows[index]]
+        return Ship.at(self.store, self.rows[index])
+
+    def __contains__(self, ship):
+        return isinstance(ship, Ship) and ship.store is self.store and ship.row in self.rows
+
+    def __eq__(self, other):
+        if isinstance(other, ShipList):
+            return self.store is other.store and self.rows == other.rows
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def column(self, name):
+        """
+        Reads one field of every member at once, without making a Ship object per member.
+        :param name: str, 'fuel', 'drive_charge', 'attack', 'hull', 'build_ids' or 'parent_ids'
+        :return: array of the values, in member order
+        """
+
+        return gather(getattr(self.store, name), self.rows)
+
+    def append(self, ship):
+        if ship.store is not self.store:
+            raise ValueError(ship.name + ' is kept in a different ship store than this fleet.')
+        self.rows.append(ship.row)
+
+    def extend(self, ships):
+        for ship in ships:
+            self.append(ship)
+
+    def remove(self, ship):
+        if ship not in self:
+            raise ValueError(ship.name + ' is not in this fleet.')
+        self.rows.remove(ship.row)
+
+    def pop(self, index=-1):
+        return Ship.at(self.store, self.rows.pop(index))
+
+    def clear(self):
+        del self.rows[:]
+
+    def discard(self, rows):
+        """
+        Drops the ships in rows from the list, keeping the rest in order.
+        :param rows: set of int
+        """
+
+        self.rows = array('I', [row for row in self.rows if row not in rows])
@@ -0,0 +1,320 @@
+"""
+File: Distant Skies (simulation)
+Description: Plays many whole games between computer players at once, for balance testing.
+
+Games are played straight through the game functions (found_colony(), order_ship(), start_move(), end_turn()), with
+no prompts and nothing printed. Game number n of a sweep draws every random number it needs from its own
+random.Random, seeded with the sweep's seed and n, and its system is named after both so its battles get their own
+rolls too. A game therefore plays out the same way whichever worker runs it and however many workers there are.
+
+Games are handed to a ProcessPoolExecutor in chunks of CHUNK_SIZE. A worker sends back one small tuple of stats per game
+(see play_game()), and the parent folds them into a Summary as the chunks come in, so nothing is shared between
+workers and a sweep speeds up with every core it is given.
+
+Usage: python simulate.py [games] [workers] [turns]
+"""
+
+import distant_skies as ds
+import economy
+import generation as gen
+from scheduler import COMBAT
+from ships import ShipStore, use_store
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Union
+import os
+import random as rand
+import sys
+import time
+
+
+CHUNK_SIZE = 100
+# Odds of a raider sending each of its idle fleets at an enemy colony on its turn
+RAID_CHANCE = .5
+
+
+@dataclass(frozen=False)
+class Settings:
+    """
+    Everything a balance sweep can change. policies names the policy (a key of POLICIES) each seat plays, so it also
+    sets the number of players. builds are the Build objects players can buy.
+    """
+    turns: int = 50
+    policies: tuple = ('raider', 'hunter')
+    star_weights: tuple = tuple(gen.STAR_WEIGHTS)
+    prod_per_turn: int = ds.Colony.prod_per_turn
+    starting_resources: int = economy.STARTING_RESOURCES
+    builds: tuple = tuple(ds.builds.values())
+    max_size: int = 99
+
+
+@dataclass(frozen=False)
+class Seat:
+    """
+    One computer player in a simulated game. ordered counts the ships they have bought, which also names the next one.
+    """
+    player: "Player"
+    policy: str
+    home: "Colony"
+    body: Union["Planet", "Moon"]
+    ordered: int = 0
+    lost: int = 0
+
+
+def buy(game, seat, rng, builds):
+    """
+    Buys one ship the seat can afford, picked at random, to join the first fleet docked at their home colony.
+    """
+
+    affordable = [build for build in builds if economy.can_afford(seat.player, build)]
+    if not affordable:
+        return
+    seat.ordered += 1
+    ds.order_ship(game, seat.player, rng.choice(affordable), 'ship ' + str(seat.ordered), seat.home,
+                  next(iter(seat.home.docked), None))
+
+
+def turtle(game, seat, seats, rng, builds):
+    """
+    Buys a ship whenever it can and keeps every fleet at home.
+    """
+
+    buy(game, seat, rng, builds)
+
+
+def raider(game, seat, seats, rng, builds):
+    """
+    Buys a ship whenever it can and sends idle fleets at the home bodies of other players.
+    """
+
+    buy(game, seat, rng, builds)
+    targets = [other.body for other in seats if other is not seat and other.body is not seat.body]
+    if not targets:
+        return
+    for fleet in list(seat.player.owned_fleets.values()):
+        if not isinstance(fleet.location, ds.Orbit) and rng.random() < RAID_CHANCE:
+            ds.start_move(game, fleet, rng.choice(targets))
+
+
+def hunter(game, seat, seats, rng, builds):
+    """
+    Buys a ship whenever it can and sends idle fleets at the body where the most enemy fleets are out in the open
+    (fleets docked at a colony cannot be reached).
+    """
+
+    buy(game, seat, rng, builds)
+    counts = dict()
+    for other in seats:
+        if other is seat:
+            continue
+        for key, here in other.player.fleets_at.items():
+            if key is None or not here:
+                continue
+            location = next(iter(here.values())).location
+            if not isinstance(location, ds.Colony):
+                counts[key] = (counts.get(key, (0, location))[0] + len(here), location)
+    if not counts:
+        return
+    target = max(counts.values(), key=lambda count: count[0])[1]
+    for fleet in list(seat.player.owned_fleets.values()):
+        if not isinstance(fleet.location, ds.Orbit) and fleet.location is not target:
+            ds.start_move(game, fleet, target)
+
+
+POLICIES = {
+    'turtle': turtle,
+    'raider': raider,
+    'hunter': hunter,
+}
+
+
+def play_game(settings, seed, number):
+    """
+    Plays one game from start to finish.
+    :param settings: Settings object
+    :param seed: seed of the sweep
+    :param number: int, the game's number in the sweep
+    :return: tuple of (stars, bodies, winning seat or None for a draw, tuple of every seat's net worth, tuple of the
+    ships every seat bought, tuple of the ships every seat lost, battles fought)
+    """
+
+    rng = rand.Random(str(seed) + ':' + str(number))
+    system = gen.generate_systems(1, rng.getrandbits(64), settings.max_size, True,
+                                  settings.star_weights).system(0, 'Sim ' + str(seed) + '-' + str(number))
+    bodies = system.registry.bodies
+    count = len(settings.policies)
+    homes = rng.sample(bodies, count) if len(bodies) >= count else [rng.choice(bodies) for _ in range(count)]
+
+    seats = []
+    for place, (policy, body) in enumerate(zip(settings.policies, homes), 1):
+        player = ds.Player('Player ' + str(place))
+        economy.grant(player, settings.starting_resources)
+        colony = ds.found_colony(player, body, 'colony ' + str(place), settings.prod_per_turn)
+        seats.append(Seat(player, policy, colony, body))
+    by_name = {seat.player.name: seat for seat in seats}
+
+    previous_store = use_store(ShipStore())
+    try:
+        game = ds.Game(system, [seat.player for seat in seats])
+        battles = 0
+        for _ in range(settings.turns):
+            for seat in seats:
+                POLICIES[seat.policy](game, seat, seats, rng, settings.builds)
+            for kind, results in ds.end_turn(game):
+                if kind == COMBAT:
+                    battles += len(results)
+                    for battle in results:
+                        for name, lost in battle.losses.items():
+                            by_name[name].lost += lost
+    finally:
+        use_store(previous_store)
+
+    worths = tuple(seat.player.net_worth for seat in seats)
+    winner = worths.index(max(worths)) if worths.count(max(worths)) == 1 else None
+    return (len(system.stars), len(bodies), winner, worths,
+            tuple(seat.ordered for seat in seats), tuple(seat.lost for seat in seats), battles)
+
+
+def play_games(settings, seed, start, stop):
+    """
+    Plays games start to stop - 1 of a sweep. This is what each worker runs.
+    :return: list of what play_game() returned for each game
+    """
+
+    return [play_game(settings, seed, number) for number in range(start, stop)]
+
+
+@dataclass(frozen=False)
+class Summary:
+    """
+    Running totals over the games of a sweep. Every list has one entry per seat, and by_stars maps a star count to
+    [games, list of wins per seat]. Games that end with the richest players level are draws.
+    """
+    policies: tuple
+    games: int = 0
+    bodies: int = 0
+    battles: int = 0
+    draws: int = 0
+    wins: list = field(default_factory=list)
+    net_worth: list = field(default_factory=list)
+    bought: list = field(default_factory=list)
+    lost: list = field(default_factory=list)
+    by_stars: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        for totals in (self.wins, self.net_worth, self.bought, self.lost):
+            if not totals:
+                totals.extend([0] * len(self.policies))
+
+    def add(self, stats):
+        """
+        :param stats: tuple returned by play_game()
+        """
+
+        stars, bodies, winner, worths, bought, lost, battles = stats
+        self.games += 1
+        self.bodies += bodies
+        self.battles += battles
+        row = self.by_stars.setdefault(stars, [0, [0] * len(self.policies)])
+        row[0] += 1
+        if winner is None:
+            self.draws += 1
+        else:
+            self.wins[winner] += 1
+            row[1][winner] += 1
+        for seat in range(len(self.policies)):
+            self.net_worth[seat] += worths[seat]
+            self.bought[seat] += bought[seat]
+            self.lost[seat] += lost[seat]
+
+    def merge(self, other):
+        """
+        Adds the totals of another Summary of the same seats to this one.
+        :param other: Summary object
+        """
+
+        self.games += other.games
+        self.bodies += other.bodies
+        self.battles += other.battles
+        self.draws += other.draws
+        for totals, more in ((self.wins, other.wins), (self.net_worth, other.net_worth), (self.bought, other.bought),
+                             (self.lost, other.lost)):
+            for seat, amount in enumerate(more):
+                totals[seat] += amount
+        for stars, (games, wins) in other.by_stars.items():
+            row = self.by_stars.setdefault(stars, [0, [0] * len(self.policies)])
+            row[0] += games
+            for seat, amount in enumerate(wins):
+                row[1][seat] += amount
+
+    def tables(self):
+        """
+        :return: str, the totals laid out as text tables
+        """
+
+        games = max(self.games, 1)
+
+        def percent(part, whole):
+            return str(round(100 * part / max(whole, 1), 1)) + '%'
+
+        lines = [str(self.games) + ' games, ' + str(round(self.bodies / games, 1)) + ' bodies and ' +
+                 str(round(self.battles / games, 1)) + ' battles per game, ' +
+                 percent(self.draws, self.games) + ' drawn', '',
+                 'Seat'.ljust(6) + 'Policy'.ljust(10) + 'Wins'.rjust(10) + 'Net worth'.rjust(12) +
+                 'Bought'.rjust(10) + 'Lost'.rjust(10)]
+        for seat, policy in enumerate(self.policies):
+            lines.append(str(seat + 1).ljust(6) + policy.ljust(10) + percent(self.wins[seat], self.games).rjust(10) +
+                         str(round(self.net_worth[seat] / games)).rjust(12) +
+                         str(round(self.bought[seat] / games, 1)).rjust(10) +
+                         str(round(self.lost[seat] / games, 1)).rjust(10))
+        lines.extend(['', 'Stars'.ljust(6) + 'Games'.rjust(10) +
+                      ''.join(('Seat ' + str(seat + 1)).rjust(10) for seat in range(len(self.policies)))])
+        for stars in sorted(self.by_stars):
+            played, wins = self.by_stars[stars]
+            lines.append(str(stars).ljust(6) + str(played).rjust(10) +
+                         ''.join(percent(won, played).rjust(10) for won in wins))
+        return '\n'.join(lines)
+
+
+def run(games, settings=None, seed=0, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Plays a sweep of games.
+    :param games: int, number of games to play
+    :param settings: Settings object, or None for the game as it is
+    :param seed: seed of the sweep; the same seed and settings always give the same Summary
+    :param workers: int, number of worker processes, or None for one per core. 1 plays every game in this process.
+    :param chunk_size: int, games handed to a worker at a time
+    :return: Summary object
+    """
+
+    if settings is None:
+        settings = Settings()
+    for policy in settings.policies:
+        if policy not in POLICIES:
+            raise ValueError(policy + ' is not a policy. The policies are ' + ', '.join(POLICIES) + '.')
+    summary = Summary(settings.policies)
+    chunks = [(start, min(start + chunk_size, games)) for start in range(0, games, chunk_size)]
+    if workers == 1:
+        for start, stop in chunks:
+            for stats in play_games(settings, seed, start, stop):
+                summary.add(stats)
+        return summary
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(play_games, settings, seed, start, stop) for start, stop in chunks]
+        for future in as_completed(futures):
+            for stats in future.result():
+                summary.add(stats)
+    return summary
+
+
+if __name__ == '__main__':
+    game_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    worker_count = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    turn_count = int(sys.argv[3]) if len(sys.argv) > 3 else Settings.turns
+    began = time.perf_counter()
+    results = run(game_count, Settings(turns=turn_count), workers=worker_count)
+    elapsed = time.perf_counter() - began
+    print(results.tables())
+    print('\n' + str(game_count) + ' games of ' + str(turn_count) + ' turns on ' + str(worker_count) + ' workers in ' +
+          str(round(elapsed, 2)) + ' s (' + str(round(game_count / elapsed)) + ' games/s)')
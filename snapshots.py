@@ -0,0 +1,210 @@
+"""
+File: Distant Skies (snapshots)
+Description: Snapshots of a game that are free to take, for undoing commands and trying moves out.
+
+Copying a whole game to go back to later means following every Colony.owner back to its Player and every fleet to its
+ships, so a History never copies anything when a snapshot is taken. Instead, the functions that change a game (such as
+distant_skies.found_colony(), order_ship() and Movement.depart()) tell their game's History what they are about to
+change, and only the first time after each snapshot does it keep the old value: the attributes of one object, one key
+of a dict, the length of a list or array that is about to grow, or single items of one. Restoring a snapshot puts
+those values back in place, so everything that refers to the changed objects still sees them. A snapshot therefore
+costs one empty dict, and a command costs a few saved values, however many colonies and ships the game has.
+
+Snapshots are nested: restore() goes back to the latest one, and commit() keeps what happened since the latest one
+but lets the one before it still go back past it, which is what a search that tries moves out one after the other
+needs. Ending a turn is not recorded (combat, arrivals and production touch too much of the game to be worth it), so
+distant_skies.end_turn() forgets every snapshot, and nothing can be undone past the end of a turn.
+
+A few things are not taken back: names that are taken (see generation.used_names()) stay taken, builds and fleet names
+the ship store has given IDs to keep them, and dict keys that are put back go to the end of their dict.
+"""
+
+
+# Kinds of saved value, in the order they are restored: sequences are cut back to their old length before their
+# items are put back
+LENGTH = 0
+ATTRIBUTES = 1
+KEY = 2
+ITEM = 3
+COPY = 4
+# Kept for dict keys that were not there yet
+_MISSING = object()
+
+
+class History:
+    """
+    layers holds one dict per open snapshot, oldest first. Each maps what was changed since the snapshot was taken (a
+    kind, the id() of the object and, for keys and items, which one) to (kind, object, key or index, old value), and
+    labels holds what each snapshot was taken for. len(history) is the number of open snapshots, so a History is false
+    while there is nothing to record changes for.
+    """
+
+    def __init__(self):
+        self.layers = []
+        self.labels = []
+
+    def __len__(self):
+        return len(self.layers)
+
+    def snapshot(self, label=None):
+        """
+        :param label: anything to remember the snapshot by, such as the command it was taken before
+        :return: int, the number of open snapshots, counting the new one
+        """
+
+        self.layers.append(dict())
+        self.labels.append(label)
+        return len(self.layers)
+
+    def restore(self):
+        """
+        Puts back everything changed since the latest snapshot, and forgets that snapshot.
+        :return: the snapshot's label
+        """
+
+        if not self.layers:
+            raise LookupError('There is no snapshot to go back to.')
+        layer = self.layers.pop()
+        for kind, target, key, saved in sorted(layer.values(), key=lambda entry: entry[0]):
+            if kind == LENGTH:
+                del target[saved:]
+            elif kind == ATTRIBUTES:
+                if isinstance(saved, dict):
+                    target.__dict__.update(saved)
+                else:
+                    for name, value in zip(type(target).__slots__, saved):
+                        setattr(target, name, value)
+            elif kind == KEY:
+                if saved is _MISSING:
+                    target.pop(key, None)
+                else:
+                    target[key] = saved
+            elif kind == ITEM:
+                # Items past the old length were added since and cut off with the rest
+                if key < len(target):
+                    target[key] = saved
+            else:
+                target[:] = saved
+        return self.labels.pop()
+
+    def commit(self):
+        """
+        Forgets the latest snapshot but keeps what changed since it in the one before, so that restoring that one still
+        takes back everything since it was taken.
+        :return: the forgotten snapshot's label
+        """
+
+        if not self.layers:
+            raise LookupError('There is no snapshot to commit.')
+        layer = self.layers.pop()
+        if self.layers:
+            below = self.layers[-1]
+            for key, entry in layer.items():
+                # The one before keeps its own, older, values
+                below.setdefault(key, entry)
+        return self.labels.pop()
+
+    def undo(self):
+        """
+        Goes back to before the latest snapshot after which something changed, forgetting the snapshots after it
+        (which changed nothing).
+        :return: that snapshot's label, or None if nothing has changed since the oldest snapshot
+        """
+
+        while self.layers and not self.layers[-1]:
+            self.layers.pop()
+            self.labels.pop()
+        return self.restore() if self.layers else None
+
+    def clear(self):
+        """
+        Forgets every snapshot, keeping the game as it is.
+        """
+
+        self.layers.clear()
+        self.labels.clear()
+
+    # Everything below is only to be called while there is an open snapshot (while the History is true)
+
+    def keep(self, target):
+        """
+        Keeps the attributes of target (not what is inside them) as they are now.
+        """
+
+        layer = self.layers[-1]
+        key = (ATTRIBUTES, id(target))
+        if key not in layer:
+            try:
+                saved = target.__dict__.copy()
+            except AttributeError:
+                saved = tuple(getattr(target, name) for name in type(target).__slots__)
+            layer[key] = (ATTRIBUTES, target, None, saved)
+
+    def keep_key(self, mapping, key):
+        """
+        Keeps what mapping holds under key, or that it holds nothing there.
+        """
+
+        layer = self.layers[-1]
+        entry = (KEY, id(mapping), key)
+        if entry not in layer:
+            layer[entry] = (KEY, mapping, key, mapping.get(key, _MISSING))
+
+    def keep_length(self, sequence):
+        """
+        Keeps the length of a list, array or bytearray that is about to have things added to its end.
+        """
+
+        layer = self.layers[-1]
+        key = (LENGTH, id(sequence))
+        if key not in layer:
+            layer[key] = (LENGTH, sequence, None, len(sequence))
+
+    def keep_items(self, sequence, indexes):
+        """
+        Keeps the items of sequence at indexes.
+        """
+
+        layer = self.layers[-1]
+        for index in indexes:
+            key = (ITEM, id(sequence), index)
+            if key not in layer:
+                layer[key] = (ITEM, sequence, index, sequence[index])
+
+    def keep_copy(self, sequence):
+        """
+        Keeps a copy of a whole list, for short lists that change in other ways than growing (such as a heap).
+        """
+
+        layer = self.layers[-1]
+        key = (COPY, id(sequence))
+        if key not in layer:
+            layer[key] = (COPY, sequence, None, sequence[:])
+
+    def keep_event(self, scheduler, turn, kind):
+        """
+        Keeps what Scheduler.at(turn, kind, ...) is about to change.
+        """
+
+        self.keep(scheduler)
+        self.keep_copy(scheduler.queue)
+        self.keep_key(scheduler.batches, (turn, kind))
+        batch = scheduler.batches.get((turn, kind))
+        if batch is not None:
+            self.keep_length(batch)
+
+    def keep_store(self, store):
+        """
+        Keeps what ShipStore.add() is about to change: the store's columns (which can be swapped for wider ones), their
+        lengths, and the row it is about to reuse, if any.
+        """
+
+        self.keep(store)
+        for column in store.COLUMNS:
+            self.keep_length(getattr(store, column))
+        self.keep_length(store.names)
+        self.keep_copy(store.free_rows)
+        if store.free_rows:
+            row = store.free_rows[-1]
+            for column in store.COLUMNS:
+                self.keep_items(getattr(store, column), (row,))
@@ -0,0 +1,140 @@
+"""
+File: Distant Skies (streams)
+Description: Independent random number streams, addressed by a seed and a path.
+
+A Stream is counter-based: draw number n of a stream is a hash (the SplitMix64 mixer) of the stream's key and n, so any
+draw can be worked out on its own, without the draws before it, and jump() skips ahead in O(1). child() derives the
+key of a new stream from its parent's key and a label, such as a planet's number or 'names', so every part of a system
+draws from its own stream: stream(seed).child(3).child(2) belongs to planet 2 of the fourth system (systems count from
+0 and planets from 1, see generation.draw_planet()), and gives the same numbers whichever order (or process) the other
+parts are worked out in. stream(seed).child(3).child('names') is the one that system's colony names are drawn from.
+
+Streams have the random.Random methods that generation needs (random, randrange, randint, choice and choices), so they
+can be handed to anything that takes an rng.
+"""
+
+from bisect import bisect
+from itertools import accumulate
+import hashlib
+import os
+
+
+MASK = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15
+# Turns the top 53 bits of a draw into a float from 0 to 1
+UNIT = 1.0 / (1 << 53)
+# Mixed into the keys of child streams, so they do not line up with the draws of their parents
+CHILD = 0xD1B54A32D192ED03
+# Keys of the labels that are not ints, which are hashed once each
+_labels = dict()
+
+
+def mix(value):
+    """
+    :param value: int from 0 to 2**64 - 1
+    :return: int from 0 to 2**64 - 1, value scrambled by the SplitMix64 finalizer
+    """
+
+    value = (value ^ (value >> 30)) * 0xBF58476D1CE4E5B9 & MASK
+    value = (value ^ (value >> 27)) * 0x94D049BB133111EB & MASK
+    return value ^ (value >> 31)
+
+
+def label_key(label):
+    """
+    :param label: int, or any other value, which is hashed by its repr()
+    :return: int from 0 to 2**64 - 1
+    """
+
+    if isinstance(label, int):
+        return label * GOLDEN & MASK
+    key = _labels.get(label)
+    if key is None:
+        key = hash_key(label)
+        _labels[label] = key
+    return key
+
+
+def hash_key(value):
+    """
+    :return: int from 0 to 2**64 - 1, a hash of repr(value) that is the same in every process
+    """
+
+    return int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), 'little')
+
+
+def stream(seed):
+    """
+    :param seed: int, str or any other value with a stable repr(); None for a random seed
+    :return: the root Stream of seed
+    """
+
+    if seed is None:
+        seed = int.from_bytes(os.urandom(8), 'little')
+    return Stream(mix(seed & MASK) if isinstance(seed, int) else hash_key(seed))
+
+
+class Stream:
+    """
+    key picks the stream, and position is the number of the next draw.
+    """
+
+    __slots__ = ('key', 'position')
+
+    def __init__(self, key, position=0):
+        self.key = key
+        self.position = position
+
+    def child(self, *path):
+        """
+        :param path: labels, each an int or str
+        :return: new Stream derived from this stream's key and path, independent of this stream and its draws
+        """
+
+        key = self.key
+        for label in path:
+            key = mix(key ^ label_key(label) ^ CHILD)
+        return Stream(key)
+
+    def at(self, position):
+        """
+        :return: float from 0 to 1, draw number position of the stream, without moving the stream
+        """
+
+        # mix(), written out, since every draw goes through here
+        value = (self.key + position * GOLDEN) & MASK
+        value = (value ^ (value >> 30)) * 0xBF58476D1CE4E5B9 & MASK
+        value = (value ^ (value >> 27)) * 0x94D049BB133111EB & MASK
+        return ((value ^ (value >> 31)) >> 11) * UNIT
+
+    def jump(self, count):
+        """
+        Skips the next count draws.
+        """
+
+        self.position += count
+
+    def random(self):
+        self.position += 1
+        return self.at(self.position - 1)
+
+    def randrange(self, stop):
+        return int(self.random() * stop)
+
+    def randint(self, lower, upper):
+        return lower + int(self.random() * (upper - lower + 1))
+
+    def choice(self, population):
+        return population[int(self.random() * len(population))]
+
+    def choices(self, population, weights=None, k=1):
+        """
+        :return: list of k picks from population, with relative weights (or evenly, like random.Random.choices())
+        """
+
+        if weights is None:
+            return [population[int(self.random() * len(population))] for _ in range(k)]
+        totals = list(accumulate(weights))
+        total = totals[-1]
+        last = len(population) - 1
+        return [population[min(bisect(totals, self.random() * total), last)] for _ in range(k)]
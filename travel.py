@@ -0,0 +1,120 @@
+"""
+File: Distant Skies (travel)
+Description: Distances and travel times between every pair of bodies in a system, worked out once.
+
+Bodies are laid out from what generation.py already decides. The planets sit in order outwards from the stars, a unit
+apart up to the frost line (the sum of temp**.5 over the stars, where generation stops making terrestrial planets) and
+GIANT_SPACING units apart beyond it, where the gas giants are. A planet's moons circle it, the first MOON_ORBIT units
+out and each one after it MOON_ORBIT further. A moon reaches another moon of the same planet directly, by moving
+between their orbits, and reaches anything else by way of its planet: down to the planet's orbit, across to the other
+body's planet, and out to the other body.
+
+System.travel() builds the table for a system the first time it is asked for and keeps it until the system's bodies or
+stars change, so looking up a trip is a single index into a flat array.
+"""
+
+from array import array
+import math
+
+
+GIANT_SPACING = 2
+MOON_ORBIT = .25
+
+
+def frost_line(stars):
+    """
+    :param stars: iterable of Star objects
+    :return: float, how many planets out the frost line is
+    """
+
+    return sum(star.temp**.5 for star in stars)
+
+
+def planet_radius(position, frost):
+    """
+    :param position: int, the planet's place outwards from the stars (1 for the innermost planet)
+    :param frost: float, the system's frost line
+    :return: float, the planet's distance from the stars
+    """
+
+    if position <= frost:
+        return float(position)
+    return frost + (position - frost) * GIANT_SPACING
+
+
+class TravelTable:
+    """
+    distances holds the distance from every body to every other body, row by row in BodyRegistry ID order, so the
+    distance from the body with ID a to the body with ID b is distances[a * size + b]. key records the state of the
+    system the table was built from (see System.travel()).
+    """
+
+    def __init__(self, system, key=None):
+        registry = system.registry
+        frost = frost_line(system.stars)
+        # Every body's planet's distance from the stars, its own distance from that planet, and its planet's ID, in
+        # BodyRegistry ID order: the planets, then their moons
+        radii = [planet_radius(position, frost) for position in range(1, len(system.planets) + 1)]
+        heights = [0.] * len(radii)
+        groups = list(map(registry.id_of, system.planets))
+        for position, planet in enumerate(system.planets, 1):
+            radius = planet_radius(position, frost)
+            group = registry.id_of(planet)
+            for index, _ in enumerate(planet.moons, 1):
+                radii.append(radius)
+                heights.append(index * MOON_ORBIT)
+                groups.append(group)
+
+        self.registry = registry
+        self.key = key
+        self.size = len(radii)
+        self.distances = array('d')
+        bodies = list(zip(radii, heights, groups))
+        for radius, height, group in bodies:
+            self.distances.extend([abs(height - other_height) if group == other_group else
+                                   height + abs(radius - other_radius) + other_height
+                                   for other_radius, other_height, other_group in bodies])
+
+    def between(self, origin_id, destination_id):
+        """
+        :param origin_id: int, BodyRegistry ID
+        :param destination_id: int, BodyRegistry ID
+        :return: float, distance between the bodies
+        """
+
+        return self.distances[origin_id * self.size + destination_id]
+
+    def distance(self, origin, destination):
+        """
+        :param origin: Planet or Moon object
+        :param destination: Planet or Moon object
+        :return: float, distance between the bodies
+        """
+
+        id_of = self.registry.id_of
+        return self.distances[id_of(origin) * self.size + id_of(destination)]
+
+    def turns(self, origin, destination, speed=1):
+        """
+        :param origin: Planet or Moon object
+        :param destination: Planet or Moon object
+        :param speed: float, distance covered in one turn
+        :return: int, turns the trip takes (at least 1, unless origin is destination)
+        """
+
+        distance = self.distance(origin, destination)
+        if distance == 0:
+            return 0
+        return max(math.ceil(distance / speed), 1)
+
+    def nearest(self, origin, count=None):
+        """
+        :param origin: Planet or Moon object
+        :param count: int, most bodies to return, or None for all of them
+        :return: list of (distance, Planet or Moon object) for every other body, nearest first
+        """
+
+        start = self.registry.id_of(origin) * self.size
+        row = self.distances[start:start + self.size]
+        found = sorted((distance, body_id) for body_id, distance in enumerate(row) if body_id * self.size != start)
+        return [(distance, self.registry.body(body_id)) for distance, body_id in found[:count]]
@@ -0,0 +1,81 @@
+"""
+File: Distant Skies (visibility)
+Description: Fog of war: which bodies of the system each player can see.
+
+A player sees a body while they have a colony on it, or a fleet at it or docked at one of its colonies. Fleets in flight
+see nothing. Each player's Sight keeps the bodies they see as one int, bit n standing for body ID n (see
+bodies.BodyRegistry), and it is kept up to date as things happen rather than worked out when it is asked for: founding
+a colony or landing a fleet sets its body's bit, and a fleet leaving a body or being destroyed there only rechecks that
+one body (its colonies and the player's fleets_at index). What a player may be shown of another player is then the AND
+of their two Sights, and whether they see a body is the AND of their Sight with the body's bit, so showing it costs the
+same however many players there are.
+"""
+
+
+class Sight:
+    """
+    bodies is the bitset of the bodies of registry one player sees.
+    """
+
+    __slots__ = ('registry', 'bodies')
+
+    def __init__(self, registry, bodies=0):
+        self.registry = registry
+        self.bodies = bodies
+
+    def __contains__(self, body):
+        return bool(self.bodies & self.bit(body))
+
+    def bit(self, body):
+        """
+        :param body: Planet or Moon object of the registry's system
+        :return: int with only the body's bit set
+        """
+
+        return 1 << self.registry.id_of(body)
+
+    def see(self, body):
+        self.bodies |= self.bit(body)
+
+    def recheck(self, player, body):
+        """
+        Sets or clears the bit of a body something of the player's may have just left.
+        :param player: Player object this Sight belongs to
+        :param body: Planet or Moon object
+        """
+
+        fleets_at = player.fleets_at
+        if id(body) in fleets_at or any(colony.owner is player or id(colony) in fleets_at
+                                        for colony in body.colonies.values()):
+            self.see(body)
+        else:
+            self.bodies &= ~self.bit(body)
+
+    def rebuild(self, player):
+        """
+        Works out every bit from scratch, for players that were put together directly (such as by loading a save).
+        Needs the player's fleets_at index to be up to date (see Player.reindex()).
+        """
+
+        self.bodies = 0
+        for body in self.registry.bodies:
+            self.recheck(player, body)
+
+    def shared(self, other):
+        """
+        :param other: Sight of another player of the same game
+        :return: int, the bitset of the bodies both players see
+        """
+
+        return self.bodies & other.bodies
+
+    def each(self, bodies):
+        """
+        :param bodies: int, a bitset of body IDs
+        :return: generator of the Planet and Moon objects whose bits are set, in ID order
+        """
+
+        while bodies:
+            low = bodies & -bodies
+            yield self.registry.body(low.bit_length() - 1)
+            bodies ^= low